@@ -19,8 +19,17 @@ DRIVE and MPPT functions not tested (devices are not yet ready)
 Their error/warning codes are not yet defined (numbers and texts to modify)
 """
 
+import math
+import os
+import re
 import struct
+import platform
+import select
+import threading
+import time
+from array import array
 from PCANlib import *
+from PCANdbc import read_dbc
 
 
 def hex2num(hex_s):
@@ -41,34 +50,638 @@ def i16(ui16):
     """
     return ui16-2*32768 if ui16 > 32767 else ui16
 
-class PcanRW():
+
+def value_of(parameter):
+    """
+    ctypes constants (TPCANHandle, TPCANParameter...) or int to int (ctypes instances do not compare by value)
+    """
+    return parameter.value if hasattr(parameter, 'value') else int(parameter)
+
+
+def field_codes(fmt):
+    """
+    Struct format to one code per field, '>8B' -> ['B', 'B', ...] (pad bytes skipped)
+    """
+    codes = []
+    for count, code in re.findall(r'(\d*)([a-zA-Z])', fmt):
+        if code != 'x':
+            codes += [code] * (int(count) if count else 1)
+    return codes
+
+
+# MPPT converters, 3 messages each from 0x155 (CAN_ID = 0x155 + 3*ID + message number)
+MPPT_FIRST_ID = 0x155
+MPPT_UNITS = 28
+
+# Decoded state of a PcanRW object, (name, initial value) of each device family in the Init order:
+# integers and floats (by the initial value type) are held in two arrays, the MPPT lists of MPPT_UNITS values
+# are views of these arrays, the texts are attributes (see StateLayout)
+LECLANCHE_STATE = (
+    # tpdo_1
+    ('BAT_HEARTBEAT1', 0), ('BAT_SOC', 0.0), ('BAT_ACTIVE_ERR', 0), ('BAT_ACTIVE_WARN', 0),
+    ('BAT_CHARGE_I_LIM', 0.0), ('BAT_DISCHARGE_I_LIM', 0.0),
+    # tpdo_2
+    ('BAT_HEARTBEAT2', 0), ('BAT_SOH', 0.0), ('BAT_STATUS_1', 0), ('BAT_STATUS_2', 0), ('BAT_VOLTAGE', 0.0),
+    ('BAT_CURRENT', 0.0), ('BMS_OK', 0), ('BMS_IDLE', 0), ('BMS_CHARGE', 0), ('BMS_DISCHARGE', 0), ('BAT_FULL', 0),
+    # tpdo_3
+    ('CELL_V_MIN', 0.0), ('CELL_V_MIN_ID', 0), ('CELL_V_MAX', 0.0), ('CELL_V_MAX_ID', 0),
+    # tpdo_4
+    ('BAT_T_MIN', 0.0), ('BAT_T_MEAN', 0.0), ('BAT_T_MAX', 0.0), ('BAT_T_MIN_ID', 0), ('BAT_T_MAX_ID', 0),
+    # tpdo_5
+    ('BAT_STATE_CHARGING', 0), ('BAT_STATE_DISCHARGING', 0), ('BAT_STATE_CONTACTOR_1', 0),
+    ('BAT_STATE_CONTACTOR_2', 0), ('BAT_STATE_CONTACTOR_3', 0), ('BAT_STATE_CONTACTOR_4', 0),
+    ('BAT_STATE_BALANCING', 0), ('GPIO', 0),
+    # tpdo_5 extraits de GPIO
+    ('BAT_IO_1', 0), ('BAT_IO_2', 0), ('BAT_IO_3', 0), ('BAT_IO_4', 0), ('BAT_IO_5', 0),
+    # tpdo_6
+    ('BAT_FLAGS_ERR', 0), ('BAT_FLAGS_WARN', 0),
+    # calculated or analysed:
+    ('BAT_POWER', 0.0),  # VOLTAGE x CURRENT / 1000 --> kW
+    ('BAT_INITIAL_CAPACITY', 19),  # kW.h of a new battery
+    ('BAT_REMAINING_ENERGY', 0.0),  # SOC x SOH x INITIAL_CAPACITY
+    ('BAT_STATUS_TEXT', 'INIT'),
+    ('BAT_STATUS_COLOR', 'RED'),  # GREEN, ORANGE, RED
+    ('BAT_WATCHDOG', 0),  # each periodic necessary message activate bits 0x01 0x02 0x04 0x08 0x10 0x20...
+                          # cleared when stale (CheckWatchdogs), all messages fresh when sum == 0x3F
+    ('BAT_WATCHDOG_FLAG', 1))
+
+# Arrays of 28 values, which index 0-27 is MPPT converter identifier
+MPPT_STATE = (
+    ('MPPT_NOMBRE', 10),  # MPPTs modules connected on CAN bus (max 28, with consecutive identifiers strating at 0)
+    ('MPPT_ID', -1),  # actual processed ID (array index)
+    ('MPPT_ERR', [0] * MPPT_UNITS), ('MPPT_WARN', [0] * MPPT_UNITS),
+    ('MPPT_IN_V', [0.0] * MPPT_UNITS), ('MPPT_IN_A', [0.0] * MPPT_UNITS), ('MPPT_IN_W', [0.0] * MPPT_UNITS),
+    ('MPPT_T1', [0.0] * MPPT_UNITS),
+    ('MPPT_V', [0.0] * MPPT_UNITS), ('MPPT_A', [0.0] * MPPT_UNITS), ('MPPT_W', [0.0] * MPPT_UNITS),
+    ('MPPT_T2', [0.0] * MPPT_UNITS),
+    # calculated or analysed:
+    ('MPPT_STATUS_TEXT', 'INIT'),
+    ('MPPT_STATUS_COLOR', 'RED'),  # GREEN, ORANGE, RED
+    ('MPPT_WATCHDOG', [0] * MPPT_UNITS),  # fresh messages of each MPPT module: all fresh is 0x07
+    ('MPPT_WATCHDOG_FLAG', 1))
+
+DRIVE_STATE = (
+    ('DRIVE_ERR', 0), ('DRIVE_WARN', 0),
+    ('DRIVE_MOTOR_MECA_POWER', 0.0), ('DRIVE_ELEC_POWER', 0.0),
+    ('DRIVE_MOTOR_CURRENT_U', 0.0), ('DRIVE_MOTOR_CURRENT_V', 0.0), ('DRIVE_MOTOR_CURRENT_W', 0.0),
+    ('DRIVE_DC_BUS_V', 0.0),
+    ('DRIVE_MOTOR_TORQUE', 0.0), ('DRIVE_MOTOR_SPEED', 0.0),  # rpm
+    ('DRIVE_MOTOR_POSITION', 0.0), ('DRIVE_POWER_ORDER', 0.0),  # %
+    ('DRIVE_RESERVED1', 0), ('DRIVE_POWER_LEVER', 0.0),  # %
+    ('DRIVE_HOURS', 0.0), ('DRIVE_PCB_TEMP', 0.0), ('DRIVE_MOTOR_TEMP', 0.0),  # °C
+    ('DRIVE_SIC_U_TEMP', 0.0), ('DRIVE_SIC_V_TEMP', 0.0), ('DRIVE_SIC_W_TEMP', 0.0), ('DRIVE_RESERVED2', 0),
+    # states 0x00/0xFF
+    ('DRIVE_INPUT_0', 0), ('DRIVE_INPUT_1', 0), ('DRIVE_INPUT_2', 0), ('DRIVE_INPUT_3', 0),
+    ('DRIVE_OUTPUT_0', 0), ('DRIVE_OUTPUT_1', 0), ('DRIVE_OUTPUT_2', 0), ('DRIVE_OUTPUT_3', 0),
+    # 4-20mA
+    ('DRIVE_ANALOG_INPUT_1', 0.0), ('DRIVE_ANALOG_INPUT_2', 0.0),
+    # calculated or analysed:
+    ('DRIVE_STATUS_TEXT', 'INIT'),
+    ('DRIVE_STATUS_COLOR', 'RED'),  # GREEN, ORANGE, RED
+    ('DRIVE_WATCHDOG', 0),  # fresh messages: all fresh is 0x1FF
+    ('DRIVE_WATCHDOG_FLAG', 1))
+
+
+class StateLayout():
+    """
+    Layout of the decoded state of a PcanRW object: integer and float values in two arrays (initial values in
+    Integers and Floats), each device family contiguous in both, so that a reset is an in place copy of its
+    initial values and a snapshot a copy of the two arrays
+    families = {family name: ((name, initial value), ...)}, an initial list is a view of len(list) values
+    """
+    def __init__(self, families):
+        self.Integers = array('q')
+        self.Floats = array('d')
+        self.Slots = {}  # name -> (array name 'Integers' or 'Floats', index, view length or None)
+        self.Texts = {}  # name -> initial text
+        self.Families = {}  # family name -> (integers slice, floats slice, texts names)
+        for family, values in families.items():
+            first_integer = len(self.Integers)
+            first_float = len(self.Floats)
+            texts = []
+            for name, value in values:
+                if isinstance(value, str):
+                    self.Texts[name] = value
+                    texts.append(name)
+                    continue
+                items = value if isinstance(value, list) else [value]
+                array_name = 'Floats' if isinstance(items[0], float) else 'Integers'
+                target = getattr(self, array_name)
+                self.Slots[name] = (array_name, len(target), len(items) if isinstance(value, list) else None)
+                target.extend(items)
+            self.Families[family] = (slice(first_integer, len(self.Integers)), slice(first_float, len(self.Floats)),
+                                     tuple(texts))
+
+    def IsInteger(self, name):
+        return name in self.Slots and self.Slots[name][0] == 'Integers'
+
+    def Expression(self, signal):
+        """
+        Python expression of a value of the PcanRW object rw in the generated functions: array item of the state
+        values ('BAT_SOC' -> 'rw.Floats[1]', 'MPPT_W[3]' -> 'rw.Floats[...]'), attribute otherwise
+        """
+        name, bracket, unit = signal.partition('[')
+        slot = self.Slots.get(name)
+        if slot is None:
+            return 'rw.' + signal
+        array_name, index, length = slot
+        if (length is None) != (not bracket):
+            raise ValueError(signal + " doesn't match the state value " + name)
+        return 'rw.' + array_name + '[' + str(index + (int(unit[:-1]) if bracket else 0)) + ']'
+
+    def Initial(self, signal):
+        """
+        Initial value of a state value ('BAT_SOC', 'MPPT_W[3]'), None for the other names
+        """
+        name, bracket, unit = signal.partition('[')
+        if name not in self.Slots:
+            return None
+        array_name, index, length = self.Slots[name]
+        return getattr(self, array_name)[index + (int(unit[:-1]) if bracket else 0)]
+
+    def Reset(self, values, family):
+        """
+        Initial values of a family in place, in the arrays (and views) of a PcanValues object
+        """
+        integers, floats, texts = self.Families[family]
+        values.Integers[integers] = self.Integers[integers]
+        values.Floats[floats] = self.Floats[floats]
+        for name in texts:
+            setattr(values, name, self.Texts[name])
+
+    def Properties(self):
+        """
+        Generate the properties of the scalar state values (BAT_SOC...), items of the arrays
+        """
+        lines = []
+        for name, (array_name, index, length) in self.Slots.items():
+            if length is None:
+                lines += ['def get_' + name + '(self):',
+                          '    return self.' + array_name + '[' + str(index) + ']',
+                          'def set_' + name + '(self, value):',
+                          '    self.' + array_name + '[' + str(index) + '] = value']
+        namespace = {}
+        exec('\n'.join(lines), namespace)
+        return {name: property(namespace['get_' + name], namespace['set_' + name])
+                for name, (array_name, index, length) in self.Slots.items() if length is None}
+
+
+STATE = StateLayout({'LECLANCHE': LECLANCHE_STATE, 'MPPT': MPPT_STATE, 'DRIVE': DRIVE_STATE})
+
+
+class PcanValues():
+    """
+    Decoded values of a PcanRW object or of a snapshot, same attribute names (BAT_SOC, MPPT_W[i]...):
+    properties of the state arrays, MPPT lists as memoryviews of them (STATE)
+    """
+    def BindState(self, integers, floats):
+        """
+        Use integers and floats arrays (STATE layout) as the state values
+        """
+        self.Integers = integers
+        self.Floats = floats
+        for name, (array_name, index, length) in STATE.Slots.items():
+            if length is not None:
+                setattr(self, name, memoryview(integers if array_name == 'Integers' else floats)[index:index + length])
+
+    def NewState(self):
+        """
+        State arrays of initial values (then set by the Init functions)
+        """
+        self.BindState(array('q', STATE.Integers), array('d', STATE.Floats))
+        for name, text in STATE.Texts.items():
+            setattr(self, name, text)
+
+
+for _name, _property in STATE.Properties().items():
+    setattr(PcanValues, _name, _property)
+
+
+# Status evaluation bits of PcanRW.StatusDirty: set when an input of LeclancheStatus, MpptStatus or DriveStatus
+# changes, UpdateStatus evaluates again only the statuses of these bits
+LECLANCHE_DIRTY = 0x1
+MPPT_DIRTY = 0x2
+DRIVE_DIRTY = 0x4
+WATCHDOG_DIRTY = {'BAT_WATCHDOG': LECLANCHE_DIRTY, 'MPPT_WATCHDOG': MPPT_DIRTY, 'DRIVE_WATCHDOG': DRIVE_DIRTY}
+# decoded inputs of the statuses (BMS_OK, BMS_IDLE... calculated from BAT_STATUS_1 and 2), compared by the decoders
+STATUS_INPUTS = {
+    'BAT_ACTIVE_ERR': LECLANCHE_DIRTY, 'BAT_ACTIVE_WARN': LECLANCHE_DIRTY, 'BAT_SOH': LECLANCHE_DIRTY,
+    'BAT_STATUS_1': LECLANCHE_DIRTY, 'BAT_STATUS_2': LECLANCHE_DIRTY, 'BAT_STATE_CHARGING': LECLANCHE_DIRTY,
+    'BAT_STATE_DISCHARGING': LECLANCHE_DIRTY, 'BAT_STATE_BALANCING': LECLANCHE_DIRTY,
+    'MPPT_ERR': MPPT_DIRTY, 'MPPT_WARN': MPPT_DIRTY,
+    'DRIVE_ERR': DRIVE_DIRTY, 'DRIVE_WARN': DRIVE_DIRTY}
+
+
+class FrameLayout():
+    """
+    Precompiled decoding of one CAN ID: a single struct unpack of the 8 data bytes (big endian, signedness and
+    float/int given by the format), then each value is scaled and stored in its PcanRW state array item
+    (STATE, attribute for the other names) by a generated function (see compile)
+
+    fields   = ((attribute name, divisor), ...) in unpack order, a divisor of 1 keeps the raw integer
+    watchdog = watchdog attribute name and bit activated by this message
+    unit     = MPPT converter index (the attributes are then 28 values lists), None for scalar attributes
+    post     = PcanRW method name called after the fields update (calculated values), or None
+    offsets  = value added to each scaled field (DBC signal offsets, PCANdbc), None for none
+    period   = expected period (ms) of the message, None for the EXPECTED_PERIODS of its watchdog
+    """
+    def __init__(self, fmt, fields, watchdog, watchdog_bit, unit=None, post=None, offsets=None, period=None):
+        self.struct = struct.Struct(fmt)
+        self.fields = tuple(fields)
+        self.offsets = (0,) * len(self.fields) if offsets is None else tuple(offsets)
+        self.watchdog = watchdog
+        self.watchdog_bit = watchdog_bit
+        self.unit = unit
+        self.post = post
+        self.period = period
+        self.slot = None  # index of the message in the FrameDeadlines arrays (DEADLINES)
+        self.decode = self.compile()
+        self.reset = self.compile_reset()
+
+    def compile(self):
+        """
+        Generate the decoding function decode(pcan_rw, datas) of this layout:
+        straight assignments after the unpack, no loop left for each received message, one test only when
+        the message carries status inputs (STATUS_INPUTS changed: StatusDirty bits)
+        """
+        index = '' if self.unit is None else '[' + str(self.unit) + ']'
+        values = ['v' + str(i) for i in range(len(self.fields))]
+        lines = ['def decode(rw, datas):',
+                 '    ' + ', '.join(values) + ', = unpack_from(datas)']
+        if self.unit is not None:
+            lines.append('    ' + STATE.Expression('MPPT_ID') + ' = ' + str(self.unit))  # actual processed ID
+        codes = field_codes(self.struct.format)
+        assignments = []
+        changes = []
+        dirty = 0
+        for (name, divisor), offset, code, value in zip(self.fields, self.offsets, codes, values):
+            if STATE.IsInteger(name) and (divisor != 1 or offset or code in 'efd'):
+                raise ValueError(name + " is an integer state value, not decoded as an integer")
+            scaled = value if divisor == 1 else value + ' / ' + str(divisor)
+            if offset:
+                scaled += ' + ' + str(offset)
+            assignments.append('    ' + STATE.Expression(name + index) + ' = ' + scaled)
+            if name in STATUS_INPUTS:
+                changes.append(scaled + ' != ' + STATE.Expression(name + index))
+                dirty |= STATUS_INPUTS[name]
+        if changes:
+            lines += ['    if ' + ' or '.join(changes) + ':',
+                      '        rw.StatusDirty |= ' + hex(dirty)]
+        lines += assignments
+        lines.append('    ' + STATE.Expression(self.watchdog + index) + ' |= ' + hex(self.watchdog_bit))
+        if self.post is not None:
+            lines.append('    rw.' + self.post + '()')
+
+        namespace = {'unpack_from': self.struct.unpack_from}
+        exec('\n'.join(lines), namespace)
+        return namespace['decode']
+
+    def compile_reset(self):
+        """
+        Generate the function reset(pcan_rw) setting the fields of this layout back to their initial values
+        (stale message), then the calculated values of the post method
+        """
+        index = '' if self.unit is None else '[' + str(self.unit) + ']'
+        lines = ['def reset(rw):',
+                 '    rw.StatusDirty |= ' + hex(WATCHDOG_DIRTY.get(self.watchdog, 0))]
+        for name, divisor in self.fields:
+            initial = STATE.Initial(name + index)
+            if initial is not None:
+                lines.append('    ' + STATE.Expression(name + index) + ' = ' + repr(initial))
+        lines.append('    ' + STATE.Expression(self.watchdog + index) + ' &= ' + hex(~self.watchdog_bit))
+        if self.post is not None:
+            lines.append('    rw.' + self.post + '()')
+
+        namespace = {}
+        exec('\n'.join(lines), namespace)
+        return namespace['reset']
+
+
+# Leclanché battery module, tpdo_1...tpdo_6
+LECLANCHE_LAYOUTS = {
+    0x100: FrameLayout('>BBBBHH', (('BAT_HEARTBEAT1', 1), ('BAT_SOC', 2), ('BAT_ACTIVE_ERR', 1),  # SOC %
+                                   ('BAT_ACTIVE_WARN', 1), ('BAT_CHARGE_I_LIM', 10),  # A
+                                   ('BAT_DISCHARGE_I_LIM', 10)),  # A
+                       'BAT_WATCHDOG', 0x01, post='LeclancheTpdo1'),
+    0x101: FrameLayout('>BBBBHh', (('BAT_HEARTBEAT2', 1), ('BAT_SOH', 2), ('BAT_STATUS_1', 1),  # SOH %
+                                   ('BAT_STATUS_2', 1), ('BAT_VOLTAGE', 10), ('BAT_CURRENT', 10)),  # V, A
+                       'BAT_WATCHDOG', 0x02, post='LeclancheTpdo2'),
+    0x102: FrameLayout('>HHHH', (('CELL_V_MIN', 1000), ('CELL_V_MIN_ID', 1),  # V
+                                 ('CELL_V_MAX', 1000), ('CELL_V_MAX_ID', 1)),  # V
+                       'BAT_WATCHDOG', 0x04),
+    0x103: FrameLayout('>hhhBB', (('BAT_T_MIN', 10), ('BAT_T_MEAN', 10), ('BAT_T_MAX', 10),  # °C
+                                  ('BAT_T_MIN_ID', 1), ('BAT_T_MAX_ID', 1)),
+                       'BAT_WATCHDOG', 0x08),
+    0x104: FrameLayout('>8B', (('BAT_STATE_CHARGING', 1), ('BAT_STATE_DISCHARGING', 1),
+                               ('BAT_STATE_CONTACTOR_1', 1), ('BAT_STATE_CONTACTOR_2', 1),
+                               ('BAT_STATE_CONTACTOR_3', 1), ('BAT_STATE_CONTACTOR_4', 1),
+                               ('BAT_STATE_BALANCING', 1), ('GPIO', 1)),
+                       'BAT_WATCHDOG', 0x10, post='LeclancheTpdo5'),
+    # Errors/Warning share same codes: 1...17, 19, 20, 25, 31, active bit position -> code number
+    0x105: FrameLayout('>II', (('BAT_FLAGS_ERR', 1), ('BAT_FLAGS_WARN', 1)),
+                       'BAT_WATCHDOG', 0x20),
+}
+
+# Leclanché service messages, only reported
+LECLANCHE_SDO_NAMES = {0x110: 'rsdo_1', 0x111: 'rsdo_2', 0x112: 'rsdo_3',
+                       0x200: 'rpdo_1', 0x210: 'psdo_1', 0x211: 'psdo_2', 0x212: 'psdo_3'}
+
+# MPPT converters, 3 messages each from MPPT_FIRST_ID (CAN_ID = 0x155 + 3*ID + message number)
+MPPT_LAYOUTS = {}
+for _unit in range(MPPT_UNITS):
+    MPPT_LAYOUTS[MPPT_FIRST_ID + 3*_unit] = FrameLayout(
+        '>II', (('MPPT_ERR', 1), ('MPPT_WARN', 1)), 'MPPT_WATCHDOG', 0x01, unit=_unit)
+    MPPT_LAYOUTS[MPPT_FIRST_ID + 3*_unit + 1] = FrameLayout(
+        '>HHHh', (('MPPT_IN_V', 100), ('MPPT_IN_A', 1000), ('MPPT_IN_W', 100), ('MPPT_T1', 100)),  # V, A, W, °C
+        'MPPT_WATCHDOG', 0x02, unit=_unit)
+    MPPT_LAYOUTS[MPPT_FIRST_ID + 3*_unit + 2] = FrameLayout(
+        '>HHHh', (('MPPT_V', 100), ('MPPT_A', 1000), ('MPPT_W', 100), ('MPPT_T2', 100)),  # V, A, W, °C
+        'MPPT_WATCHDOG', 0x04, unit=_unit)
+
+# Motor drive
+DRIVE_LAYOUTS = {
+    0x1AA: FrameLayout('>II', (('DRIVE_ERR', 1), ('DRIVE_WARN', 1)), 'DRIVE_WATCHDOG', 0x01),
+    0x1AB: FrameLayout('>ff', (('DRIVE_MOTOR_MECA_POWER', 1), ('DRIVE_ELEC_POWER', 1)),  # W
+                       'DRIVE_WATCHDOG', 0x02),
+    0x1AC: FrameLayout('>hhhH', (('DRIVE_MOTOR_CURRENT_U', 100), ('DRIVE_MOTOR_CURRENT_V', 100),  # Arms
+                                 ('DRIVE_MOTOR_CURRENT_W', 100), ('DRIVE_DC_BUS_V', 100)),  # Vdc
+                       'DRIVE_WATCHDOG', 0x04),
+    0x1AD: FrameLayout('>ff', (('DRIVE_MOTOR_TORQUE', 1), ('DRIVE_MOTOR_SPEED', 1)),  # N.m, rpm
+                       'DRIVE_WATCHDOG', 0x08),
+    0x1AE: FrameLayout('>HHHH', (('DRIVE_MOTOR_POSITION', 100), ('DRIVE_POWER_ORDER', 100),  # °, %
+                                 ('DRIVE_RESERVED1', 1), ('DRIVE_POWER_LEVER', 100)),  # %
+                       'DRIVE_WATCHDOG', 0x10),
+    0x1AF: FrameLayout('>fhh', (('DRIVE_HOURS', 1), ('DRIVE_PCB_TEMP', 100), ('DRIVE_MOTOR_TEMP', 100)),  # °C
+                       'DRIVE_WATCHDOG', 0x20),
+    0x1B0: FrameLayout('>hhhH', (('DRIVE_SIC_U_TEMP', 100), ('DRIVE_SIC_V_TEMP', 100),  # °C
+                                 ('DRIVE_SIC_W_TEMP', 100), ('DRIVE_RESERVED2', 1)),
+                       'DRIVE_WATCHDOG', 0x40),
+    0x1B1: FrameLayout('>8B', (('DRIVE_INPUT_0', 1), ('DRIVE_INPUT_1', 1),  # states 0x00/0xFF
+                               ('DRIVE_INPUT_2', 1), ('DRIVE_INPUT_3', 1),
+                               ('DRIVE_OUTPUT_0', 1), ('DRIVE_OUTPUT_1', 1),
+                               ('DRIVE_OUTPUT_2', 1), ('DRIVE_OUTPUT_3', 1)),
+                       'DRIVE_WATCHDOG', 0x80),
+    0x1B2: FrameLayout('>ff', (('DRIVE_ANALOG_INPUT_1', 1), ('DRIVE_ANALOG_INPUT_2', 1)),  # 4-20mA
+                       'DRIVE_WATCHDOG', 0x100),
+}
+
+
+def dbc_layouts(path):
+    """
+    Leclanché, MPPT and drive layouts of the messages of a DBC file (PCANdbc), in place of the tables above
+    (family given by the message watchdog, expected period by its GenMsgCycleTime attribute)
+    """
+    families = {'BAT_WATCHDOG': {}, 'MPPT_WATCHDOG': {}, 'DRIVE_WATCHDOG': {}}
+    for message in read_dbc(path):
+        fmt, fields, watchdog, watchdog_bit, unit, post, offsets = message.LayoutArguments()
+        if watchdog not in families:
+            raise ValueError("message " + message.Name + ": unknown watchdog " + watchdog)
+        if unit is not None and not 0 <= unit < MPPT_UNITS:
+            raise ValueError("message " + message.Name + ": MPPT unit " + str(unit) + " out of range")
+        families[watchdog][message.CanId] = FrameLayout(fmt, fields, watchdog, watchdog_bit, unit, post, offsets,
+                                                        message.Attributes.get('GenMsgCycleTime') or None)
+    return families['BAT_WATCHDOG'], families['MPPT_WATCHDOG'], families['DRIVE_WATCHDOG']
+
+
+# signal definitions of a DBC file (spet.dbc...), a data change for new CAN IDs, firmwares or scales
+if os.environ.get("SPET_DBC"):
+    LECLANCHE_LAYOUTS, MPPT_LAYOUTS, DRIVE_LAYOUTS = dbc_layouts(os.environ["SPET_DBC"])
+
+# CAN ID -> layout, one dictionary lookup per received message
+FRAME_LAYOUTS = {}
+FRAME_LAYOUTS.update(LECLANCHE_LAYOUTS)
+FRAME_LAYOUTS.update(MPPT_LAYOUTS)
+FRAME_LAYOUTS.update(DRIVE_LAYOUTS)
+
+
+def id_ranges(can_ids):
+    """
+    CAN IDs to the (first, last) ranges of consecutive IDs, in increasing order
+    """
+    ranges = []
+    for can_id in sorted(can_ids):
+        if ranges and can_id == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], can_id)
+        else:
+            ranges.append((can_id, can_id))
+    return ranges
+
+
+# Driver acceptance filter: only the decoded and reported messages, the other ones of a shared bus are dropped
+# by the driver and don't cross the library boundary
+ACCEPTED_RANGES = id_ranges(set(FRAME_LAYOUTS) | set(LECLANCHE_SDO_NAMES))
+
+# Expected period (ms) of the messages of each watchdog, when their layout doesn't give one
+EXPECTED_PERIODS = {'BAT_WATCHDOG': 100, 'MPPT_WATCHDOG': 200, 'DRIVE_WATCHDOG': 50}
+TIMEOUT_PERIODS = 5  # default timeout of a message, in expected periods
+
+
+class FrameDeadlines():
+    """
+    Expected period and timeout of each decoded CAN ID, in arrays indexed by the slot of its layout:
+    a PcanRW object keeps the hardware timestamp of the last reception of each message in a LastSeen array
+    of the same slots, the freshness of a message is then one subtraction, and a periodic check one pass
+    over the slots (see PcanRW.CheckWatchdogs)
+    layouts = {CAN ID: FrameLayout}, their slot is set here
+    timeout = ms without reception before a message is stale (all of them), None for TIMEOUT_PERIODS periods
+    """
+    def __init__(self, layouts, timeout=None):
+        self.CanIds = sorted(layouts)
+        self.Layouts = [layouts[can_id] for can_id in self.CanIds]
+        self.Periods = array('d', [(EXPECTED_PERIODS[layout.watchdog] if layout.period is None else layout.period)
+                                   / 1000 for layout in self.Layouts])  # s
+        self.Timeouts = array('d', [period * TIMEOUT_PERIODS for period in self.Periods])  # s
+        self.Never = array('d', [-math.inf] * len(self.CanIds))  # LastSeen of a new channel
+        for slot, layout in enumerate(self.Layouts):
+            layout.slot = slot
+        if timeout is not None:
+            self.SetTimeout(timeout)
+
+    def SetTimeout(self, timeout, can_ids=None):
+        """
+        Timeout (ms) of the given CAN IDs, all the decoded ones if None
+        """
+        for can_id in self.CanIds if can_ids is None else can_ids:
+            self.Timeouts[FRAME_LAYOUTS[can_id].slot] = timeout / 1000
+
+    def Timeout(self, can_id):
+        """
+        Timeout (ms) of a CAN ID
+        """
+        return self.Timeouts[FRAME_LAYOUTS[can_id].slot] * 1000
+
+
+# Staleness of the decoded messages, the SPET_STALE_MS environment variable gives the timeout of all of them
+DEADLINES = FrameDeadlines(FRAME_LAYOUTS, float(os.environ["SPET_STALE_MS"]) if os.environ.get("SPET_STALE_MS")
+                           else None)
+
+# Receive queue of the driver and bus load estimate
+QUEUE_SIZE = 32768  # messages of the PCAN-Basic receive queue, lost beyond (PCAN_ERROR_QOVERRUN)
+FRAME_BITS = 125  # standard frame of 8 data bytes: 111 bits, plus about half the worst case stuffing bits
+BITRATES = {PCAN_BAUD_1M.value: 1000000, PCAN_BAUD_800K.value: 800000, PCAN_BAUD_500K.value: 500000,
+            PCAN_BAUD_250K.value: 250000, PCAN_BAUD_125K.value: 125000, PCAN_BAUD_100K.value: 100000,
+            PCAN_BAUD_50K.value: 50000, PCAN_BAUD_20K.value: 20000, PCAN_BAUD_10K.value: 10000}  # bit/s
+POLL_BOUNDS = (2, 100)  # ms, default bounds of the interval between two reads of a polled receive queue
+
+
+class PollSchedule():
+    """
+    Adaptive interval between two drains of a receive queue, from the frames read by each drain:
+    the interval expected to bring Target frames, within [minimum, maximum] s. Shorter at once when the rate rises
+    (drive current bursts) or after an overrun, longer by at most a factor 2 per drain when the bus calms down.
+    The smoothed rate (time constant Smoothing s) gives the bus load estimate, Peak the closest approach to the
+    QUEUE_SIZE limit.
+    """
+    def __init__(self, minimum, maximum, target=256, smoothing=1.0):
+        self.Minimum = minimum
+        self.Maximum = maximum
+        self.Target = target  # frames
+        self.Smoothing = smoothing  # s
+        self.Interval = maximum  # s
+        self.Rate = 0.0  # frames/s, smoothed
+        self.LastDrain = None  # time.monotonic() of the last drain
+        self.Drains = 0
+        self.Frames = 0
+        self.Peak = 0  # max frames of a drain
+        self.Overruns = 0  # drains after which messages were lost
+
+    def Drained(self, frames, now, overrun=False):
+        """
+        Record a drain of frames at now (s, time.monotonic()), returns the interval until the next one
+        """
+        self.Drains += 1
+        self.Frames += frames
+        if frames > self.Peak:
+            self.Peak = frames
+        if overrun:
+            self.Overruns += 1
+        if self.LastDrain is None or now <= self.LastDrain:
+            self.LastDrain = now
+            if overrun:  # no rate yet, the queue read too late all the same
+                self.Interval = self.Minimum
+            return self.Interval
+        elapsed = now - self.LastDrain
+        self.LastDrain = now
+        rate = frames / elapsed
+        self.Rate += (1 - math.exp(-elapsed / self.Smoothing)) * (rate - self.Rate)
+        if overrun:
+            interval = self.Minimum
+        else:
+            busiest = max(rate, self.Rate)
+            interval = self.Target / busiest if busiest > 0 else self.Maximum
+            interval = min(interval, self.Interval * 2)
+        self.Interval = min(max(interval, self.Minimum), self.Maximum)
+        return self.Interval
+
+    def BusLoad(self, bitrate):
+        """
+        Bus load estimate (0 to 1) at bitrate (bit/s), from the read frames (not the ones dropped by the filter)
+        """
+        return self.Rate * FRAME_BITS / bitrate
+
+    def PeakFill(self):
+        """
+        Max fill (0 to 1) of the receive queue seen at a drain
+        """
+        return self.Peak / QUEUE_SIZE
+
+# Status texts lookup tables
+# Leclanché error/warning codes (active error or warning number)
+LECLANCHE_CODE_TEXTS = {
+    0: '', 1: 'Cell voltage below limit', 2: 'Cell voltage above limit', 3: 'Discharge current above limit',
+    4: 'Charge current above limit', 5: 'Module temperature below limit', 6: 'Module temperature above limit',
+    7: 'Cell Voltage Difference', 8: 'Module Temperature Difference',
+    9: 'Cell Voltage Sum / Stack Voltage Difference', 10: 'Sensor Fault', 11: 'Precharge timeout',
+    12: 'Contactor Fault', 13: 'Isolation Fault', 15: 'Watchdog Reset Activated', 16: 'Emergency Stop Active',
+    17: 'BMU Communication Timeout', 19: 'FW Initialization Error',
+    20: 'Input alarm activated (Requires GPIO Configuration)', 25: 'CAN Host Timeout', 31: 'Software Error',
+    32: 'CAN SOFTWARE WATCHDOG'}
+LECLANCHE_UNKNOWN_CODE = 'Unknow Error/Warning code'
+
+# Leclanché information text of the BMS_OK, BMS_IDLE, BAT_FULL, BAT_STATE_CHARGING, BAT_STATE_DISCHARGING and
+# BAT_STATE_BALANCING states (bits 0 to 5 of the index, bit set when the state is > 0)
+LECLANCHE_INFO_PARTS = ('BMS OK', ', BMS IDLE', ', BAT FULL', ', CHARGING', ', DISCHARGING', ', BALANCING')
+LECLANCHE_INFO_TEXTS = tuple(''.join(part for bit, part in enumerate(LECLANCHE_INFO_PARTS) if index >> bit & 1)
+                             for index in range(1 << len(LECLANCHE_INFO_PARTS)))
+
+# MPPT and drive error/warning bits: text of the highest set bit among bits 0-8 and 31, indexed by the bit length
+# of the masked code (0 = none of these bits set)
+CODE_BITS_MASK = 0x800001FF
+
+
+def code_bits_texts(prefix, unknown, bit_31):
+    texts = [unknown] + [prefix + ' ' + str(bit) for bit in range(1, 33)]
+    texts[32] = bit_31
+    return tuple(texts)
+
+
+ERROR_BITS_TEXTS = code_bits_texts('error', 'Unknow Error code', 'CAN SOFTWARE WATCHDOG')
+WARNING_BITS_TEXTS = code_bits_texts('warning', 'Unknow Warning code', 'warning 32')
+
+class PcanSnapshot(PcanValues):
+    """
+    Decoded values of a PcanRW object at a given instant, same attribute names (BAT_SOC, MPPT_W[i]...)
+    integers, floats = copies of the state arrays, texts = {name: status text or color}
+    """
+    def __init__(self, integers, floats, texts):
+        self.BindState(integers, floats)
+        self.__dict__.update(texts)
+
+
+class PcanRW(PcanValues):
     """
     Object with PCAN identifier as a parameter -> device_id in __init__
     Here are PeakCAN USB functions, and SPET project variables and decoding functions
     """
     PcanHandle = PCAN_NONEBUS  # PCAN_USBBUS1, PCAN_USBBUS2, PCAN_NONEBUS
     Bitrate = PCAN_BAUD_250K
+    AcceptedRanges = ACCEPTED_RANGES  # (first, last) CAN IDs set in the driver filter, None = all the messages
     PcanId = 0
 
     m_DLLFound = False
 
+    StatusDirty = LECLANCHE_DIRTY | MPPT_DIRTY | DRIVE_DIRTY  # statuses to evaluate again (UpdateStatus)
+
     # Last read values with ProcessMessageCan function
     ReceivedTimestamp = 0  # seconds
     ReceivedId = 0
     ReceivedDatas = bytearray(8)
 
-    def __init__(self, device_id):
+    def __init__(self, device_id, pcan_basic=None, discovery=None):
         """
         Called at object creation
+        pcan_basic = PCAN-Basic API object shared by the modules, default PCANBasic() (PCANsim.PCANBasicSim without hardware)
+        discovery = PCANdiscovery.PcanDiscovery shared by the modules, channel of the device ID from its map,
+                    default PCAN_USBBUS1 then PCAN_USBBUS2 tried
         """
         self.PcanId = device_id
+        self.Discovery = discovery
+        self.ReceivedDatas = bytearray(8)
+        self.Lock = threading.Lock()  # decoded values are consistent while held (reader thread vs user interface)
+        self.Reader = None
+        self.ReaderRunning = False
+        self.Poll = PollSchedule(POLL_BOUNDS[0] / 1000, POLL_BOUNDS[1] / 1000)  # drains of the receive queue
+        self.Overruns = 0  # PCAN_ERROR_QOVERRUN statuses read: messages lost, the queue read too late
+        self.ReceiveEvent = None
+        self.ReceiveEventHandle = None  # PcanHandle value the receive event belongs to
+        self.Recorder = None  # PCANrecorder.PcanRecorder, records each processed frame when set
+        self.History = None  # PCANhistory.PcanHistory, keeps the decoded values of each frame when set
+        self.Rollups = None  # PCANrollup.PcanRollups, min/max/mean per time bucket of the decoded values when set
+        self.Alarms = None  # PCANalarms.PcanAlarms, journals the edges of the flag words when set
+        self.Metrics = None  # PCANmetrics.ModuleMetrics, counts the frames, decode times and statuses when set
+        self.FilterRanges = []  # ranges set in the driver filter of the current channel, [] = all the messages
+        self.IgnoredFrames = 0  # received messages neither decoded nor SDO (filter open, or not yet set)
+        self.SdoFrames = 0  # received Leclanché SDO messages (LECLANCHE_SDO_NAMES), not decoded
+        self.LastSeen = array('d', DEADLINES.Never)  # hardware timestamp (s) of the last reception, DEADLINES slots
+        self.ClockOffset = 0.0  # hardware timestamp - time.monotonic() at the last received message
+        self.NewState()
         self.LeclancheInit()
         self.MpptInit()
         self.DriveInit()
 
         ## Checks if PCANBasic.dll is available, if not, the terminates without PCAN hardware inits
         try:
-            self.m_objPCANBasic = PCANBasic()
+            self.m_objPCANBasic = PCANBasic() if pcan_basic is None else pcan_basic
             self.m_DLLFound = True
         except:
             print("Unable to find the library: PCANBasic.dll !")
@@ -78,6 +691,7 @@ class PcanRW():
         self.TryToSetDevice()  ## only if PCAN library found
 
     def __del__(self):
+        self.StopReader()
         if self.m_DLLFound:
             self.m_objPCANBasic.Uninitialize(self.PcanHandle)
 
@@ -85,6 +699,9 @@ class PcanRW():
         """
         Try to initialize a device on increasing "PCAN_USBBUS" number (depend on device plugging order)
         """
+        if self.Discovery is not None:
+            self.TryToSetDiscoveredDevice()
+            return
         status = self.SetDevice(PCAN_USBBUS1)
         if status == 0:
             print("PCAN_USBBUS1 OK for device ID " + str(hex(self.PcanId)))
@@ -96,12 +713,39 @@ class PcanRW():
                 status = self.SetDevice(PCAN_NONEBUS)
                 print("PCAN_NONEBUS for device ID " + str(hex(self.PcanId)))
 
+    def TryToSetDiscoveredDevice(self):
+        """
+        Initialize the channel of the device ID from the discovery map, discovered again if it doesn't match
+        (device re-plugged...)
+        """
+        handle = self.Discovery.Find(self.PcanId)
+        for refresh in (False, True):
+            if refresh:
+                previous = handle
+                handle = self.Discovery.Find(self.PcanId, refresh=True)
+                if handle == previous:
+                    break
+            if handle == PCAN_NONEBUS.value:
+                continue
+            status = self.SetDevice(TPCANHandle(handle))
+            if status == 0:
+                print("PCAN channel " + hex(handle) + " OK for device ID " + str(hex(self.PcanId)))
+                return
+            if status == 2:  # initialized, another device
+                self.UnsetDevice()
+        self.SetDevice(PCAN_NONEBUS)
+        print("PCAN_NONEBUS for device ID " + str(hex(self.PcanId)))
+
     def SetDevice(self, bus):  # bus = PCAN_USBBUS1 (0x51 ou 81), PCAN_USBBUS2 (0x52 ou 82), PCAN_NONEBUS (0)
         """
         Initialize a device on a given "PCAN_USBBUS" number and check ID if successfull
         return 4 status
         """
+        self.ReleaseReceiveEvent()  # the driver drops the receive event of the channel at each initialisation
         self.PcanHandle = bus
+        self.FilterRanges = []
+        self.LastSeen[:] = DEADLINES.Never  # timestamps of another channel (or device restarted) not comparable
+        self.ClockOffset = -time.monotonic()  # s since the initialisation until the first message
         try:
             stsResult = self.m_objPCANBasic.Initialize(self.PcanHandle, self.Bitrate)
         except:
@@ -110,6 +754,7 @@ class PcanRW():
         if stsResult == PCAN_ERROR_OK:  # PCAN_ERROR_OK défini à 0...
             if self.GetDeviceId() == self.PcanId:
                 print("device ID " + str(hex(self.PcanId)) + " match on bus " + str(self.PcanHandle))
+                self.SetFilter()
                 return 0
             else:
                 print("no match for device ID " + str(hex(self.PcanId)) + " on bus " + str(self.PcanHandle))
@@ -118,10 +763,55 @@ class PcanRW():
             # print("other initialisation error" + str(hex(stsResult)))
             return 3
 
+    def SetFilter(self):
+        """
+        Configure the driver acceptance filter with the AcceptedRanges (standard IDs), the filter is left open
+        (all the messages) if AcceptedRanges is None or refused
+        The driver expands its filter with each FilterMessages call to a single range: the window from the first to
+        the last accepted ID is set (0x100 to 0x212), the messages of the gaps are received and counted in
+        IgnoredFrames: 0x106-0x10F, 0x113-0x154, 0x1A9, 0x1B3-0x1FF and 0x201-0x20F (FilteredFrames counts the
+        ones outside the window). A code and mask (PCAN_ACCEPTANCE_FILTER_11BIT) can't narrow it: the accepted IDs
+        share no bit but the 0x400 one, the mask would accept 0x000 to 0x3FF
+        Returns a TPCANStatus error code
+        """
+        self.FilterRanges = []
+        try:
+            if self.AcceptedRanges is None:
+                return self.m_objPCANBasic.SetValue(self.PcanHandle, PCAN_MESSAGE_FILTER, PCAN_FILTER_OPEN)
+            window = (min(first for first, last in self.AcceptedRanges),
+                      max(last for first, last in self.AcceptedRanges))
+            stsResult = self.m_objPCANBasic.SetValue(self.PcanHandle, PCAN_MESSAGE_FILTER, PCAN_FILTER_CLOSE)
+            if stsResult == PCAN_ERROR_OK:
+                stsResult = self.m_objPCANBasic.FilterMessages(self.PcanHandle, window[0], window[1],
+                                                               PCAN_MODE_STANDARD)
+            if stsResult == PCAN_ERROR_OK:
+                self.FilterRanges = [window]
+                print("acceptance filter " + hex(window[0]) + "-" + hex(window[1]) + " for device ID " +
+                      str(hex(self.PcanId)))
+                return stsResult
+            self.m_objPCANBasic.SetValue(self.PcanHandle, PCAN_MESSAGE_FILTER, PCAN_FILTER_OPEN)
+        except:
+            stsResult = PCAN_ERROR_UNKNOWN
+        print("no acceptance filter for device ID " + str(hex(self.PcanId)) + ", all the messages received")
+        return stsResult
+
+    def FilteredFrames(self):
+        """
+        Messages dropped by the acceptance filter since the channel initialisation, simulator only: None with the
+        PCAN-Basic driver, which doesn't count them (nor the bus frames). IgnoredFrames counts the received ones
+        which are not decoded.
+        """
+        counter = getattr(self.m_objPCANBasic, 'FilteredFrames', None) if self.m_DLLFound else None
+        if counter is None:
+            return None
+        stsResult = counter(self.PcanHandle)
+        return stsResult[1] if stsResult[0] == PCAN_ERROR_OK else None
+
     def UnsetDevice(self):
         """
         Unset device is necessary before a new possible initialisation (between checks and try to set if it has already been set)
         """
+        self.ReleaseReceiveEvent()
         try:
             self.m_objPCANBasic.Uninitialize(self.PcanHandle)
         except:
@@ -137,18 +827,252 @@ class PcanRW():
         msgCanMessage.MSGTYPE = PCAN_MESSAGE_STANDARD.value
         msgCanMessage.DATA = msgCanDATA  # (0, 0, 0, 0xFF, 0, 0, 0, 0), <class 'tuple'>
 
-        return self.m_objPCANBasic.Write(self.PcanHandle, msgCanMessage)
+        stsResult = self.m_objPCANBasic.Write(self.PcanHandle, msgCanMessage)
+        if stsResult != PCAN_ERROR_OK and self.Metrics is not None:
+            self.Metrics.Status('write', stsResult)
+        return stsResult
 
     def ReadMessage(self):
         """
         Read CAN messages on normal CAN devices, returns a TPCANStatus error code
+        Read with the lock held: the channel is not uninitialised or initialised again meanwhile (CheckDevices)
         """
-        stsResult = self.m_objPCANBasic.Read(self.PcanHandle)
-        if stsResult[0] == PCAN_ERROR_OK:
-            self.ProcessMessageCan(stsResult[1], stsResult[2])
+        with self.Lock:
+            stsResult = self.m_objPCANBasic.Read(self.PcanHandle)
+            if stsResult[0] == PCAN_ERROR_OK:
+                if self.Metrics is None:
+                    self.ProcessMessageCan(stsResult[1], stsResult[2])
+                else:
+                    start = time.perf_counter_ns()
+                    self.ProcessMessageCan(stsResult[1], stsResult[2])
+                    self.Metrics.Frame(stsResult[1].ID, time.perf_counter_ns() - start)
+        if stsResult[0] != PCAN_ERROR_OK and stsResult[0] != PCAN_ERROR_QRCVEMPTY:
+            if stsResult[0] & PCAN_ERROR_QOVERRUN:
+                self.Overruns += 1
+                print("receive queue overrun on device ID " + str(hex(self.PcanId)) + ", messages lost")
+            if self.Metrics is not None:
+                self.Metrics.Status('read', stsResult[0])
 
         return stsResult[0]
 
+    def StartReader(self):
+        """
+        Start the acquisition thread of this device: it waits on the PCAN receive event and decodes
+        messages as they arrive, independently of the user interface refresh
+        """
+        if self.Reader is not None or not self.m_DLLFound:
+            return
+        self.ReaderRunning = True
+        self.Reader = threading.Thread(target=self.ReaderLoop, name="PcanRW " + str(hex(self.PcanId)), daemon=True)
+        self.Reader.start()
+
+    def StopReader(self):
+        """
+        Stop the acquisition thread (returns once it has finished)
+        """
+        self.ReaderRunning = False
+        if self.Reader is not None and self.Reader is not threading.current_thread():
+            self.Reader.join()
+        self.Reader = None
+
+    def ReaderLoop(self):
+        """
+        Acquisition thread: wait for received messages, then read until empty buffer
+        (max QUEUE_SIZE messages in the driver queue, read on after an overrun)
+        """
+        while self.ReaderRunning:
+            if not self.WaitForMessages(0.1):
+                continue
+            frames = 0
+            overruns = self.Overruns
+            try:
+                while self.ReaderRunning:
+                    status = self.ReadMessage()
+                    if status == PCAN_ERROR_OK:
+                        frames += 1
+                    elif not status & PCAN_ERROR_QOVERRUN:
+                        break
+                self.Drained(frames, self.Overruns != overruns)
+            except:
+                print("CAN read error on device ID " + str(hex(self.PcanId)))
+                time.sleep(0.1)
+
+    def Drained(self, frames, overrun=False):
+        """
+        Record a drain of the receive queue (frames read until empty), next poll interval adapted
+        """
+        self.Poll.Drained(frames, time.monotonic(), overrun)
+        if self.Metrics is not None:
+            self.Metrics.Drain(frames)
+
+    def BusLoad(self):
+        """
+        Bus load estimate (0 to 1) of the received frames
+        """
+        return self.Poll.BusLoad(BITRATES.get(self.Bitrate.value, 250000))
+
+    def WaitForMessages(self, timeout):
+        """
+        Block until the driver signals received messages (PCAN_RECEIVE_EVENT), at most timeout seconds
+        Without receive event (no device, unsupported platform...), sleep the adaptive interval of Poll
+        Returns False if nothing to read has been signaled
+        """
+        handle = self.PcanHandle.value
+        if handle != self.ReceiveEventHandle:
+            with self.Lock:  # not while the channel is initialised again
+                self.SetReceiveEvent()
+        event = self.ReceiveEvent  # released by a device re-initialisation meanwhile: the wait fails
+        if event is None:
+            time.sleep(self.Poll.Interval if handle != PCAN_NONEBUS.value else timeout)
+            return handle != PCAN_NONEBUS.value
+
+        if platform.system() == 'Windows':
+            return windll.kernel32.WaitForSingleObject(event, int(timeout * 1000)) == 0
+        try:
+            readable = select.select([event], [], [], timeout)[0]
+        except (OSError, ValueError):  # descriptor closed by a device re-initialisation
+            self.ReceiveEventHandle = None
+            return False
+        return len(readable) > 0
+
+    def SetReceiveEvent(self):
+        """
+        Get (Linux: file descriptor) or register (Windows: event object) the receive event of the current bus
+        """
+        self.ReleaseReceiveEvent()
+        self.ReceiveEventHandle = self.PcanHandle.value
+        if self.PcanHandle.value == PCAN_NONEBUS.value:
+            return
+        try:
+            if platform.system() == 'Windows':
+                event = windll.kernel32.CreateEventW(None, 0, 0, None)
+                if self.m_objPCANBasic.SetValue(self.PcanHandle, PCAN_RECEIVE_EVENT, event) == PCAN_ERROR_OK:
+                    self.ReceiveEvent = event
+                else:
+                    windll.kernel32.CloseHandle(event)
+            else:
+                stsResult = self.m_objPCANBasic.GetValue(self.PcanHandle, PCAN_RECEIVE_EVENT)
+                if stsResult[0] == PCAN_ERROR_OK and stsResult[1] > 0:
+                    self.ReceiveEvent = stsResult[1]
+        except:
+            print("no receive event for device ID " + str(hex(self.PcanId)) + ", polling")
+
+    def ReleaseReceiveEvent(self):
+        """
+        Forget the receive event (Windows: event object closed, Linux: descriptor owned by the driver), registered
+        again by WaitForMessages after the next channel initialisation
+        """
+        event = self.ReceiveEvent
+        self.ReceiveEvent = None
+        self.ReceiveEventHandle = None
+        if event is not None and platform.system() == 'Windows':
+            try:
+                windll.kernel32.CloseHandle(event)
+            except:
+                print("receive event not closed for device ID " + str(hex(self.PcanId)))
+
+    def Snapshot(self):
+        """
+        Consistent copy of the decoded values (state arrays and texts), changed status texts and colors updated first
+        Safe to call from the user interface while the reader thread decodes
+        """
+        with self.Lock:
+            self.UpdateStatus()
+            return PcanSnapshot(self.Integers[:], self.Floats[:], {name: getattr(self, name) for name in STATE.Texts})
+
+    def HardwareTime(self):
+        """
+        Current time in the time base of the received hardware timestamps (s), through the monotonic clock offset
+        of the last received message (frames waiting in the driver queue don't age the messages)
+        """
+        return time.monotonic() + self.ClockOffset
+
+    def Age(self, can_id, now=None):
+        """
+        s since the last reception of a decoded CAN ID (math.inf if never received on this channel)
+        now = hardware time base (HardwareTime() if None)
+        """
+        return (self.HardwareTime() if now is None else now) - self.LastSeen[FRAME_LAYOUTS[can_id].slot]
+
+    def Fresh(self, can_id, now=None):
+        """
+        True if a decoded CAN ID has been received within its timeout (DEADLINES)
+        """
+        slot = FRAME_LAYOUTS[can_id].slot
+        return (self.HardwareTime() if now is None else now) - self.LastSeen[slot] <= DEADLINES.Timeouts[slot]
+
+    def MpptAge(self, unit, now=None):
+        """
+        s since the last reception of all the messages of an MPPT converter (age of its oldest message)
+        """
+        return max(self.Age(MPPT_FIRST_ID + 3*unit + message, now) for message in range(3))
+
+    def StaleIds(self, now=None):
+        """
+        Decoded CAN IDs not received within their timeout, the MPPT converters beyond MPPT_NOMBRE only once
+        received (absent converters are not stale)
+        """
+        if now is None:
+            now = self.HardwareTime()
+        last_seen = self.LastSeen
+        timeouts = DEADLINES.Timeouts
+        stale = []
+        for slot, layout in enumerate(DEADLINES.Layouts):
+            if now - last_seen[slot] > timeouts[slot] and \
+                    (layout.unit is None or layout.unit < self.MPPT_NOMBRE or last_seen[slot] > -math.inf):
+                stale.append(DEADLINES.CanIds[slot])
+        return stale
+
+    def CheckWatchdogs(self, now=None):
+        """
+        Staleness control of the decoded messages (periodic call, lock held by the caller): a message not received
+        within its timeout (DEADLINES) has its values set back to their initial ones, the other values are kept.
+        The watchdog bitmasks give the fresh messages (BAT_WATCHDOG == 0x3F, MPPT_WATCHDOG[i] == 0x07 and
+        DRIVE_WATCHDOG == 0x1FF with the built-in layouts), the watchdog flag of a family and its error
+        (CAN SOFTWARE WATCHDOG) are set while one of its messages is stale, cleared when all are fresh again.
+        The detection latency is the timeout of the message plus the period of this call.
+        now = hardware time base (HardwareTime() if None, recorded time for a replay)
+        Returns the stale CAN IDs
+        """
+        if now is None:
+            now = self.HardwareTime()
+        stale = self.StaleIds(now)
+        flags = {'BAT_WATCHDOG': 0, 'MPPT_WATCHDOG': 0, 'DRIVE_WATCHDOG': 0}
+        for can_id in stale:
+            layout = FRAME_LAYOUTS[can_id]
+            layout.reset(self)
+            flags[layout.watchdog] = 1
+
+        if flags['BAT_WATCHDOG']:
+            self.BAT_ACTIVE_ERR = 32
+            self.BAT_FLAGS_ERR |= 0x80000000
+        elif self.BAT_WATCHDOG_FLAG:
+            self.BAT_FLAGS_ERR &= 0x7FFFFFFF  # BAT_ACTIVE_ERR set again by the next tpdo_1
+        if self.BAT_WATCHDOG_FLAG != flags['BAT_WATCHDOG']:
+            self.StatusDirty |= LECLANCHE_DIRTY
+        self.BAT_WATCHDOG_FLAG = flags['BAT_WATCHDOG']
+
+        if flags['MPPT_WATCHDOG']:
+            self.MPPT_ERR[0] |= 0x80000000
+        elif self.MPPT_WATCHDOG_FLAG:
+            self.MPPT_ERR[0] &= 0x7FFFFFFF
+        if self.MPPT_WATCHDOG_FLAG != flags['MPPT_WATCHDOG']:
+            self.StatusDirty |= MPPT_DIRTY
+        self.MPPT_WATCHDOG_FLAG = flags['MPPT_WATCHDOG']
+
+        if flags['DRIVE_WATCHDOG']:
+            self.DRIVE_ERR |= 0x80000000
+        elif self.DRIVE_WATCHDOG_FLAG:
+            self.DRIVE_ERR &= 0x7FFFFFFF
+        if self.DRIVE_WATCHDOG_FLAG != flags['DRIVE_WATCHDOG']:
+            self.StatusDirty |= DRIVE_DIRTY
+        self.DRIVE_WATCHDOG_FLAG = flags['DRIVE_WATCHDOG']
+
+        if self.Alarms is not None:
+            for watchdog, flag in flags.items():
+                self.Alarms.Watchdog(watchdog, flag, now)
+        return stale
+
     def ProcessMessageCan(self, msg, itstimestamp):
         """
         Processes a received CAN message
@@ -160,13 +1084,38 @@ class PcanRW():
         microsTimeStamp = itstimestamp.micros + 1000 * itstimestamp.millis + 0x100000000 * 1000 * itstimestamp.millis_overflow
 
         self.ReceivedTimestamp = microsTimeStamp / 1000000
+        self.ClockOffset = self.ReceivedTimestamp - time.monotonic()
         self.ReceivedId = msg.ID
-        for i in range(8):
-            self.ReceivedDatas[i] = msg.DATA[i]
+        self.ReceivedDatas[:] = msg.DATA
+        if self.Recorder is not None:
+            self.Recorder.Record(microsTimeStamp, self.PcanId, msg.ID, msg.LEN, msg.MSGTYPE, self.ReceivedDatas)
+
+        layout = FRAME_LAYOUTS.get(self.ReceivedId)
+        if layout is not None:
+            layout.decode(self, self.ReceivedDatas)
+            self.LastSeen[layout.slot] = self.ReceivedTimestamp
+            if self.History is not None:
+                self.History.Append(self)
+            if self.Rollups is not None:
+                self.Rollups.Append(self)
+            if self.Alarms is not None:
+                self.Alarms.Append(self)
+        elif self.ReceivedId in LECLANCHE_SDO_NAMES:
+            self.SdoFrames += 1
+        else:
+            self.IgnoredFrames += 1
 
-        self.LeclancheDecode()
-        self.MpptDecode()
-        self.DriveDecode()
+        # checked and set back after each CAN message, the flags are set by CheckWatchdogs
+        if self.BAT_WATCHDOG_FLAG == 1:
+            self.BAT_ACTIVE_ERR = 32
+            self.BAT_FLAGS_ERR |= 0x80000000
+        if self.MPPT_WATCHDOG_FLAG == 1:
+            self.MPPT_ERR[0] |= 0x80000000  # no need to set them all, because status get the max...
+        if self.DRIVE_WATCHDOG_FLAG == 1:
+            self.DRIVE_ERR |= 0x80000000
+
+        # Status functions are called in main program, even when no can message received (watchdogs...)
+        # and for better processing efficiency
 
     def GetDeviceId(self):
         """
@@ -178,222 +1127,57 @@ class PcanRW():
 
     def LeclancheInit(self):
         """
-        Variables initialisations for battery module (decoded from CAN messages)
-        """
-        # tpdo_1
-        self.BAT_HEARTBEAT1 = 0
-        # print("self.BAT_HEARTBEAT1", self.BAT_HEARTBEAT1)
-        self.BAT_SOC = 0
-        self.BAT_ACTIVE_ERR = 0
-        self.BAT_ACTIVE_WARN = 0
-        self.BAT_CHARGE_I_LIM = 0
-        self.BAT_DISCHARGE_I_LIM = 0
-
-        # tpdo_2
-        self.BAT_HEARTBEAT2 = 0
-        self.BAT_SOH = 0
-        self.BAT_STATUS_1 = 0
-        self.BAT_STATUS_2 = 0
-        self.BAT_VOLTAGE = 0
-        self.BAT_CURRENT = 0
-        self.BMS_OK = 0
-        self.BMS_IDLE = 0
-        self.BMS_CHARGE = 0
-        self.BMS_DISCHARGE = 0
-        self.BAT_FULL = 0
-
-        # tpdo_3
-        self.CELL_V_MIN = 0
-        self.CELL_V_MIN_ID = 0
-        self.CELL_V_MAX = 0
-        self.CELL_V_MAX_ID = 0
-
-        # tpdo_4
-        self.BAT_T_MIN = 0
-        self.BAT_T_MEAN = 0
-        self.BAT_T_MAX = 0
-        self.BAT_T_MIN_ID = 0
-        self.BAT_T_MAX_ID = 0
-
-        # tpdo_5
-        self.BAT_STATE_CHARGING = 0
-        self.BAT_STATE_DISCHARGING = 0
-        self.BAT_STATE_CONTACTOR_1 = 0
-        self.BAT_STATE_CONTACTOR_2 = 0
-        self.BAT_STATE_CONTACTOR_3 = 0
-        self.BAT_STATE_CONTACTOR_4 = 0
-        self.BAT_STATE_BALANCING = 0
-        self.GPIO = 0
-        # tpdo_5 extraits de GPIO
-        self.BAT_IO_1 = 0
-        self.BAT_IO_2 = 0
-        self.BAT_IO_3 = 0
-        self.BAT_IO_4 = 0
-        self.BAT_IO_5 = 0
-
-        # tpdo_6
-        self.BAT_FLAGS_ERR = 0
-        self.BAT_FLAGS_WARN = 0
-
-        # calculated or analysed:
-        self.BAT_POWER = 0  # VOLTAGE x CURRENT / 1000 --> kW
-        self.BAT_INITIAL_CAPACITY = 19  # kW.h of a new battery
-        self.BAT_REMAINING_ENERGY = 0  # SOC x SOH x INITIAL_CAPACITY
-        self.BAT_STATUS_TEXT = 'INIT'
-        self.BAT_STATUS_COLOR = 'RED'  # GREEN, ORANGE, RED
-        self.BAT_WATCHDOG = 0   # each periodic necessary message activate bits 0x01 0x02 0x04 0x08 0x10 0x20...
-                                # for BAT, periodic check that sum == 0x3F and reset to zero, or error activation (32 is free about BAT)
-        self.BAT_WATCHDOG_FLAG = 1
+        Variables initialisations for battery module (decoded from CAN messages), in place (LECLANCHE_STATE)
+        """
+        STATE.Reset(self, 'LECLANCHE')
+        self.StatusDirty |= LECLANCHE_DIRTY
+        # error activation (32 is free about BAT), until the watchdog is valid
         self.BAT_ACTIVE_ERR = 32
         self.BAT_FLAGS_ERR |= 0x80000000
 
-    def LeclancheDecode(self):
-        """
-        Message identification from CAN ID,
-        Set values according to ID and Leclanché tables
-        function decode <-- status <-- table
-        Called with each received CAN message
-        """
-        if self.ReceivedId >= 0x100 and self.ReceivedId <= 0x112:
-            if self.ReceivedId == 0x100:  # tpdo_1
-                self.BAT_HEARTBEAT1 = self.ReceivedDatas[0]
-                self.BAT_SOC = self.ReceivedDatas[1] / 2  # %
-                self.BAT_ACTIVE_ERR = self.ReceivedDatas[2]
-                self.BAT_ACTIVE_WARN = self.ReceivedDatas[3]
-                # Errors/Warning share same codes: 1...17, 19, 20, 25, 31
-                self.BAT_CHARGE_I_LIM = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5]]).hex()
-                self.BAT_DISCHARGE_I_LIM = bytes([self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.BAT_CHARGE_I_LIM = hex2num(self.BAT_CHARGE_I_LIM) / 10  # A
-                self.BAT_DISCHARGE_I_LIM = hex2num(self.BAT_DISCHARGE_I_LIM) / 10  # A
-
-                # print()
-                # print("Module A, tpdo_1, BAT_HEARTBEAT1", self.BAT_HEARTBEAT1, "BAT_SOC", self.BAT_SOC, "BAT_ACTIVE_ERR",  self.BAT_ACTIVE_ERR,
-                #       "BAT_ACTIVE_WARN", self.BAT_ACTIVE_WARN, "BAT_CHARGE_I_LIM", self.BAT_CHARGE_I_LIM, "BAT_DISCHARGE_I_LIM", self.BAT_DISCHARGE_I_LIM)
+    def LeclancheTpdo1(self):
+        """
+        Calculated values after tpdo_1 decoding
+        """
+        self.BAT_REMAINING_ENERGY = self.BAT_SOC * self.BAT_SOH * self.BAT_INITIAL_CAPACITY * 0.0001  # kWh
 
-                self.BAT_REMAINING_ENERGY = self.BAT_SOC * self.BAT_SOH * self.BAT_INITIAL_CAPACITY * 0.0001  # kWh
+    def LeclancheTpdo2(self):
+        """
+        Boolean status and calculated values after tpdo_2 decoding
+        """
+        self.BMS_OK = self.BAT_STATUS_1 & 0x01
+        self.BMS_IDLE = self.BAT_STATUS_1 & 0x02
+        self.BMS_CHARGE = self.BAT_STATUS_1 & 0x04
+        self.BMS_DISCHARGE = self.BAT_STATUS_1 & 0x08
+        self.BAT_FULL = self.BAT_STATUS_2 & 0x01  # bit0: 0 bat not full, 1 bat full
 
-                self.BAT_WATCHDOG |= 0x01
-
-            elif self.ReceivedId == 0x101:  # tpdo_2
-                self.BAT_HEARTBEAT2 = self.ReceivedDatas[0]
-                self.BAT_SOH = self.ReceivedDatas[1] / 2  # %
-                self.BAT_STATUS_1 = self.ReceivedDatas[2]
-                self.BAT_STATUS_2 = self.ReceivedDatas[3]
-                self.BAT_VOLTAGE = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5]]).hex()
-                self.BAT_CURRENT = bytes([self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.BAT_VOLTAGE = hex2num(self.BAT_VOLTAGE) / 10  # V
-                self.BAT_CURRENT = i16(hex2num(self.BAT_CURRENT)) / 10  # A
-
-                # print("Module A, tpdo_2, BAT_HEARTBEAT2", self.BAT_HEARTBEAT2, "BAT_SOH", self.BAT_SOH, "BAT_STATUS_1", self.BAT_STATUS_1,
-                #       "BAT_STATUS_2", self.BAT_STATUS_2, "BAT_VOLTAGE", self.BAT_VOLTAGE, "BAT_CURRENT", self.BAT_CURRENT)
-
-                # Boolean Status
-                self.BMS_OK = self.BAT_STATUS_1 & 0x01
-                self.BMS_IDLE = self.BAT_STATUS_1 & 0x02
-                self.BMS_CHARGE = self.BAT_STATUS_1 & 0x04
-                self.BMS_DISCHARGE = self.BAT_STATUS_1 & 0x08
-                self.BAT_FULL = self.BAT_STATUS_2 & 0x01  # bit0: 0 bat not full, 1 bat full
-                # print("BMS_OK", self.BMS_OK, "BMS_IDLE", self.BMS_IDLE, "BMS_CHARGE", self.BMS_CHARGE,
-                #       "BMS_DISCHARGE", self.BMS_DISCHARGE, "BAT_FULL", self.BAT_FULL)
-
-                self.BAT_POWER = self.BAT_VOLTAGE * self.BAT_CURRENT / 1000  # kW
-
-                self.BAT_WATCHDOG |= 0x02
-
-            elif self.ReceivedId == 0x102:  # tpdo_3
-                self.CELL_V_MIN = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1]]).hex()
-                self.CELL_V_MIN_ID = bytes([self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.CELL_V_MAX = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5]]).hex()
-                self.CELL_V_MAX_ID = bytes([self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.CELL_V_MIN = hex2num(self.CELL_V_MIN) / 1000  # V
-                self.CELL_V_MAX = hex2num(self.CELL_V_MAX) / 1000  # V
-
-                # print("Module A, tpdo_3, CELL_V_MIN", self.CELL_V_MIN, "CELL_V_MIN_ID", self.CELL_V_MIN_ID,
-                #       "CELL_V_MAX", self.CELL_V_MAX, "CELL_V_MAX_ID", self.CELL_V_MAX_ID)
-
-                self.BAT_WATCHDOG |= 0x04
-
-            elif self.ReceivedId == 0x103:  # tpdo_4
-                self.BAT_T_MIN = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1]]).hex()
-                self.BAT_T_MEAN = bytes([self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.BAT_T_MAX = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5]]).hex()
-                self.BAT_T_MIN_ID = self.ReceivedDatas[6]
-                self.BAT_T_MAX_ID = self.ReceivedDatas[7]
-
-                self.BAT_T_MIN = i16(hex2num(self.BAT_T_MIN)) / 10  # °C
-                self.BAT_T_MEAN = i16(hex2num(self.BAT_T_MEAN)) / 10  # °C
-                self.BAT_T_MAX = i16(hex2num(self.BAT_T_MAX)) / 10  # °C
-
-                # print("Module A, tpdo_4, BAT_T_MIN", self.BAT_T_MIN, "BAT_T_MEAN", self.BAT_T_MEAN, "BAT_T_MAX", self.BAT_T_MAX,
-                #       "BAT_T_MIN_ID", self.BAT_T_MIN_ID, "BAT_T_MAX_ID", self.BAT_T_MAX_ID)
-
-                self.BAT_WATCHDOG |= 0x08
-
-            elif self.ReceivedId == 0x104:  # tpdo_5
-                self.BAT_STATE_CHARGING = self.ReceivedDatas[0]
-                self.BAT_STATE_DISCHARGING = self.ReceivedDatas[1]
-                self.BAT_STATE_CONTACTOR_1 = self.ReceivedDatas[2]
-                self.BAT_STATE_CONTACTOR_2 = self.ReceivedDatas[3]
-                self.BAT_STATE_CONTACTOR_3 = self.ReceivedDatas[4]
-                self.BAT_STATE_CONTACTOR_4 = self.ReceivedDatas[5]
-                self.BAT_STATE_BALANCING = self.ReceivedDatas[6]
-                self.GPIO = self.ReceivedDatas[7]
-
-                # print("Module A, tpdo_5, BAT_STATE_CHARGING", self.BAT_STATE_CHARGING, "BAT_STATE_DISCHARGING", self.BAT_STATE_DISCHARGING,
-                #       "BAT_STATE_CONTACTOR_1", self.BAT_STATE_CONTACTOR_1, "BAT_STATE_CONTACTOR_2", self.BAT_STATE_CONTACTOR_2,
-                #       "BAT_STATE_CONTACTOR_3", self.BAT_STATE_CONTACTOR_3, "BAT_STATE_CONTACTOR_4", self.BAT_STATE_CONTACTOR_4,
-                #       "BAT_STATE_BALANCING", self.BAT_STATE_BALANCING, "GPIO", self.GPIO)
-
-                # Boolean Status
-                self.BAT_IO_1 = self.GPIO & 0x01
-                self.BAT_IO_2 = self.GPIO & 0x02
-                self.BAT_IO_3 = self.GPIO & 0x04
-                self.BAT_IO_4 = self.GPIO & 0x08
-                self.BAT_IO_5 = self.GPIO & 0x10
-
-                # print("BAT_IO_1", self.BAT_IO_1, "BAT_IO_2", self.BAT_IO_2, "BAT_IO_3", self.BAT_IO_3, "BAT_IO_4", self.BAT_IO_4, "BAT_IO_5", self.BAT_IO_5)
-
-                self.BAT_WATCHDOG |= 0x10
-
-            elif self.ReceivedId == 0x105:  # tpdo_6
-                self.BAT_FLAGS_ERR = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1], self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.BAT_FLAGS_WARN = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5], self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-                # Errors/Warning share same codes: 1...17, 19, 20, 25, 31
-                # Active bit position -> code number
-
-                self.BAT_FLAGS_ERR = hex2num(self.BAT_FLAGS_ERR)
-                self.BAT_FLAGS_WARN = hex2num(self.BAT_FLAGS_WARN)
-
-                # print("Module A, tpdo_6, BAT_FLAGS_ERR", self.BAT_FLAGS_ERR, "BAT_FLAGS_WARN", self.BAT_FLAGS_WARN)
-
-                self.BAT_WATCHDOG |= 0x20
-
-            elif self.ReceivedId == 0x110:  # rsdo_1
-                print("Module A, rsdo_1")
-            elif self.ReceivedId == 0x111:  # rsdo_2
-                print("Module A, rsdo_2")
-            elif self.ReceivedId == 0x112:  # rsdo_3
-                print("Module A, rsdo_3")
-
-        if self.ReceivedId >= 0x200 and self.ReceivedId <= 0x212:
-            if self.ReceivedId == 0x200:  # rpdo_1
-                print("Module A, rpdo_1")
-            elif self.ReceivedId == 0x210:  # psdo_1
-                print("Module A, psdo_1")
-            elif self.ReceivedId == 0x211:  # psdo_2
-                print("Module A, psdo_2")
-            elif self.ReceivedId == 0x212:  # psdo_3
-                print("Module A, psdo_3")
+        self.BAT_POWER = self.BAT_VOLTAGE * self.BAT_CURRENT / 1000  # kW
 
-        if self.BAT_WATCHDOG_FLAG == 1:
-            self.BAT_ACTIVE_ERR = 32
-            self.BAT_FLAGS_ERR |= 0x80000000
+    def LeclancheTpdo5(self):
+        """
+        Boolean status extracted from GPIO after tpdo_5 decoding
+        """
+        self.BAT_IO_1 = self.GPIO & 0x01
+        self.BAT_IO_2 = self.GPIO & 0x02
+        self.BAT_IO_3 = self.GPIO & 0x04
+        self.BAT_IO_4 = self.GPIO & 0x08
+        self.BAT_IO_5 = self.GPIO & 0x10
 
-        # self.LeclancheStatus()    # called in main program, even when no can message received (watchdogs...)
-                                    # and for better processing efficiency
+    def UpdateStatus(self):
+        """
+        Evaluate again the statuses whose inputs changed since the previous evaluation (StatusDirty bits set by the
+        decoders, the Init functions and the watchdogs): no cost while nothing changes, whatever the MPPT number
+        Lock held by the caller
+        """
+        dirty = self.StatusDirty
+        if dirty:
+            self.StatusDirty = 0
+            if dirty & LECLANCHE_DIRTY:
+                self.LeclancheStatus()
+            if dirty & MPPT_DIRTY:
+                self.MpptStatus()
+            if dirty & DRIVE_DIRTY:
+                self.DriveStatus()
 
     def LeclancheStatus(self):
         """
@@ -403,177 +1187,44 @@ class PcanRW():
         self.BAT_STATUS_TEXT = 'INIT'
         self.BAT_STATUS_COLOR = 'RED'  # GREEN, ORANGE, RED
         """
-        self.BAT_STATUS_TEXT = ''
+        soh = self.BAT_SOH
 
         # Error
-        if self.BAT_ACTIVE_ERR != 0 or self.BAT_SOH < 80:
-            self.BAT_STATUS_TEXT = self.Leclanche_Err_Warn_table(self.BAT_ACTIVE_ERR)
-            if self.BAT_SOH < 80:
-                self.BAT_STATUS_TEXT = self.BAT_STATUS_TEXT + ' State Of Health < 80%'
-            # print("self.BAT_STATUS_TEXT erreur", self.BAT_STATUS_TEXT)
+        if self.BAT_ACTIVE_ERR != 0 or soh < 80:
+            self.BAT_STATUS_TEXT = self.Leclanche_Err_Warn_table(self.BAT_ACTIVE_ERR) + \
+                (' State Of Health < 80%' if soh < 80 else '')
             self.BAT_STATUS_COLOR = 'RED'
 
         # Warning
-        elif self.BAT_ACTIVE_WARN != 0 or self.BAT_SOH < 82:
-            self.BAT_STATUS_TEXT = self.Leclanche_Err_Warn_table(self.BAT_ACTIVE_WARN)
-            if self.BAT_SOH < 82:
-                self.BAT_STATUS_TEXT = self.BAT_STATUS_TEXT + ' State Of Health < 82%'
-            # print("self.BAT_STATUS_TEXT warning", self.BAT_STATUS_TEXT)
+        elif self.BAT_ACTIVE_WARN != 0 or soh < 82:
+            self.BAT_STATUS_TEXT = self.Leclanche_Err_Warn_table(self.BAT_ACTIVE_WARN) + \
+                (' State Of Health < 82%' if soh < 82 else '')
             self.BAT_STATUS_COLOR = 'ORANGE'
 
-        # Info
+        # Info (BMS CHARGE and DISCHARGE not displayed)
         else:
-            if self.BMS_OK > 0:
-                self.BAT_STATUS_TEXT = 'BMS OK'
-            if self.BMS_IDLE > 0:
-                self.BAT_STATUS_TEXT = self.BAT_STATUS_TEXT + ', BMS IDLE'
-            # if self.BMS_CHARGE > 0:
-            #     self.BAT_STATUS_TEXT = self.BAT_STATUS_TEXT + ', CHARGE'
-            # if self.BMS_DISCHARGE > 0:
-            #     self.BAT_STATUS_TEXT = self.BAT_STATUS_TEXT + ', DISCHARGE'
-            if self.BAT_FULL > 0:
-                self.BAT_STATUS_TEXT = self.BAT_STATUS_TEXT + ', BAT FULL'
-            if self.BAT_STATE_CHARGING > 0:
-                self.BAT_STATUS_TEXT = self.BAT_STATUS_TEXT + ', CHARGING'
-            if self.BAT_STATE_DISCHARGING > 0:
-                self.BAT_STATUS_TEXT = self.BAT_STATUS_TEXT + ', DISCHARGING'
-            if self.BAT_STATE_BALANCING > 0:
-                self.BAT_STATUS_TEXT = self.BAT_STATUS_TEXT + ', BALANCING'
-            # print("self.BAT_STATUS_TEXT info", self.BAT_STATUS_TEXT)
+            self.BAT_STATUS_TEXT = LECLANCHE_INFO_TEXTS[(self.BMS_OK > 0) | (self.BMS_IDLE > 0) << 1 |
+                                                        (self.BAT_FULL > 0) << 2 |
+                                                        (self.BAT_STATE_CHARGING > 0) << 3 |
+                                                        (self.BAT_STATE_DISCHARGING > 0) << 4 |
+                                                        (self.BAT_STATE_BALANCING > 0) << 5]
             self.BAT_STATUS_COLOR = 'GREEN'
 
     def Leclanche_Err_Warn_table(self, code):
         """
         Return text for highest error/warning code (or for one specific flag weight to filter first)
         """
-        if code == 0:
-            description = ''
-        elif code == 1:
-            description = 'Cell voltage below limit'
-        elif code == 2:
-            description = 'Cell voltage above limit'
-        elif code == 3:
-            description = 'Discharge current above limit'
-        elif code == 4:
-            description = 'Charge current above limit'
-        elif code == 5:
-            description = 'Module temperature below limit'
-        elif code == 6:
-            description = 'Module temperature above limit'
-        elif code == 7:
-            description = 'Cell Voltage Difference'
-        elif code == 8:
-            description = 'Module Temperature Difference'
-        elif code == 9:
-            description = 'Cell Voltage Sum / Stack Voltage Difference'
-        elif code == 10:
-            description = 'Sensor Fault'
-        elif code == 11:
-            description = 'Precharge timeout'
-        elif code == 12:
-            description = 'Contactor Fault'
-        elif code == 13:
-            description = 'Isolation Fault'
-        elif code == 15:
-            description = 'Watchdog Reset Activated'
-        elif code == 16:
-            description = 'Emergency Stop Active'
-        elif code == 17:
-            description = 'BMU Communication Timeout'
-        elif code == 19:
-            description = 'FW Initialization Error'
-        elif code == 20:
-            description = 'Input alarm activated (Requires GPIO Configuration)'
-        elif code == 25:
-            description = 'CAN Host Timeout'
-        elif code == 31:
-            description = 'Software Error'
-        elif code == 32:
-            description = 'CAN SOFTWARE WATCHDOG'
-        else:
-            description = 'Unknow Error/Warning code'
-
-        return description
+        return LECLANCHE_CODE_TEXTS.get(code, LECLANCHE_UNKNOWN_CODE)
 
     def MpptInit(self):
         """
-        MPPT modules variables initialisations
+        MPPT modules variables initialisations, in place (MPPT_STATE)
         Arrays of 28 values, which index 0-27 is MPPT converter identifier
         """
-        self.MPPT_NOMBRE = 10  # MPPTs modules connected on CAN bus (max 28, with consecutive identifiers strating at 0)
-        self.MPPT_ID = -1  # actual processed ID (array index)
-
-        self.MPPT_ERR = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-        self.MPPT_WARN = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-
-        self.MPPT_IN_V = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-        self.MPPT_IN_A = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-        self.MPPT_IN_W = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-        self.MPPT_T1 = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-
-        self.MPPT_V = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-        self.MPPT_A = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-        self.MPPT_W = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-        self.MPPT_T2 = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-
-        # calculated or analysed:
-        self.MPPT_STATUS_TEXT = 'INIT'
-        self.MPPT_STATUS_COLOR = 'RED'  # GREEN, ORANGE, RED
-        self.MPPT_WATCHDOG = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]  # periodic sum for each MPPT module: valid watchdog is 0x07
-        self.MPPT_WATCHDOG_FLAG = 1
+        STATE.Reset(self, 'MPPT')
+        self.StatusDirty |= MPPT_DIRTY
         self.MPPT_ERR[0] |= 0x80000000
 
-    def MpptDecode(self):
-        """
-        Message identification from CAN ID,
-        Set values according to ID and "SPET pilot control system" document tables
-        function decode <-- status <-- table
-        Called with each received CAN message
-        """
-        if self.ReceivedId >= 0x155 and self.ReceivedId <= 0x1A9:
-            self.MPPT_ID = (self.ReceivedId - 0x155) // 3  # floor division with "//"
-
-            # messages 0,1,2 with CAN_ID - 0x155 - 3*ID :
-            if self.ReceivedId - 0x155 - 3*self.MPPT_ID == 0:
-                self.MPPT_ERR[self.MPPT_ID] = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1], self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.MPPT_WARN[self.MPPT_ID] = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5], self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-                self.MPPT_ERR[self.MPPT_ID] = hex2num(self.MPPT_ERR[self.MPPT_ID])
-                self.MPPT_WARN[self.MPPT_ID] = hex2num(self.MPPT_WARN[self.MPPT_ID])
-
-                self.MPPT_WATCHDOG[self.MPPT_ID] |= 0x01
-
-            if self.ReceivedId - 0x155 - 3*self.MPPT_ID == 1:
-                self.MPPT_IN_V[self.MPPT_ID] = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1]]).hex()
-                self.MPPT_IN_A[self.MPPT_ID] = bytes([self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.MPPT_IN_W[self.MPPT_ID] = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5]]).hex()
-                self.MPPT_T1[self.MPPT_ID] = bytes([self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.MPPT_IN_V[self.MPPT_ID] = hex2num(self.MPPT_IN_V[self.MPPT_ID]) / 100  # V
-                self.MPPT_IN_A[self.MPPT_ID] = hex2num(self.MPPT_IN_A[self.MPPT_ID]) / 1000  # A
-                self.MPPT_IN_W[self.MPPT_ID] = hex2num(self.MPPT_IN_W[self.MPPT_ID]) / 100  # W
-                self.MPPT_T1[self.MPPT_ID] = i16(hex2num(self.MPPT_T1[self.MPPT_ID])) / 100  # °C
-
-                self.MPPT_WATCHDOG[self.MPPT_ID] |= 0x02
-
-            if self.ReceivedId - 0x155 - 3*self.MPPT_ID == 2:
-                self.MPPT_V[self.MPPT_ID] = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1]]).hex()
-                self.MPPT_A[self.MPPT_ID] = bytes([self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.MPPT_W[self.MPPT_ID] = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5]]).hex()
-                self.MPPT_T2[self.MPPT_ID] = bytes([self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.MPPT_V[self.MPPT_ID] = hex2num(self.MPPT_V[self.MPPT_ID]) / 100  # V
-                self.MPPT_A[self.MPPT_ID] = hex2num(self.MPPT_A[self.MPPT_ID]) / 1000  # A
-                self.MPPT_W[self.MPPT_ID] = hex2num(self.MPPT_W[self.MPPT_ID]) / 100  # W
-                self.MPPT_T2[self.MPPT_ID] = i16(hex2num(self.MPPT_T2[self.MPPT_ID])) / 100  # °C
-
-                self.MPPT_WATCHDOG[self.MPPT_ID] |= 0x04
-
-        if self.MPPT_WATCHDOG_FLAG == 1:
-            self.MPPT_ERR[0] |= 0x80000000  # no need to set them all, because status get the max...
-
-        # self.MpptStatus() # called in main program, even when no can message received (watchdogs...)
-                            # and for better processing efficiency
-
     def MpptStatus(self):
         """
         Set status text and color about MPPT modules
@@ -581,325 +1232,74 @@ class PcanRW():
         Initialisations as for battery modules
         "Max" to get priority message between all modules
         """
-        self.MPPT_STATUS_TEXT = ''
+        error = max(self.MPPT_ERR)
 
         # Error
-        if max(self.MPPT_ERR) != 0:
-            self.MPPT_STATUS_TEXT = self.Mppt_Err_table(max(self.MPPT_ERR))
-            # print("self.MPPT_STATUS_TEXT erreur", self.MPPT_STATUS_TEXT)
+        if error != 0:
+            self.MPPT_STATUS_TEXT = self.Mppt_Err_table(error)
             self.MPPT_STATUS_COLOR = 'RED'
+            return
 
         # Warning
-        elif max(self.MPPT_WARN) != 0:
-            self.MPPT_STATUS_TEXT = self.Mppt_Warn_table(max(self.MPPT_WARN))
-            # print("self.MPPT_STATUS_TEXT warning", self.MPPT_STATUS_TEXT)
+        warning = max(self.MPPT_WARN)
+        if warning != 0:
+            self.MPPT_STATUS_TEXT = self.Mppt_Warn_table(warning)
             self.MPPT_STATUS_COLOR = 'ORANGE'
 
         # Info
         else:
             self.MPPT_STATUS_TEXT = 'MPPT OK'
-            # print("self.MPPT_STATUS_TEXT info", self.MPPT_STATUS_TEXT)
             self.MPPT_STATUS_COLOR = 'GREEN'
 
     def Mppt_Err_table(self, code):
         """
-        Return text for highest code
-        """
-        description = ''
-        if code & 0x80000000 != 0:
-            description = 'CAN SOFTWARE WATCHDOG'
-        elif code & 0x100 != 0:
-            description = 'error 9'
-        elif code & 0x80 != 0:
-            description = 'error 8'
-        elif code & 0x40 != 0:
-            description = 'error 7'
-        elif code & 0x20 != 0:
-            description = 'error 6'
-        elif code & 0x10 != 0:
-            description = 'error 5'
-        elif code & 0x8 != 0:
-            description = 'error 4'
-        elif code & 0x4 != 0:
-            description = 'error 3'
-        elif code & 0x2 != 0:
-            description = 'error 2'
-        elif code & 0x1 != 0:
-            description = 'error 1'
-        else:
-            description = 'Unknow Error code'
-
-        return description
+        Return text for highest code (highest set bit, ERROR_BITS_TEXTS)
+        """
+        return ERROR_BITS_TEXTS[(code & CODE_BITS_MASK).bit_length()]
 
     def Mppt_Warn_table(self, code):
         """
-        Return text for highest code
-        """
-        description = ''
-        if code & 0x80000000 != 0:
-            description = 'warning 32'
-        elif code & 0x100 != 0:
-            description = 'warning 9'
-        elif code & 0x80 != 0:
-            description = 'warning 8'
-        elif code & 0x40 != 0:
-            description = 'warning 7'
-        elif code & 0x20 != 0:
-            description = 'warning 6'
-        elif code & 0x10 != 0:
-            description = 'warning 5'
-        elif code & 0x8 != 0:
-            description = 'warning 4'
-        elif code & 0x4 != 0:
-            description = 'warning 3'
-        elif code & 0x2 != 0:
-            description = 'warning 2'
-        elif code & 0x1 != 0:
-            description = 'warning 1'
-        else:
-            description = 'Unknow Warning code'
-
-        return description
+        Return text for highest code (highest set bit, WARNING_BITS_TEXTS)
+        """
+        return WARNING_BITS_TEXTS[(code & CODE_BITS_MASK).bit_length()]
 
     def DriveInit(self):
         """
-        Drive module variables initialisations
-        """
-        self.DRIVE_ERR = 0
-        self.DRIVE_WARN = 0
-
-        self.DRIVE_MOTOR_MECA_POWER = 0
-        self.DRIVE_ELEC_POWER = 0
-
-        self.DRIVE_MOTOR_CURRENT_U = 0
-        self.DRIVE_MOTOR_CURRENT_V = 0
-        self.DRIVE_MOTOR_CURRENT_W = 0
-        self.DRIVE_DC_BUS_V = 0
-
-        self.DRIVE_MOTOR_TORQUE = 0
-        self.DRIVE_MOTOR_SPEED = 0  # rpm
-
-        self.DRIVE_MOTOR_POSITION = 0
-        self.DRIVE_POWER_ORDER = 0  # %
-        self.DRIVE_RESERVED1 = 0
-        self.DRIVE_POWER_LEVER = 0  # %
-
-        self.DRIVE_HOURS = 0
-        self.DRIVE_PCB_TEMP = 0  # °C
-        self.DRIVE_MOTOR_TEMP = 0  # °C
-
-        self.DRIVE_SIC_U_TEMP = 0
-        self.DRIVE_SIC_V_TEMP = 0
-        self.DRIVE_SIC_W_TEMP = 0
-        self.DRIVE_RESERVED2 = 0
-
-        # states 0x00/0xFF
-        self.DRIVE_INPUT_0 = 0
-        self.DRIVE_INPUT_1 = 0
-        self.DRIVE_INPUT_2 = 0
-        self.DRIVE_INPUT_3 = 0
-        self.DRIVE_OUTPUT_0 = 0
-        self.DRIVE_OUTPUT_1 = 0
-        self.DRIVE_OUTPUT_2 = 0
-        self.DRIVE_OUTPUT_3 = 0
-
-        # 4-20mA
-        self.DRIVE_ANALOG_INPUT_1 = 0
-        self.DRIVE_ANALOG_INPUT_2 = 0
-
-        # calculated or analysed:
-        self.DRIVE_STATUS_TEXT = 'INIT'
-        self.DRIVE_STATUS_COLOR = 'RED'  # GREEN, ORANGE, RED
-        self.DRIVE_WATCHDOG = 0  # periodic sum: valid watchdog is 0x1FF
-        self.DRIVE_WATCHDOG_FLAG = 1
+        Drive module variables initialisations, in place (DRIVE_STATE)
+        """
+        STATE.Reset(self, 'DRIVE')
+        self.StatusDirty |= DRIVE_DIRTY
         self.DRIVE_ERR |= 0x80000000
 
-    def DriveDecode(self):
-        """
-        Message identification from CAN ID,
-        Set values according to ID and "SPET pilot control system" document tables
-        function decode <-- status <-- table
-        Called with each received CAN message
-        """
-        if self.ReceivedId >= 0x1AA and self.ReceivedId <= 0x1FF:
-            if self.ReceivedId == 0x1AA:
-                self.DRIVE_ERR = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1], self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.DRIVE_WARN = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5], self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.DRIVE_ERR = hex2num(self.DRIVE_ERR)
-                self.DRIVE_WARN = hex2num(self.DRIVE_WARN)
-
-                self.DRIVE_WATCHDOG |= 0x01
-            elif self.ReceivedId == 0x1AB:
-                self.DRIVE_MOTOR_MECA_POWER = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1], self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.DRIVE_ELEC_POWER = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5], self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.DRIVE_MOTOR_MECA_POWER = hex2float(self.DRIVE_MOTOR_MECA_POWER)  # W
-                self.DRIVE_ELEC_POWER = hex2float(self.DRIVE_ELEC_POWER)  # W
-
-                self.DRIVE_WATCHDOG |= 0x02
-            elif self.ReceivedId == 0x1AC:
-                self.DRIVE_MOTOR_CURRENT_U = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1]]).hex()
-                self.DRIVE_MOTOR_CURRENT_V = bytes([self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.DRIVE_MOTOR_CURRENT_W = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5]]).hex()
-                self.DRIVE_DC_BUS_V = bytes([self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.DRIVE_MOTOR_CURRENT_U = i16(hex2num(self.DRIVE_MOTOR_CURRENT_U)) / 100  # Arms
-                self.DRIVE_MOTOR_CURRENT_V = i16(hex2num(self.DRIVE_MOTOR_CURRENT_V)) / 100  # Arms
-                self.DRIVE_MOTOR_CURRENT_W = i16(hex2num(self.DRIVE_MOTOR_CURRENT_W)) / 100  # Arms
-                self.DRIVE_DC_BUS_V = hex2num(self.DRIVE_DC_BUS_V) / 100  # Vdc
-
-                self.DRIVE_WATCHDOG |= 0x04
-            elif self.ReceivedId == 0x1AD:
-                self.DRIVE_MOTOR_MOTOR_TORQUE = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1], self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.DRIVE_MOTOR_SPEED = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5], self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.DRIVE_MOTOR_MOTOR_TORQUE = hex2float(self.DRIVE_MOTOR_MOTOR_TORQUE)  # N.m
-                self.DRIVE_MOTOR_SPEED = hex2float(self.DRIVE_MOTOR_SPEED)  # rpm
-
-                self.DRIVE_WATCHDOG |= 0x08
-            elif self.ReceivedId == 0x1AE:
-                self.DRIVE_MOTOR_POSITION = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1]]).hex()
-                self.DRIVE_POWER_ORDER = bytes([self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.DRIVE_RESERVED1 = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5]]).hex()
-                self.DRIVE_POWER_LEVER = bytes([self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.DRIVE_MOTOR_POSITION = hex2num(self.DRIVE_MOTOR_POSITION) / 100  # °
-                self.DRIVE_POWER_ORDER = hex2num(self.DRIVE_POWER_ORDER) / 100  # %
-                self.DRIVE_RESERVED1 = hex2num(self.DRIVE_RESERVED1)
-                self.DRIVE_POWER_LEVER = hex2num(self.DRIVE_POWER_LEVER) / 100  # %
-
-                self.DRIVE_WATCHDOG |= 0x10
-            elif self.ReceivedId == 0x1AF:
-                self.DRIVE_HOURS = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1], self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.DRIVE_PCB_TEMP = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5]]).hex()
-                self.DRIVE_MOTOR_TEMP = bytes([self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.DRIVE_HOURS = hex2float(self.DRIVE_HOURS)
-                self.DRIVE_PCB_TEMP = i16(hex2num(self.DRIVE_PCB_TEMP)) / 100  # °C
-                self.DRIVE_MOTOR_TEMP = i16(hex2num(self.DRIVE_MOTOR_TEMP)) / 100  # °C
-
-                self.DRIVE_WATCHDOG |= 0x20
-            elif self.ReceivedId == 0x1B0:
-                self.DRIVE_SIC_U_TEMP = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1]]).hex()
-                self.DRIVE_SIC_V_TEMP = bytes([self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.DRIVE_SIC_W_TEMP = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5]]).hex()
-                self.DRIVE_RESERVED2 = bytes([self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.DRIVE_SIC_U_TEMP = i16(hex2num(self.DRIVE_SIC_U_TEMP)) / 100  # °C
-                self.DRIVE_SIC_V_TEMP = i16(hex2num(self.DRIVE_SIC_V_TEMP)) / 100  # °C
-                self.DRIVE_SIC_W_TEMP = i16(hex2num(self.DRIVE_SIC_W_TEMP)) / 100  # °C
-                self.DRIVE_RESERVED2 = hex2num(self.DRIVE_RESERVED2)
-
-                self.DRIVE_WATCHDOG |= 0x40
-            elif self.ReceivedId == 0x1B1:
-                self.DRIVE_INPUT_0 = self.ReceivedDatas[0]  # 0x00/0xFF
-                self.DRIVE_INPUT_1 = self.ReceivedDatas[1]  # 0x00/0xFF
-                self.DRIVE_INPUT_2 = self.ReceivedDatas[2]  # 0x00/0xFF
-                self.DRIVE_INPUT_3 = self.ReceivedDatas[3]  # 0x00/0xFF
-                self.DRIVE_OUTPUT_0 = self.ReceivedDatas[4]  # 0x00/0xFF
-                self.DRIVE_OUTPUT_1 = self.ReceivedDatas[5]  # 0x00/0xFF
-                self.DRIVE_OUTPUT_2 = self.ReceivedDatas[6]  # 0x00/0xFF
-                self.DRIVE_OUTPUT_3 = self.ReceivedDatas[7]  # 0x00/0xFF
-
-                self.DRIVE_WATCHDOG |= 0x80
-            elif self.ReceivedId == 0x1B2:
-                self.DRIVE_ANALOG_INPUT_1 = bytes([self.ReceivedDatas[0], self.ReceivedDatas[1], self.ReceivedDatas[2], self.ReceivedDatas[3]]).hex()
-                self.DRIVE_ANALOG_INPUT_2 = bytes([self.ReceivedDatas[4], self.ReceivedDatas[5], self.ReceivedDatas[6], self.ReceivedDatas[7]]).hex()
-
-                self.DRIVE_ANALOG_INPUT_1 = hex2float(self.DRIVE_ANALOG_INPUT_1)  # 4-20mA
-                self.DRIVE_ANALOG_INPUT_2 = hex2float(self.DRIVE_ANALOG_INPUT_2)  # 4-20mA
-
-                self.DRIVE_WATCHDOG |= 0x100
-
-        if self.DRIVE_WATCHDOG_FLAG == 1:  # checked and set back after each CAN message, and also in main program ("CAN_Watchdogs")
-            self.DRIVE_ERR |= 0x80000000
-
-        # self.DriveStatus()  # called in main program, even when no can message received (watchdogs...)
-                              # and for better processing efficiency
-
     def DriveStatus(self):
         """
         Set status text and color about DRIVE MOTEUR modules
         See "SPET pilot control system" document tables
         Initialisations as for battery modules
         """
-        self.DRIVE_STATUS_TEXT = ''
-
         # Error
         if self.DRIVE_ERR != 0:
             self.DRIVE_STATUS_TEXT = self.Drive_Err_table(self.DRIVE_ERR)
-            # print("self.DRIVE_STATUS_TEXT erreur", self.DRIVE_STATUS_TEXT)
             self.DRIVE_STATUS_COLOR = 'RED'
 
         # Warning
         elif self.DRIVE_WARN != 0:
             self.DRIVE_STATUS_TEXT = self.Drive_Warn_table(self.DRIVE_WARN)
-            # print("self.DRIVE_STATUS_TEXT warning", self.DRIVE_STATUS_TEXT)
             self.DRIVE_STATUS_COLOR = 'ORANGE'
 
         # Info
         else:
             self.DRIVE_STATUS_TEXT = 'DRIVE OK'
-            # print("self.DRIVE_STATUS_TEXT info", self.DRIVE_STATUS_TEXT)
             self.DRIVE_STATUS_COLOR = 'GREEN'
 
     def Drive_Err_table(self, code):
         """
-        Return text for highest code
-        """
-        description = ''
-        if code & 0x80000000 != 0:
-            description = 'CAN SOFTWARE WATCHDOG'
-        elif code & 0x100 != 0:
-            description = 'error 9'
-        elif code & 0x80 != 0:
-            description = 'error 8'
-        elif code & 0x40 != 0:
-            description = 'error 7'
-        elif code & 0x20 != 0:
-            description = 'error 6'
-        elif code & 0x10 != 0:
-            description = 'error 5'
-        elif code & 0x8 != 0:
-            description = 'error 4'
-        elif code & 0x4 != 0:
-            description = 'error 3'
-        elif code & 0x2 != 0:
-            description = 'error 2'
-        elif code & 0x1 != 0:
-            description = 'error 1'
-        else:
-            description = 'Unknow Error code'
-
-        return description
+        Return text for highest code (highest set bit, ERROR_BITS_TEXTS)
+        """
+        return ERROR_BITS_TEXTS[(code & CODE_BITS_MASK).bit_length()]
 
     def Drive_Warn_table(self, code):
         """
-        Return text for highest code
-        """
-        description = ''
-        if code & 0x80000000 != 0:
-            description = 'warning 32'
-        elif code & 0x100 != 0:
-            description = 'warning 9'
-        elif code & 0x80 != 0:
-            description = 'warning 8'
-        elif code & 0x40 != 0:
-            description = 'warning 7'
-        elif code & 0x20 != 0:
-            description = 'warning 6'
-        elif code & 0x10 != 0:
-            description = 'warning 5'
-        elif code & 0x8 != 0:
-            description = 'warning 4'
-        elif code & 0x4 != 0:
-            description = 'warning 3'
-        elif code & 0x2 != 0:
-            description = 'warning 2'
-        elif code & 0x1 != 0:
-            description = 'warning 1'
-        else:
-            description = 'Unknow Warning code'
-
-        return description
\ No newline at end of file
+        Return text for highest code (highest set bit, WARNING_BITS_TEXTS)
+        """
+        return WARNING_BITS_TEXTS[(code & CODE_BITS_MASK).bit_length()]
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Class AlarmJournal, append-only journal of the alarm flag edges of the modules, with in-memory indexes by time,
+code and module, and class PcanAlarms, the edge detection of one PcanRW object (PcanRW.Alarms = alarms)
+
+Every rising and falling edge of the flag words (BAT_FLAGS_ERR, BAT_FLAGS_WARN, MPPT_ERR and MPPT_WARN of each
+converter, DRIVE_ERR, DRIVE_WARN), and of the software watchdog flags, is an event:
+    (time, timestamp, module, unit, source, code, rising)
+    time      = s, time.time() when journaled (common time base of the modules, indexed)
+    timestamp = s, hardware timestamp of the frame (PcanRW.ReceivedTimestamp)
+    module    = module name
+    unit      = MPPT converter index, None for the other sources
+    source    = flag word name ('BAT_FLAGS_ERR'...), or watchdog name ('BAT_WATCHDOG'...)
+    code      = active bit position + 1 (Leclanché codes: 13 = Isolation Fault), 32 for the watchdogs
+    rising    = True when the flag is activated, False when cleared
+
+The decoded flag words are compared to their previous values with one XOR per frame (generated function per
+CAN ID, only for the frames carrying flag words), the bits are only walked when a flag changed.
+The journal is kept in memory, and appended to a CSV file when a path is given (loaded again at start).
+
+Usage:
+    journal = AlarmJournal('alarms.csv')
+    spet_b.Alarms = PcanAlarms(journal, 'B')
+    events = journal.Query(module='B', source='BAT_FLAGS_ERR', code=13, seconds=3600)  # isolation faults
+or
+    poetry run python PCANalarms.py alarms.csv --module B --source BAT_FLAGS_ERR --code 13 --hours 1
+
+@author: yvan
+"""
+
+import argparse
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from PCAN_RW import FRAME_LAYOUTS, STATE, LECLANCHE_CODE_TEXTS, LECLANCHE_UNKNOWN_CODE, ERROR_BITS_TEXTS, \
+    WARNING_BITS_TEXTS
+
+# Flag words of the decoded frames, with the texts of their codes
+FLAG_SOURCES = {'BAT_FLAGS_ERR': LECLANCHE_CODE_TEXTS, 'BAT_FLAGS_WARN': LECLANCHE_CODE_TEXTS,
+                'MPPT_ERR': ERROR_BITS_TEXTS, 'MPPT_WARN': WARNING_BITS_TEXTS,
+                'DRIVE_ERR': ERROR_BITS_TEXTS, 'DRIVE_WARN': WARNING_BITS_TEXTS}
+WATCHDOG_SOURCES = ('BAT_WATCHDOG', 'MPPT_WATCHDOG', 'DRIVE_WATCHDOG')
+WATCHDOG_CODE = 32  # CAN SOFTWARE WATCHDOG
+
+CSV_HEADER = 'time,timestamp,module,unit,source,code,rising'
+
+
+def module_journal_path(path, module):
+    """
+    Journal file of one module, when each module is acquired in its own process (PCANshared):
+    alarms.csv -> alarms_B.csv
+    """
+    root, extension = os.path.splitext(path)
+    return root + '_' + module + extension
+
+
+def alarm_text(event):
+    """
+    Description of the code of an event
+    """
+    source, code = event[4], event[5]
+    if source in WATCHDOG_SOURCES:
+        return 'CAN SOFTWARE WATCHDOG'
+    texts = FLAG_SOURCES.get(source)
+    if texts is LECLANCHE_CODE_TEXTS:
+        return texts.get(code, LECLANCHE_UNKNOWN_CODE)
+    return texts[code] if texts is not None and 0 <= code < len(texts) else 'code ' + str(code)
+
+
+def format_event(event):
+    time_s, timestamp, module, unit, source, code, rising = event
+    return "{} module {}{}: {} {} ({} {})".format(
+        time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time_s)), module,
+        '' if unit is None else ' MPPT ' + str(unit), 'SET' if rising else 'CLEARED', alarm_text(event), source, code)
+
+
+class AlarmJournal():
+    """
+    Events of all the modules, in the journaling order (time), shared by the PcanAlarms objects
+    path = CSV file the events are appended to (existing events loaded), None in memory only
+    """
+    def __init__(self, path=None):
+        self.Events = []
+        self.Times = array('d')  # time of each event, increasing
+        self.ByCode = {}  # code -> (event numbers, times)
+        self.ByModule = {}  # module -> (event numbers, times)
+        self.Lock = threading.Lock()  # the reader threads of the modules journal their edges concurrently
+        self.Path = path
+        self.File = None
+        if path is not None:
+            if os.path.exists(path):
+                self.Load(path)
+            new = not os.path.exists(path) or os.path.getsize(path) == 0
+            self.File = open(path, 'a', encoding='utf-8')
+            if new:
+                self.File.write(CSV_HEADER + '\n')
+                self.File.flush()
+
+    def __len__(self):
+        return len(self.Events)
+
+    def Load(self, path):
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                fields = line.rstrip('\n').split(',')
+                if len(fields) != 7 or fields[0] == 'time':
+                    continue
+                try:
+                    self.Index((float(fields[0]), float(fields[1]), fields[2], int(fields[3]) if fields[3] else None,
+                                fields[4], int(fields[5]), fields[6] == '1'))
+                except ValueError:
+                    print("alarm journal " + path + ": line ignored " + repr(line))
+
+    def Index(self, event):
+        number = len(self.Events)
+        time_s = max(event[0], self.Times[-1]) if self.Times else event[0]  # increasing, for the bisections
+        self.Events.append(event)
+        self.Times.append(time_s)
+        for index, key in ((self.ByCode, event[5]), (self.ByModule, event[2])):
+            entry = index.get(key)
+            if entry is None:
+                entry = index[key] = (array('q'), array('d'))
+            entry[0].append(number)
+            entry[1].append(time_s)
+
+    def Append(self, timestamp, module, unit, source, code, rising):
+        """
+        Journal an edge now
+        """
+        with self.Lock:
+            event = (time.time(), timestamp, module, unit, source, code, rising)
+            self.Index(event)
+            if self.File is not None:
+                self.File.write('{!r},{!r},{},{},{},{},{}\n'.format(event[0], timestamp, module,
+                                                                  '' if unit is None else unit, source, code,
+                                                                  1 if rising else 0))
+                self.File.flush()
+
+    def Query(self, start=None, end=None, seconds=None, module=None, code=None, source=None, unit=None,
+              rising=None):
+        """
+        Events in [start, end[ (s, time.time()), or of the last seconds, oldest first, matching all the given
+        criteria: module name, code, source (flag word), MPPT unit, rising (True) or falling (False) edges
+        The candidates come from the code or module index, bisected on time, then filtered on the other criteria
+        """
+        with self.Lock:
+            if seconds is not None:
+                start = time.time() - seconds
+            numbers, times = None, self.Times
+            for index, key in ((self.ByCode, code), (self.ByModule, module)):  # smallest candidates index
+                if key is not None:
+                    entry = index.get(key, (array('q'), array('d')))
+                    if numbers is None or len(entry[0]) < len(numbers):
+                        numbers, times = entry
+            first = 0 if start is None else bisect_left(times, start)
+            stop = len(times) if end is None else bisect_left(times, end)
+            events = self.Events
+            selected = []
+            for position in range(first, stop):
+                event = events[position if numbers is None else numbers[position]]
+                if (module is None or event[2] == module) and (code is None or event[5] == code) and \
+                        (source is None or event[4] == source) and (unit is None or event[3] == unit) and \
+                        (rising is None or event[6] == rising):
+                    selected.append(event)
+            return selected
+
+    def Close(self):
+        with self.Lock:
+            if self.File is not None:
+                self.File.close()
+                self.File = None
+
+
+class PcanAlarms():
+    """
+    Edge detection of the flag words of one PcanRW object, journaled with the module name
+    """
+    def __init__(self, journal, module):
+        self.Journal = journal
+        self.Module = module
+        self.Words = []  # (source, unit, state value) of each detected flag word
+        self.Detectors = {}  # CAN ID -> detect(pcan_rw, timestamp)
+        detected = {}  # CAN ID -> slots of its flag words
+        for can_id, layout in sorted(FRAME_LAYOUTS.items()):
+            for name, divisor in layout.fields:
+                if name in FLAG_SOURCES:
+                    detected.setdefault(can_id, []).append(len(self.Words))
+                    self.Words.append((name, layout.unit, name + ('' if layout.unit is None else
+                                                                  '[' + str(layout.unit) + ']')))
+        self.Last = array('q', [0] * len(self.Words))  # flag words of the previous frames
+        self.Watchdogs = dict.fromkeys(WATCHDOG_SOURCES, 0)
+        for can_id, slots in detected.items():
+            self.Detectors[can_id] = self.compile(slots)
+
+    def compile(self, slots):
+        """
+        Generate the detection function detect(pcan_rw, timestamp) of a CAN ID: the XOR of its decoded flag words
+        with their previous values, Edges called only when one differs
+        """
+        changes = ' | '.join('(' + STATE.Expression(self.Words[slot][2]) + ' ^ last[' + str(slot) + '])'
+                             for slot in slots)
+        lines = ['def detect(rw, t):',
+                 '    if ' + changes + ':',
+                 '        edges(rw, t, ' + repr(tuple(slots)) + ')']
+        namespace = {'last': self.Last, 'edges': self.Edges}
+        exec('\n'.join(lines), namespace)
+        return namespace['detect']
+
+    def Append(self, pcan_rw):
+        """
+        Edges of the flag words of the last decoded frame (called by PcanRW.ProcessMessageCan)
+        """
+        detect = self.Detectors.get(pcan_rw.ReceivedId)
+        if detect is not None:
+            detect(pcan_rw, pcan_rw.ReceivedTimestamp)
+
+    def Edges(self, pcan_rw, timestamp, slots):
+        """
+        Journal an event per changed bit of the flag words of slots
+        """
+        for slot in slots:
+            source, unit, name = self.Words[slot]
+            value = getattr(pcan_rw, source)[unit] if unit is not None else getattr(pcan_rw, source)
+            changed = value ^ self.Last[slot]
+            self.Last[slot] = value
+            while changed:
+                bit = changed & -changed
+                changed ^= bit
+                self.Journal.Append(timestamp, self.Module, unit, source, bit.bit_length(), bool(value & bit))
+
+    def Watchdog(self, source, flag, timestamp):
+        """
+        Journal the edges of a watchdog flag (called by PcanRW.CheckWatchdogs)
+        """
+        if flag != self.Watchdogs[source]:
+            self.Watchdogs[source] = flag
+            self.Journal.Append(timestamp, self.Module, None, source, WATCHDOG_CODE, bool(flag))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SPET alarm journal")
+    parser.add_argument("path", help="CSV journal file")
+    parser.add_argument("--module")
+    parser.add_argument("--code", type=int, help="active bit position + 1 (Leclanché code)")
+    parser.add_argument("--source", help="flag word (BAT_FLAGS_ERR, MPPT_ERR, DRIVE_WARN...) or watchdog")
+    parser.add_argument("--unit", type=int, help="MPPT converter")
+    parser.add_argument("--hours", type=float, help="only the last hours")
+    parser.add_argument("--rising", action="store_true", help="only the activations")
+    args = parser.parse_args()
+
+    journal = AlarmJournal()
+    journal.Load(args.path)
+    for event in journal.Query(seconds=None if args.hours is None else args.hours * 3600, module=args.module,
+                               code=args.code, source=args.source, unit=args.unit,
+                               rising=True if args.rising else None):
+        print(format_event(event))
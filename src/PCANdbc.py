@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Signal definitions of a DBC file (CAN database) for the FrameLayout decoders of PCAN_RW: the decoded CAN IDs,
+signals, scales and watchdog bits become a data change (new battery firmware, MPPT or drive revision...),
+compiled at startup into the same generated functions as the built-in layouts.
+
+Supported subset of the DBC format:
+    BO_          messages with a standard CAN ID (extended ones are ignored)
+    SG_          signals byte aligned, of 8, 16, 32 or 64 bits, one byte order per message, factor and offset
+    SIG_VALTYPE_ float (1) and double (2) signals
+    BA_          message attributes of the PcanRW decoding: "Watchdog" (PcanRW attribute), "WatchdogBit",
+                 "Post" (PcanRW method called after the decoding), "GenMsgCycleTime" (expected period, ms)
+The signals of the MPPT converters are suffixed with their index: MPPT_IN_V__3 is decoded in MPPT_IN_V[3].
+The other lines (nodes, comments, value tables...) are ignored.
+
+Usage:
+    SPET_DBC=spet.dbc poetry run python spetUI.py
+or
+    leclanche_layouts, mppt_layouts, drive_layouts = dbc_layouts('spet.dbc')  (PCAN_RW)
+
+@author: yvan
+"""
+
+import re
+
+UNIT_SEPARATOR = '__'  # MPPT_IN_V__3 -> MPPT_IN_V of unit 3
+
+MESSAGE_LINE = re.compile(r'BO_\s+(\d+)\s+(\w+)\s*:\s*(\d+)')
+SIGNAL_LINE = re.compile(r'SG_\s+(\w+)\s*(\w*)\s*:\s*(\d+)\|(\d+)@([01])([+-])\s*\(\s*([^,\s]+)\s*,\s*([^)\s]+)\s*\)'
+                         r'\s*\[[^\]]*\]\s*"([^"]*)"')
+VALUE_TYPE_LINE = re.compile(r'SIG_VALTYPE_\s+(\d+)\s+(\w+)\s*:\s*(\d)')
+ATTRIBUTE_LINE = re.compile(r'BA_\s+"(\w+)"\s+BO_\s+(\d+)\s+("[^"]*"|[-+.\w]+)\s*;')
+
+EXTENDED_FLAG = 0x80000000  # DBC message ID of an extended CAN ID
+INTEGER_CODES = {8: 'b', 16: 'h', 32: 'i', 64: 'q'}  # struct codes of the signed integers, upper case unsigned
+FLOAT_CODES = {32: 'f', 64: 'd'}
+
+
+def number(text):
+    return int(text) if re.fullmatch(r'[-+]?\d+', text) else float(text)
+
+
+class DbcSignal():
+    """
+    Signal of a DBC message
+    start = bit of the least (little endian) or most (big endian) significant bit, DBC numbering
+    """
+    def __init__(self, name, start, length, little_endian, signed, factor, offset, unit):
+        self.Name = name
+        self.Start = start
+        self.Length = length
+        self.LittleEndian = little_endian
+        self.Signed = signed
+        self.Factor = factor
+        self.Offset = offset
+        self.Unit = unit
+        self.Float = False  # SIG_VALTYPE_ 1 or 2
+
+    def FirstByte(self):
+        """
+        Index of the first data byte of the signal, ValueError if it isn't byte aligned
+        """
+        if self.Length not in INTEGER_CODES or self.Start % 8 != (0 if self.LittleEndian else 7):
+            raise ValueError("signal " + self.Name + " is not byte aligned on 8, 16, 32 or 64 bits")
+        return self.Start // 8
+
+    def Code(self):
+        """
+        struct code of the raw value
+        """
+        if self.Float:
+            if self.Length not in FLOAT_CODES:
+                raise ValueError("float signal " + self.Name + " is not 32 or 64 bits")
+            return FLOAT_CODES[self.Length]
+        code = INTEGER_CODES[self.Length]
+        return code if self.Signed else code.upper()
+
+    def Divisor(self):
+        """
+        Divisor of the raw value, exact for the usual factors (/10 rather than *0.1: same decoded values
+        as the built-in layouts)
+        """
+        if self.Factor == 0:
+            raise ValueError("signal " + self.Name + " with a null factor")
+        if self.Factor == 1:
+            return 1
+        divisor = 1 / self.Factor
+        return round(divisor) if abs(divisor - round(divisor)) < 1e-9 * abs(divisor) else divisor
+
+    def Attribute(self):
+        """
+        (PcanRW attribute name, MPPT unit or None)
+        """
+        name, separator, unit = self.Name.rpartition(UNIT_SEPARATOR)
+        if separator and name and unit.isdigit():
+            return name, int(unit)
+        return self.Name, None
+
+
+class DbcMessage():
+    """
+    Message of a DBC file: CAN ID, data length, signals and attributes
+    """
+    def __init__(self, can_id, name, length):
+        self.CanId = can_id
+        self.Name = name
+        self.Length = length
+        self.Signals = []
+        self.Attributes = {}
+
+    def Signal(self, name):
+        for signal in self.Signals:
+            if signal.Name == name:
+                return signal
+        return None
+
+    def LayoutArguments(self):
+        """
+        FrameLayout arguments (fmt, fields, watchdog, watchdog_bit, unit, post, offsets) of the message:
+        one struct format for all its signals (pad bytes between them), fields in the data order
+        """
+        if not self.Signals:
+            raise ValueError("message " + self.Name + " without signal")
+        if len({signal.LittleEndian for signal in self.Signals}) > 1:
+            raise ValueError("message " + self.Name + " with both byte orders")
+        if 'Watchdog' not in self.Attributes or 'WatchdogBit' not in self.Attributes:
+            raise ValueError("message " + self.Name + " without Watchdog and WatchdogBit attributes")
+
+        fmt = '<' if self.Signals[0].LittleEndian else '>'
+        fields = []
+        offsets = []
+        units = set()
+        position = 0  # next free byte
+        for signal in sorted(self.Signals, key=DbcSignal.FirstByte):
+            first = signal.FirstByte()
+            if first < position:
+                raise ValueError("signal " + signal.Name + " overlaps the previous one")
+            if first > position:
+                fmt += str(first - position) + 'x'
+            fmt += signal.Code()
+            position = first + signal.Length // 8
+            name, unit = signal.Attribute()
+            fields.append((name, signal.Divisor()))
+            offsets.append(signal.Offset)
+            units.add(unit)
+        if position > min(self.Length, 8):
+            raise ValueError("message " + self.Name + " signals beyond its " + str(self.Length) + " bytes")
+        if len(units) > 1:
+            raise ValueError("message " + self.Name + " with signals of several MPPT units")
+        return (fmt, fields, self.Attributes['Watchdog'], self.Attributes['WatchdogBit'], units.pop(),
+                self.Attributes.get('Post') or None, offsets if any(offsets) else None)
+
+
+def read_dbc(path):
+    """
+    Messages of a DBC file, in the file order
+    """
+    messages = {}
+    message = None  # message of the following SG_ lines
+    with open(path, encoding='cp1252', errors='replace') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            where = path + ":" + str(line_number) + ": "
+            if line.startswith('SG_ '):
+                if message is None:
+                    continue  # signal of an ignored message
+                match = SIGNAL_LINE.match(line)
+                if match is None:
+                    raise ValueError(where + "unsupported signal definition")
+                name, multiplexer, start, length, order, sign, factor, offset, unit = match.groups()
+                if multiplexer:
+                    raise ValueError(where + "multiplexed signal " + name + " not supported")
+                message.Signals.append(DbcSignal(name, int(start), int(length), order == '1', sign == '-',
+                                                 number(factor), number(offset), unit))
+                continue
+
+            message = None
+            if line.startswith('BO_ '):
+                match = MESSAGE_LINE.match(line)
+                if match is None:
+                    raise ValueError(where + "unsupported message definition")
+                can_id = int(match.group(1))
+                if not can_id & EXTENDED_FLAG:
+                    message = messages[can_id] = DbcMessage(can_id, match.group(2), int(match.group(3)))
+            elif line.startswith('SIG_VALTYPE_ '):
+                match = VALUE_TYPE_LINE.match(line)
+                signal = None
+                if match is not None and int(match.group(1)) in messages:
+                    signal = messages[int(match.group(1))].Signal(match.group(2))
+                if signal is not None:
+                    signal.Float = match.group(3) in ('1', '2')
+            elif line.startswith('BA_ '):
+                match = ATTRIBUTE_LINE.match(line)
+                if match is not None and int(match.group(2)) in messages:
+                    value = match.group(3)
+                    messages[int(match.group(2))].Attributes[match.group(1)] = \
+                        value[1:-1] if value.startswith('"') else number(value)
+    return list(messages.values())
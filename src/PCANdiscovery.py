@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Class PcanDiscovery, map of the PCAN device identifiers (0x1, 0x2... written on the PeakCAN-USB devices)
+to the channel handles they are attached to (PCAN_USBBUS1...PCAN_USBBUS16, depend on the plugging order)
+
+The attached channels are enumerated at once with PCAN_ATTACHED_CHANNELS (device identifiers included, no
+initialisation needed). With an older PCAN-Basic driver, a device is looked up with LookUpChannel, else all the
+available USB channels are probed concurrently (Initialize, PCAN_DEVICE_ID, Uninitialize).
+The map is kept, and saved in a file when given, so that a PcanRW initializes its channel at once, the channels
+are discovered again only when it doesn't match any more (device re-plugged...).
+
+Usage:
+    discovery = PcanDiscovery(pcan_basic, path='pcan_channels.json')
+    spet_a = PcanRW(0x1, pcan_basic, discovery)
+
+@author: yvan
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PCANlib import *
+from PCAN_RW import value_of
+
+USB_CHANNELS = (PCAN_USBBUS1, PCAN_USBBUS2, PCAN_USBBUS3, PCAN_USBBUS4, PCAN_USBBUS5, PCAN_USBBUS6, PCAN_USBBUS7,
+                PCAN_USBBUS8, PCAN_USBBUS9, PCAN_USBBUS10, PCAN_USBBUS11, PCAN_USBBUS12, PCAN_USBBUS13,
+                PCAN_USBBUS14, PCAN_USBBUS15, PCAN_USBBUS16)
+
+
+class PcanDiscovery():
+    """
+    Device identifier -> channel handle map, shared by the PcanRW objects
+    pcan_basic = PCAN-Basic API object, default PCANBasic() at the first discovery
+    path = JSON file of the map, kept between runs (None: in memory only)
+    """
+    def __init__(self, pcan_basic=None, path=None, channels=USB_CHANNELS, bitrate=PCAN_BAUD_250K):
+        self.PcanBasic = pcan_basic
+        self.Path = path
+        self.Channels = channels  # probed without PCAN_ATTACHED_CHANNELS and LookUpChannel
+        self.Bitrate = bitrate
+        self.Lock = threading.Lock()
+        self.Handles = {}  # device ID -> channel handle value
+        self.Discoveries = 0
+        self.Load()
+
+    def Load(self):
+        if self.Path is None or not os.path.exists(self.Path):
+            return
+        try:
+            with open(self.Path) as file:
+                self.Handles = {int(device_id, 0): handle for device_id, handle in json.load(file).items()}
+        except (OSError, ValueError, AttributeError):
+            print("PCAN channels map " + self.Path + " ignored")
+
+    def Save(self):
+        if self.Path is None:
+            return
+        try:
+            with open(self.Path, 'w') as file:
+                json.dump({hex(device_id): handle for device_id, handle in sorted(self.Handles.items())}, file)
+        except OSError:
+            print("PCAN channels map " + self.Path + " not saved")
+
+    def Api(self):
+        if self.PcanBasic is None:
+            self.PcanBasic = PCANBasic()
+        return self.PcanBasic
+
+    def Find(self, device_id, refresh=False):
+        """
+        Channel handle value of a device identifier, from the map, discovered if unknown or refresh
+        (PCAN_NONEBUS value if it isn't attached)
+        """
+        with self.Lock:
+            if refresh or device_id not in self.Handles:
+                self.Discover(device_id)
+            return self.Handles.get(device_id, PCAN_NONEBUS.value)
+
+    def Discover(self, device_id=None):
+        """
+        Map the attached devices again (lock held)
+        """
+        self.Discoveries += 1
+        handles = self.AttachedChannels()
+        if handles is None and device_id is not None:
+            handle = self.LookUp(device_id)
+            if handle is not None:
+                handles = {known: value for known, value in self.Handles.items() if value != handle}
+                if handle != PCAN_NONEBUS.value:
+                    handles[device_id] = handle
+                else:
+                    handles.pop(device_id, None)
+        if handles is None:
+            handles = self.Probe()
+        if handles != self.Handles:
+            self.Handles = handles
+            self.Save()
+
+    def AttachedChannels(self):
+        """
+        {device ID: handle value} of the plugged channels, None if PCAN_ATTACHED_CHANNELS isn't supported
+        """
+        try:
+            result = self.Api().GetValue(PCAN_NONEBUS, PCAN_ATTACHED_CHANNELS)
+        except Exception:
+            return None
+        if result[0] != PCAN_ERROR_OK or len(result) < 2:
+            return None
+        handles = {}
+        for info in result[1]:
+            if info.channel_condition & PCAN_CHANNEL_AVAILABLE or info.channel_condition & PCAN_CHANNEL_OCCUPIED:
+                handles.setdefault(info.device_id, value_of(info.channel_handle))
+        return handles
+
+    def LookUp(self, device_id):
+        """
+        Handle value of the channel of a device ID (PCAN_NONEBUS value if none), None if LookUpChannel isn't supported
+        """
+        try:
+            status, handle = self.Api().LookUpChannel(b"devicetype=PCAN_USB, deviceid=" + str(device_id).encode())
+        except Exception:
+            return None
+        if status != PCAN_ERROR_OK:
+            return None
+        return value_of(handle)
+
+    def Probe(self):
+        """
+        {device ID: handle value} from all the channels probed concurrently; the channels already in use
+        keep their known device ID
+        """
+        in_use = {handle: device_id for device_id, handle in self.Handles.items()}
+        with ThreadPoolExecutor(max_workers=len(self.Channels)) as executor:
+            results = list(executor.map(self.ProbeChannel, self.Channels))
+        handles = {}
+        for channel, (condition, device_id) in zip(self.Channels, results):
+            handle = value_of(channel)
+            if device_id is not None:
+                handles.setdefault(device_id, handle)
+            elif condition is not None and condition & PCAN_CHANNEL_OCCUPIED and handle in in_use:
+                handles.setdefault(in_use[handle], handle)
+        return handles
+
+    def ProbeChannel(self, channel):
+        """
+        (channel condition, device ID) of one channel, device ID None if not available or without one
+        """
+        api = self.Api()
+        try:
+            status, condition = api.GetValue(channel, PCAN_CHANNEL_CONDITION)
+        except Exception:
+            return None, None
+        if status != PCAN_ERROR_OK:
+            return None, None
+        if condition != PCAN_CHANNEL_AVAILABLE:  # unplugged, or occupied (by a PcanRW...)
+            return condition, None
+        device_id = None
+        try:
+            if api.Initialize(channel, self.Bitrate) == PCAN_ERROR_OK:
+                result = api.GetValue(channel, PCAN_DEVICE_ID)
+                if result[0] == PCAN_ERROR_OK:
+                    device_id = result[1]
+                api.Uninitialize(channel)
+        except Exception:
+            print("probe error on PcanHandle " + str(channel))
+        return condition, device_id
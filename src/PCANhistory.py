@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Class PcanHistory, recent history of the decoded values of a PcanRW object, in preallocated NumPy ring buffers
+
+One ring per CAN ID: a timestamp column and one column per signal of the frame layout (BAT_SOC, MPPT_W[3]...),
+appended after each decoded frame (PcanRW.History = history). The memory is allocated once from a budget,
+the oldest samples are overwritten.
+
+Each row is written twice, at i and i + capacity: any window of the last capacity samples is a contiguous
+slice, returned as NumPy views without copy (valid until overwritten: copy them, with the PcanRW lock held,
+to keep them or when the reader thread runs).
+
+Usage:
+    spet_a.History = PcanHistory(memory=32 * 1024 * 1024)
+    times, values = spet_a.History.Signal('BAT_SOC', seconds=600)
+    times, values = spet_a.History.Signal('MPPT_W[3]', last=100)
+
+@author: yvan
+"""
+
+import struct
+
+import numpy as np
+
+from PCAN_RW import FRAME_LAYOUTS, STATE
+
+# Values calculated after the decoding of a CAN ID (post functions), recorded with its fields
+DERIVED_SIGNALS = {0x100: ('BAT_REMAINING_ENERGY',),
+                   0x101: ('BAT_POWER',)}
+
+
+def signal_names(can_id):
+    """
+    Signal names of a CAN ID, in the columns order: layout fields (NAME[unit] for MPPT units), then derived values
+    """
+    layout = FRAME_LAYOUTS[can_id]
+    index = '' if layout.unit is None else '[' + str(layout.unit) + ']'
+    return [name + index for name, divisor in layout.fields] + list(DERIVED_SIGNALS.get(can_id, ()))
+
+
+class SignalRing():
+    """
+    Ring buffer of the samples of one CAN ID
+    """
+    def __init__(self, can_id, capacity):
+        self.CanId = can_id
+        self.Names = signal_names(can_id)
+        self.Capacity = capacity
+        self.Rows = np.zeros((2 * capacity, 1 + len(self.Names)))  # timestamp, then the signals
+        self.Times = self.Rows[:, 0]  # s, PcanRW.ReceivedTimestamp
+        self.Values = self.Rows[:, 1:]
+        self.Row = struct.Struct('=' + 'd' * (1 + len(self.Names)))
+        self.Count = 0  # appended samples since creation
+        self.append = self.compile()
+
+    def compile(self):
+        """
+        Generate the append function append(pcan_rw, timestamp) of this CAN ID (same principle as FrameLayout):
+        the row packed in place in the array buffer, at both positions
+        """
+        row_bytes = str(self.Row.size)
+        ring_bytes = str(self.Row.size * self.Capacity)
+        values = ''.join(', ' + STATE.Expression(name) for name in self.Names)
+        lines = ['def append(rw, t):',
+                 '    offset = (ring.Count % ' + str(self.Capacity) + ') * ' + row_bytes,
+                 '    pack_into(rows, offset, t' + values + ')',
+                 '    pack_into(rows, offset + ' + ring_bytes + ', t' + values + ')',
+                 '    ring.Count += 1']
+        namespace = {'ring': self, 'rows': self.Rows, 'pack_into': self.Row.pack_into}
+        exec('\n'.join(lines), namespace)
+        return namespace['append']
+
+    def Clear(self):
+        self.Count = 0
+
+    def Window(self, last=None):
+        """
+        Views (times, values) of the last samples (all the kept ones by default), oldest first
+        """
+        kept = min(self.Count, self.Capacity)
+        if last is not None:
+            kept = min(kept, last)
+        end = self.Count % self.Capacity
+        if end < kept:
+            end += self.Capacity
+        return self.Times[end - kept:end], self.Values[end - kept:end]
+
+
+class PcanHistory():
+    """
+    History of all the decoded signals of one PcanRW object, memory = bytes of all the ring buffers
+    """
+    def __init__(self, memory=32 * 1024 * 1024, can_ids=None):
+        can_ids = sorted(FRAME_LAYOUTS) if can_ids is None else sorted(can_ids)
+        row_bytes = sum(2 * 8 * (1 + len(signal_names(can_id))) for can_id in can_ids)  # doubled rows
+        self.Capacity = max(1, memory // row_bytes)  # samples of each CAN ID
+        self.Rings = {can_id: SignalRing(can_id, self.Capacity) for can_id in can_ids}
+        self.Appenders = {can_id: ring.append for can_id, ring in self.Rings.items()}
+        self.Columns = {}  # signal name -> (ring, column)
+        for ring in self.Rings.values():
+            for column, name in enumerate(ring.Names):
+                self.Columns[name] = (ring, column)
+
+    def Append(self, pcan_rw):
+        """
+        Records the decoded values of the last processed frame (called by PcanRW.ProcessMessageCan)
+        """
+        append = self.Appenders.get(pcan_rw.ReceivedId)
+        if append is not None:
+            append(pcan_rw, pcan_rw.ReceivedTimestamp)
+
+    def Names(self):
+        return list(self.Columns)
+
+    def Clear(self):
+        for ring in self.Rings.values():
+            ring.Clear()
+
+    def Signal(self, name, seconds=None, last=None, start=None, end=None):
+        """
+        Views (times, values) of a signal, oldest first
+
+        seconds = only the samples of the last seconds before the latest one
+        last = only the last samples
+        start, end = only the samples in [start, end[ (s, PcanRW.ReceivedTimestamp)
+        """
+        ring, column = self.Columns[name]
+        times, values = ring.Window(last)
+        if len(times) and (seconds is not None or start is not None or end is not None):
+            if seconds is not None:
+                start = times[-1] - seconds
+            first = 0 if start is None else np.searchsorted(times, start, 'left')
+            stop = len(times) if end is None else np.searchsorted(times, end, 'left')
+            times = times[first:stop]
+            values = values[first:stop]
+        return times, values[:, column]
+
+    def Latest(self, name):
+        """
+        (time, value) of the last sample of a signal, None if none
+        """
+        ring, column = self.Columns[name]
+        if not ring.Count:
+            return None
+        position = (ring.Count - 1) % ring.Capacity
+        return ring.Times[position], ring.Values[position, column]
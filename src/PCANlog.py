@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Class PcanLog, seekable reading of the PCANrecorder segment files, with:
+- a sparse time index: running maximum timestamp every INDEX_BLOCK records, the first record at or after
+  a time is found by bisection then a scan of one block at most
+- a CAN ID index: record positions of each CAN ID, frames of some IDs are read without scanning the others
+The indexes of a segment are saved beside it (.idx), and rebuilt when the segment got more records.
+
+Replay of a log through PcanRW.ProcessMessageCan, the entry point of the live frames:
+- replay(): direct, as fast as possible or paced, for post-mortem analysis
+- PCANBasicReplay: PCAN-Basic stand-in (as PCANsim) giving the recorded frames to the PcanRW objects,
+  at their recorded pace multiplied by speed, so the reader threads and the dashboard run as live
+
+Usage:
+    python PCANlog.py records                         # segments, duration, frames per CAN ID
+    python PCANlog.py records --start 47 --end 48     # frames of minutes 47 to 48
+    python PCANlog.py records --start 47 --replay     # decoded status changes from minute 47
+or run spetUI.py with the SPET_REPLAY environment variable set to the records directory.
+
+@author: yvan
+"""
+
+import argparse
+import heapq
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+
+from PCANlib import *
+from PCANrecorder import SEGMENT_HEADER_SIZE, list_segments, read_header, record_structures
+from PCANsim import PCANBasicSim
+
+INDEX_BLOCK = 64  # records between two time index entries
+INDEX_SUFFIX = '.idx'
+INDEX_HEADER = struct.Struct('<8sQIII')  # magic, records number, block size, CAN IDs number, devices number
+INDEX_MAGIC = b'SPETIDX3'
+INDEX_ID = struct.Struct('<II')  # CAN ID, positions number
+
+
+class LogSegment():
+    """
+    One mapped segment file and its indexes
+    """
+    def __init__(self, path):
+        self.Path = path
+        self.File = open(path, 'rb')
+        self.Map = mmap.mmap(self.File.fileno(), 0, access=mmap.ACCESS_READ)
+        self.Sequence, self.Created, count = read_header(self.Map)
+        self.RecordStruct, self.RecordKey = record_structures(self.Map)  # record format of the segment version
+        self.RecordSize = self.RecordStruct.size
+        self.Count = min(count, (len(self.Map) - SEGMENT_HEADER_SIZE) // self.RecordSize)
+        self.BlockMax = array('q')  # running maximum timestamp at the end of each block
+        self.Ids = {}  # CAN ID -> array of positions
+        self.DeviceIds = set()
+        if not self.LoadIndex():
+            self.BuildIndex()
+            self.SaveIndex()
+
+    def Close(self):
+        self.Map.close()
+        self.File.close()
+
+    def BuildIndex(self):
+        self.BlockMax = array('q')
+        self.Ids = {}
+        devices = set()
+        last_device = None
+        running_max = 0
+        end = SEGMENT_HEADER_SIZE + self.Count * self.RecordSize
+        with memoryview(self.Map) as view:
+            for position, (timestamp, can_id, device_id) in enumerate(self.RecordKey.iter_unpack(view[SEGMENT_HEADER_SIZE:end])):
+                if timestamp > running_max:
+                    running_max = timestamp
+                if position % INDEX_BLOCK == INDEX_BLOCK - 1:
+                    self.BlockMax.append(running_max)
+                positions = self.Ids.get(can_id)
+                if positions is None:
+                    positions = self.Ids[can_id] = array('I')
+                positions.append(position)
+                if device_id != last_device:
+                    devices.add(device_id)
+                    last_device = device_id
+        self.DeviceIds = devices
+        if self.Count % INDEX_BLOCK:
+            self.BlockMax.append(running_max)
+
+    def LoadIndex(self):
+        try:
+            with open(self.Path + INDEX_SUFFIX, 'rb') as file:
+                datas = file.read()
+            magic, count, block, ids, devices = INDEX_HEADER.unpack_from(datas)
+            if magic != INDEX_MAGIC or count != self.Count or block != INDEX_BLOCK:
+                return False
+            offset = INDEX_HEADER.size
+            blocks = (count + INDEX_BLOCK - 1) // INDEX_BLOCK
+            self.BlockMax = array('q', datas[offset:offset + 8 * blocks])
+            offset += 8 * blocks
+            self.Ids = {}
+            for _ in range(ids):
+                can_id, number = INDEX_ID.unpack_from(datas, offset)
+                offset += INDEX_ID.size
+                self.Ids[can_id] = array('I', datas[offset:offset + 4 * number])
+                offset += 4 * number
+            self.DeviceIds = set(array('I', datas[offset:offset + 4 * devices]))
+            return True
+        except (OSError, struct.error, ValueError):
+            return False
+
+    def SaveIndex(self):
+        try:
+            with open(self.Path + INDEX_SUFFIX, 'wb') as file:
+                file.write(INDEX_HEADER.pack(INDEX_MAGIC, self.Count, INDEX_BLOCK, len(self.Ids), len(self.DeviceIds)))
+                file.write(self.BlockMax.tobytes())
+                for can_id, positions in self.Ids.items():
+                    file.write(INDEX_ID.pack(can_id, len(positions)))
+                    file.write(positions.tobytes())
+                file.write(array('I', sorted(self.DeviceIds)).tobytes())
+        except OSError:
+            pass  # read-only records: the index is rebuilt at each opening
+
+    def Record(self, position):
+        """
+        (timestamp µs, CAN ID, device identifier, DLC, message type, data) of the record at position
+        """
+        return self.RecordStruct.unpack_from(self.Map, SEGMENT_HEADER_SIZE + position * self.RecordSize)
+
+    def Timestamp(self, position):
+        return self.RecordKey.unpack_from(self.Map, SEGMENT_HEADER_SIZE + position * self.RecordSize)[0]
+
+    def Seek(self, timestamp):
+        """
+        First position from which all the records are at or after timestamp, all the previous ones before
+        """
+        block = bisect_left(self.BlockMax, timestamp)
+        position = block * INDEX_BLOCK
+        end = min(self.Count, position + INDEX_BLOCK)
+        while position < end and self.Timestamp(position) < timestamp:
+            position += 1
+        return position
+
+
+class PcanLog():
+    """
+    Recorded frames of a PCANrecorder directory, positions are global record numbers over the segments
+    Timestamps are µs (hardware timestamps of the PCAN devices)
+    """
+    def __init__(self, directory):
+        self.Directory = directory
+        self.Segments = []
+        for path in list_segments(directory):
+            segment = LogSegment(path)
+            if segment.Count:
+                self.Segments.append(segment)
+            else:
+                segment.Close()
+        self.Offsets = []  # global position of the first record of each segment
+        self.SegmentMax = []  # running maximum timestamp at the end of each segment
+        self.Count = 0
+        running_max = 0
+        for segment in self.Segments:
+            self.Offsets.append(self.Count)
+            self.Count += segment.Count
+            running_max = max(running_max, segment.BlockMax[-1])
+            self.SegmentMax.append(running_max)
+        self.Start = self.Segments[0].Timestamp(0) if self.Segments else 0
+        self.End = running_max
+        self.DeviceIds = sorted(set().union(*(segment.DeviceIds for segment in self.Segments)))
+
+    def __len__(self):
+        return self.Count
+
+    def Close(self):
+        for segment in self.Segments:
+            segment.Close()
+        self.Segments = []
+
+    def Record(self, position):
+        k = bisect_left(self.Offsets, position + 1) - 1
+        return self.Segments[k].Record(position - self.Offsets[k])
+
+    def Seek(self, timestamp):
+        """
+        Position of the first record at or after timestamp (µs), O(log n)
+        """
+        k = bisect_left(self.SegmentMax, timestamp)
+        if k == len(self.Segments):
+            return self.Count
+        return self.Offsets[k] + self.Segments[k].Seek(timestamp)
+
+    def TimestampAt(self, minutes):
+        """
+        Timestamp (µs) minutes after the log start
+        """
+        return self.Start + int(minutes * 60000000)
+
+    def CanIds(self):
+        """
+        {CAN ID: frames number}
+        """
+        counts = {}
+        for segment in self.Segments:
+            for can_id, positions in segment.Ids.items():
+                counts[can_id] = counts.get(can_id, 0) + len(positions)
+        return counts
+
+    def Frames(self, start=None, end=None, can_ids=None, device_id=None):
+        """
+        Yields the records (timestamp µs, CAN ID, device identifier, DLC, message type, data) in recording order
+
+        start, end = timestamps µs (None = log start, log end), end excluded
+        can_ids = only these CAN IDs (read through the CAN ID index)
+        device_id = only the frames of this device (module)
+        """
+        first = 0 if start is None else self.Seek(start)
+        last = self.Count if end is None else self.Seek(end)
+        k = max(0, bisect_left(self.Offsets, first + 1) - 1)
+        while k < len(self.Segments) and self.Offsets[k] < last:
+            segment = self.Segments[k]
+            local_first = max(0, first - self.Offsets[k])
+            local_last = min(segment.Count, last - self.Offsets[k])
+            if can_ids is None:
+                positions = range(local_first, local_last)
+            else:
+                ranges = []
+                for can_id in can_ids:
+                    ids = segment.Ids.get(can_id)
+                    if ids is not None:
+                        ranges.append(ids[bisect_left(ids, local_first):bisect_left(ids, local_last)])
+                positions = heapq.merge(*ranges)
+            for position in positions:
+                record = segment.Record(position)
+                if device_id is None or record[2] == device_id:
+                    yield record
+            k += 1
+
+
+def replay(log, modules, start=None, end=None, speed=0, watchdog_period=0.1, on_frame=None):
+    """
+    Process the recorded frames with modules {device identifier: PcanRW} through ProcessMessageCan
+
+    start, end = timestamps µs (None = log start, log end)
+    speed = 0 as fast as possible, else recorded pace multiplied by speed
+    watchdog_period = s of recorded time between PcanRW.CheckWatchdogs calls (recorded time base), as PcanModules
+                      (None = no check)
+    on_frame = function(module, record) called after each processed frame
+    Returns the number of processed frames
+    """
+    msg = TPCANMsg()
+    itstimestamp = TPCANTimestamp()
+    msg.MSGTYPE = PCAN_MESSAGE_STANDARD.value
+    processed = 0
+    t_wall = time.monotonic()
+    t_log = None
+    next_check = None
+    for record in log.Frames(start, end):
+        timestamp, can_id, device_id, dlc, msgtype, datas = record
+        module = modules.get(device_id)
+        if module is None:
+            continue
+        if t_log is None:
+            t_log = timestamp
+            if watchdog_period is not None:
+                next_check = timestamp + watchdog_period * 1000000
+        while next_check is not None and timestamp >= next_check:
+            for checked in modules.values():
+                with checked.Lock:
+                    checked.CheckWatchdogs(next_check / 1000000)
+            next_check += watchdog_period * 1000000
+        if speed > 0:
+            delay = (timestamp - t_log) / 1000000 / speed - (time.monotonic() - t_wall)
+            if delay > 0:
+                time.sleep(delay)
+        msg.ID = can_id
+        msg.LEN = dlc
+        msg.MSGTYPE = msgtype
+        msg.DATA[:] = datas
+        itstimestamp.micros = timestamp % 1000
+        itstimestamp.millis = (timestamp // 1000) & 0xFFFFFFFF
+        itstimestamp.millis_overflow = (timestamp // 1000) >> 32
+        with module.Lock:
+            module.ProcessMessageCan(msg, itstimestamp)
+        processed += 1
+        if on_frame is not None:
+            on_frame(module, record)
+    return processed
+
+
+class PCANBasicReplay(PCANBasicSim):
+    """
+    PCAN-Basic API giving the recorded frames: one channel per recorded device (PCAN_USBBUS1, 2...),
+    each one reading from start at the recorded pace multiplied by speed (0 = as fast as possible)
+    The frames keep their recorded hardware timestamps.
+    """
+    def __init__(self, log, speed=1.0, start=None, end=None, queue_size=32768):
+        handles = [PCAN_USBBUS1, PCAN_USBBUS2, PCAN_USBBUS3, PCAN_USBBUS4, PCAN_USBBUS5, PCAN_USBBUS6,
+                   PCAN_USBBUS7, PCAN_USBBUS8]
+        devices = {handle.value: device_id for handle, device_id in zip(handles, log.DeviceIds)}
+        super().__init__(devices=devices, queue_size=queue_size)
+        self.log = log
+        self.speed = speed
+        self.start = log.Start if start is None else start
+        self.end = end
+
+    def Initialize(self, Channel, Btr0Btr1, HwType=TPCANType(0), IOPort=c_uint(0), Interrupt=c_ushort(0)):
+        status = super().Initialize(Channel, Btr0Btr1, HwType, IOPort, Interrupt)
+        if status == PCAN_ERROR_OK:
+            channel = self.get_channel(Channel)
+            channel.frames = self.log.Frames(self.start, self.end, device_id=channel.device_id)
+            channel.pending = next(channel.frames, None)
+        return status
+
+    def generate(self, channel, t_now):
+        """
+        Queue the recorded frames up to log time start + t_now * speed (the queue size when as fast as possible)
+        """
+        limit = None if self.speed <= 0 else self.start + t_now * self.speed * 1000000
+        record = channel.pending
+        while record is not None and (limit is None or record[0] <= limit):
+            if limit is None and len(channel.queue) >= self.queue_size:
+                break
+            timestamp, can_id, device_id, dlc, msgtype, datas = record
+            channel.generated += 1
+            if not channel.accepts(can_id):
+                channel.filtered += 1
+            elif len(channel.queue) >= self.queue_size:
+                channel.lost += 1
+                channel.overrun = True
+            else:
+                channel.queue.append((timestamp / 1000000, can_id, tuple(datas)))
+            record = next(channel.frames, None)
+        channel.pending = record
+        channel.t = t_now
+
+
+if __name__ == "__main__":
+    from PCAN_RW import PcanRW
+
+    parser = argparse.ArgumentParser(description="SPET CAN records")
+    parser.add_argument("directory")
+    parser.add_argument("--start", type=float, help="minutes after the log start")
+    parser.add_argument("--end", type=float, help="minutes after the log start")
+    parser.add_argument("--ids", help="CAN IDs, comma separated (0x100,0x105)")
+    parser.add_argument("--replay", action="store_true", help="decode the frames, print the status changes")
+    args = parser.parse_args()
+
+    log = PcanLog(args.directory)
+    start = None if args.start is None else log.TimestampAt(args.start)
+    end = None if args.end is None else log.TimestampAt(args.end)
+    can_ids = None if args.ids is None else [int(can_id, 0) for can_id in args.ids.split(",")]
+
+    if args.replay:
+        modules = {device_id: PcanRW(device_id, PCANBasicSim(devices={})) for device_id in log.DeviceIds}
+        statuses = {}
+
+        def print_status(module, record):
+            module.UpdateStatus()
+            status = (module.BAT_STATUS_TEXT, module.MPPT_STATUS_TEXT, module.DRIVE_STATUS_TEXT)
+            if statuses.get(module.PcanId) != status:
+                statuses[module.PcanId] = status
+                print("{:10.3f} min, module {}: {}".format((record[0] - log.Start) / 60000000, hex(module.PcanId),
+                                                           " | ".join(status)))
+
+        t0 = time.perf_counter()
+        processed = replay(log, modules, start, end, on_frame=print_status)
+        print(processed, "frames replayed in", round(time.perf_counter() - t0, 3), "s")
+    elif args.start is None and args.end is None and can_ids is None:
+        print(len(log.Segments), "segments,", len(log), "frames,", round((log.End - log.Start) / 60000000, 3),
+              "minutes, devices", [hex(device_id) for device_id in log.DeviceIds])
+        for can_id, count in sorted(log.CanIds().items()):
+            print(hex(can_id), count)
+    else:
+        for timestamp, can_id, device_id, dlc, msgtype, datas in log.Frames(start, end, can_ids):
+            print("{:12.6f} {} {:>5} {}".format((timestamp - log.Start) / 1000000, hex(device_id), hex(can_id),
+                                                datas[:dlc].hex(" ")))
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Class PcanMetrics, counters and histograms of the acquisition hot path, exposed in the Prometheus text format
+(MetricsHandler, /metrics of the Bokeh Tornado server)
+
+Measured, for each module (PcanRW.Metrics = ModuleMetrics, set by PcanMetrics.Attach):
+    spet_frames_total                 received frames per CAN ID (and channel of the module)
+    spet_decode_seconds               ProcessMessageCan duration histogram (powers of 2 ns buckets)
+    spet_drain_frames                 frames read per drain of the receive queue (reader thread wake-up,
+                                      or PcanModules.ReadPending cycle)
+    spet_pcan_status_total            PCAN-Basic non OK statuses of the reads and writes, per code
+    spet_ignored_frames_total         frames neither decoded nor SDO (PcanRW.IgnoredFrames)
+    spet_sdo_frames_total             Leclanché SDO frames received, not decoded (PcanRW.SdoFrames)
+    spet_filtered_frames_total        frames dropped by the acceptance filter, simulator only (PcanRW.FilteredFrames,
+                                      not counted by the PCAN-Basic driver: no sample on hardware)
+    spet_queue_overruns_total         PCAN_ERROR_QOVERRUN statuses read (messages lost)
+    spet_queue_peak_ratio             max fill of the receive queue seen at a drain (PCAN_RW.PollSchedule)
+    spet_bus_load_ratio               bus load estimate of the received frames
+    spet_poll_interval_seconds        adaptive interval between two reads of the receive queue (without event)
+and for the user interface process:
+    spet_callback_lag_seconds         actual minus scheduled interval of the Bokeh periodic callbacks
+    spet_callback_interval_seconds    last actual interval of each callback
+    spet_callback_scheduled_seconds   scheduled interval of each callback
+
+A frame costs two perf_counter_ns calls and one method call (counter of its CAN ID and bucket of the bit length of
+the duration incremented), the exposition reads the counters without lock (single writer each).
+
+Usage:
+    metrics = PcanMetrics()
+    metrics.Attach('A', spet_a)
+    Server({'/': app}, extra_patterns=[('/metrics', MetricsHandler, {'metrics': metrics})])
+or run spetUI.py with the SPET_METRICS environment variable set, then:
+    curl http://localhost:5006/metrics
+
+@author: yvan
+"""
+
+import time
+from array import array
+from bisect import bisect_left
+
+from tornado.web import RequestHandler
+
+STANDARD_IDS = 0x800  # 11 bits CAN IDs, counted in an array (the others in a dictionary)
+NS_BUCKETS = 64  # bit lengths of a duration in ns
+NS_EXPOSED = range(8, 31)  # exposed buckets, le 2**k - 1 ns: 255 ns to 1 s
+DRAIN_BOUNDS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 32768)  # frames
+LAG_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5)  # s
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels_text(labels):
+    return '{' + ','.join(name + '="' + label_value(value) + '"' for name, value in labels) + '}'
+
+
+def number_text(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram():
+    """
+    Observations counted in buckets of upper bounds (le, inclusive), with their sum
+    """
+    def __init__(self, bounds):
+        self.Bounds = tuple(bounds)
+        self.Counts = array('q', [0] * (len(self.Bounds) + 1))  # last: above the bounds
+        self.Sum = 0
+
+    def Observe(self, value):
+        self.Counts[bisect_left(self.Bounds, value)] += 1
+        self.Sum += value
+
+    def Cumulative(self):
+        """
+        [(le, cumulative count), ...] ending with +Inf
+        """
+        counts = self.Counts.tolist()
+        buckets = []
+        total = 0
+        for bound, count in zip(self.Bounds, counts):
+            total += count
+            buckets.append((bound, total))
+        buckets.append(('+Inf', total + counts[-1]))
+        return buckets
+
+
+class ModuleMetrics():
+    """
+    Hot path metrics of one PcanRW object, written by its reader thread (or the PcanModules reads)
+    """
+    def __init__(self, name, pcan_rw):
+        self.Name = name
+        self.PcanRW = pcan_rw
+        self.Frames = array('q', [0] * STANDARD_IDS)  # frames per standard CAN ID
+        self.ExtendedFrames = {}  # extended CAN ID -> frames
+        self.DecodeCounts = array('q', [0] * NS_BUCKETS)  # index = bit length of the duration in ns
+        self.DecodeSum = 0  # ns
+        self.Drains = Histogram(DRAIN_BOUNDS)
+        self.Statuses = {}  # (operation, status) -> count
+
+    def Frame(self, can_id, ns):
+        """
+        A processed frame and its ProcessMessageCan duration (ns)
+        """
+        if can_id < STANDARD_IDS:
+            self.Frames[can_id] += 1
+        else:
+            self.ExtendedFrames[can_id] = self.ExtendedFrames.get(can_id, 0) + 1
+        self.DecodeCounts[ns.bit_length()] += 1
+        self.DecodeSum += ns
+
+    def Drain(self, frames):
+        self.Drains.Observe(frames)
+
+    def Status(self, operation, status):
+        """
+        A non OK PCAN-Basic status of an operation ('read', 'write')
+        """
+        key = (operation, status)
+        self.Statuses[key] = self.Statuses.get(key, 0) + 1
+
+    def FrameCounts(self):
+        """
+        [(CAN ID, frames), ...] of the received CAN IDs
+        """
+        counts = [(can_id, count) for can_id, count in enumerate(self.Frames.tolist()) if count]
+        return counts + sorted(list(self.ExtendedFrames.items()))
+
+    def DecodeCumulative(self):
+        """
+        [(le in s, cumulative count), ...] of the exposed decode buckets, ending with +Inf
+        """
+        counts = self.DecodeCounts.tolist()
+        buckets = []
+        for bits in NS_EXPOSED:
+            buckets.append((((1 << bits) - 1) / 1e9, sum(counts[:bits + 1])))
+        buckets.append(('+Inf', sum(counts)))
+        return buckets
+
+
+class PcanMetrics():
+    """
+    Metrics of the modules of a process and of its periodic callbacks
+    """
+    def __init__(self):
+        self.Modules = []
+        self.Callbacks = {}  # name -> [scheduled interval, previous call (perf_counter), lag Histogram, last interval]
+
+    def Attach(self, name, pcan_rw):
+        """
+        Measure a PcanRW object (its Metrics attribute set), named module name
+        """
+        module = ModuleMetrics(name, pcan_rw)
+        pcan_rw.Metrics = module
+        self.Modules.append(module)
+        return module
+
+    def Callback(self, name, scheduled):
+        """
+        Call at each run of a periodic callback: its actual interval compared to the scheduled one (s)
+        """
+        now = time.perf_counter()
+        callback = self.Callbacks.get(name)
+        if callback is None:
+            self.Callbacks[name] = [scheduled, now, Histogram(LAG_BOUNDS), 0.0]
+            return
+        interval = now - callback[1]
+        callback[0] = scheduled
+        callback[1] = now
+        callback[2].Observe(interval - scheduled)
+        callback[3] = interval
+
+    def Exposition(self):
+        """
+        Text of all the metrics, Prometheus exposition format 0.0.4
+        """
+        lines = []
+
+        def family(name, kind, text):
+            lines.append('# HELP ' + name + ' ' + text)
+            lines.append('# TYPE ' + name + ' ' + kind)
+
+        def sample(name, labels, value):
+            lines.append(name + labels_text(labels) + ' ' + number_text(value))
+
+        def histogram(name, labels, buckets, total):
+            for bound, count in buckets:
+                sample(name + '_bucket', labels + [('le', bound)], count)
+            sample(name + '_sum', labels, total)
+            sample(name + '_count', labels, buckets[-1][1])
+
+        modules = [(module, [('module', module.Name), ('channel', hex(module.PcanRW.PcanHandle.value))])
+                   for module in self.Modules]
+
+        family('spet_frames_total', 'counter', 'Received frames per CAN ID')
+        for module, labels in modules:
+            for can_id, count in module.FrameCounts():
+                sample('spet_frames_total', labels + [('can_id', hex(can_id))], count)
+
+        family('spet_decode_seconds', 'histogram', 'PcanRW.ProcessMessageCan duration')
+        for module, labels in modules:
+            histogram('spet_decode_seconds', labels, module.DecodeCumulative(), module.DecodeSum / 1e9)
+
+        family('spet_drain_frames', 'histogram', 'Frames read per drain of the receive queue')
+        for module, labels in modules:
+            histogram('spet_drain_frames', labels, module.Drains.Cumulative(), module.Drains.Sum)
+
+        family('spet_pcan_status_total', 'counter', 'PCAN-Basic non OK statuses')
+        for module, labels in modules:
+            for (operation, status), count in sorted(list(module.Statuses.items())):
+                sample('spet_pcan_status_total', labels + [('operation', operation), ('code', hex(status))], count)
+
+        family('spet_ignored_frames_total', 'counter', 'Received frames neither decoded nor SDO')
+        for module, labels in modules:
+            sample('spet_ignored_frames_total', labels, module.PcanRW.IgnoredFrames)
+
+        family('spet_sdo_frames_total', 'counter', 'Received Leclanche SDO frames, not decoded')
+        for module, labels in modules:
+            sample('spet_sdo_frames_total', labels, module.PcanRW.SdoFrames)
+
+        family('spet_filtered_frames_total', 'counter', 'Frames dropped by the acceptance filter, simulator only')
+        for module, labels in modules:
+            filtered = module.PcanRW.FilteredFrames()
+            if filtered is not None:
+                sample('spet_filtered_frames_total', labels, filtered)
+
+        family('spet_queue_overruns_total', 'counter', 'Receive queue overruns, messages lost')
+        for module, labels in modules:
+            sample('spet_queue_overruns_total', labels, module.PcanRW.Overruns)
+
+        family('spet_queue_peak_ratio', 'gauge', 'Max fill of the receive queue seen at a drain')
+        for module, labels in modules:
+            sample('spet_queue_peak_ratio', labels, module.PcanRW.Poll.PeakFill())
+
+        family('spet_bus_load_ratio', 'gauge', 'Bus load estimate of the received frames')
+        for module, labels in modules:
+            sample('spet_bus_load_ratio', labels, module.PcanRW.BusLoad())
+
+        family('spet_poll_interval_seconds', 'gauge', 'Adaptive interval between two reads of the receive queue')
+        for module, labels in modules:
+            sample('spet_poll_interval_seconds', labels, module.PcanRW.Poll.Interval)
+
+        family('spet_callback_lag_seconds', 'histogram', 'Actual minus scheduled interval of the periodic callbacks')
+        for name, (scheduled, previous, lags, interval) in sorted(list(self.Callbacks.items())):
+            histogram('spet_callback_lag_seconds', [('callback', name)], lags.Cumulative(), lags.Sum)
+
+        family('spet_callback_interval_seconds', 'gauge', 'Last actual interval of the periodic callbacks')
+        for name, (scheduled, previous, lags, interval) in sorted(list(self.Callbacks.items())):
+            sample('spet_callback_interval_seconds', [('callback', name)], interval)
+
+        family('spet_callback_scheduled_seconds', 'gauge', 'Scheduled interval of the periodic callbacks')
+        for name, (scheduled, previous, lags, interval) in sorted(list(self.Callbacks.items())):
+            sample('spet_callback_scheduled_seconds', [('callback', name)], scheduled)
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(RequestHandler):
+    """
+    GET /metrics of the Tornado server (Bokeh Server extra_patterns), initialised with {'metrics': PcanMetrics}
+    """
+    def initialize(self, metrics):
+        self.Metrics = metrics
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(self.Metrics.Exposition())
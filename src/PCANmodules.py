@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Class PcanModules, the PcanRW objects of the SPET propulsion units, from a configuration (names and device IDs)
+
+Each module decodes its messages in its own reader thread (PCAN receive event), independently of the others.
+The modules without reader thread (no receive event: polling) are read in turns, at most ReadBurst messages
+each, so that a busy bus doesn't delay the others, and the caller polls them again after PollInterval s:
+shorter under backlog, longer when idle (PCAN_RW.PollSchedule of each module, within poll_bounds).
+Device IDs (1Hz) and message staleness (WatchdogPeriod) are checked module by module (each one with its own
+lock), and the periodic command message (0x200) of each module is sent in its own time slot of the period: the BMS
+of the modules are not activated at the same time (24V power supply, 3A peak per module).
+
+Usage:
+    modules = PcanModules(parse_modules("A=0x1,B=0x2,C=0x3,D=0x4"), pcan_basic, discovery)
+    modules.Start(time.time())
+    modules.Process(time.time())  # periodic call
+    snapshots = modules.Snapshots()
+
+@author: yvan
+"""
+
+import math
+
+from PCAN_RW import *
+
+DEFAULT_MODULES = "A=0x1,B=0x2"  # SPET modules A and B
+
+COMMAND_ID = 0x200
+DISCHARGE = (0, 0, 0, 0xFF, 0, 0, 0, 0)
+SAFE_SHUTDOWN = (0, 0xFF, 0, 0, 0, 0, 0, 0)
+
+
+def parse_modules(text):
+    """
+    "A=0x1,B=0x2" to [('A', 0x1), ('B', 0x2)], module names and device IDs (written on the PeakCAN-USB devices)
+    """
+    config = []
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        name, separator, device_id = item.partition("=")
+        if not separator or not name.strip():
+            raise ValueError("module " + repr(item) + " is not NAME=DEVICE_ID")
+        config.append((name.strip(), int(device_id, 0)))
+    if not config:
+        raise ValueError("no module in " + repr(text))
+    return config
+
+
+class PcanModules():
+    """
+    PcanRW objects of the configured modules, in the configuration (and dashboard) order
+    config = [(name, device ID), ...]
+    command_period = s between two command messages of a module
+    stagger = s between the first commands of two modules
+    first_slot, slots = command slot of the first module and slots number of the period, when the modules
+                        are shared between several PcanModules (one per process, PCANshared)
+    watchdog_period = ms between two staleness checks (PcanRW.CheckWatchdogs), added to the message timeouts
+                      in the fault detection latency
+    poll_bounds = (min, max) ms between two reads of a receive queue without receive event (reader thread, or
+                  caller of Process for the modules without reader thread)
+    """
+    def __init__(self, config, pcan_basic=None, discovery=None, command_period=12, stagger=3, first_slot=0,
+                 slots=None, watchdog_period=100, poll_bounds=POLL_BOUNDS):
+        self.Names = [name for name, device_id in config]
+        self.Modules = [PcanRW(device_id, pcan_basic, discovery) for name, device_id in config]
+        for module in self.Modules:
+            module.Poll = PollSchedule(poll_bounds[0] / 1000, poll_bounds[1] / 1000)
+        self.CommandPeriod = command_period
+        self.Stagger = stagger
+        self.FirstSlot = first_slot
+        self.Slots = len(self.Modules) if slots is None else slots
+        self.CommandDatas = [DISCHARGE] * len(self.Modules)  # command message of each module
+        self.ReadBurst = 256  # messages read from a module without reader thread before the next one
+        self.StartTime = 0
+        self.WatchdogPeriod = watchdog_period / 1000  # s
+        self.LastCheck = 0
+        self.LastWatchdogCheck = 0
+        self.NextCommand = [0] * len(self.Modules)
+
+    def __len__(self):
+        return len(self.Modules)
+
+    def __iter__(self):
+        return iter(self.Modules)
+
+    def Items(self):
+        """
+        {name: PcanRW}, in the configuration order
+        """
+        return dict(zip(self.Names, self.Modules))
+
+    def Start(self, now):
+        """
+        Start the reader threads, first command of each module Stagger s after the previous one
+        """
+        self.StartTime = now
+        self.LastCheck = now
+        self.LastWatchdogCheck = now
+        self.NextCommand = [now + (self.FirstSlot + index) * self.Stagger for index in range(len(self.Modules))]
+        for module in self.Modules:
+            module.StartReader()
+        self.SendCommands(now)
+
+    def Stop(self):
+        for module in self.Modules:
+            module.StopReader()
+
+    def Process(self, now):
+        """
+        Periodic call: device IDs checks (1Hz), staleness checks (WatchdogPeriod), reads of the modules without
+        reader thread, commands when due
+        """
+        if now - self.LastCheck > 1:
+            self.LastCheck = now
+            self.CheckDevices()
+        if now - self.LastWatchdogCheck >= self.WatchdogPeriod:
+            self.LastWatchdogCheck = now
+            self.CheckWatchdogs()
+        self.ReadPending()
+        self.SendCommands(now)
+
+    def CheckDevices(self):
+        """
+        PCAN ID check (connexion, correct device...)
+        On error: decoded values erased and error displayed, the module device initialised again
+                  (small "side effect" of a module on the others, all ok after 2 calls...)
+        """
+        for name, module in zip(self.Names, self.Modules):
+            try:
+                device_id = module.GetDeviceId()
+            except:
+                device_id = 0
+                print("PCAN ID " + str(hex(module.PcanId)) + " error on module " + name)
+            if device_id != module.PcanId:
+                with module.Lock:
+                    module.UnsetDevice()
+                    module.TryToSetDevice()
+
+    def CheckWatchdogs(self):
+        """
+        Staleness control of each module (PcanRW.CheckWatchdogs), not while one of its messages is decoded
+        """
+        for module in self.Modules:
+            with module.Lock:
+                module.CheckWatchdogs()
+
+    def ReadPending(self):
+        """
+        Read the modules without reader thread until empty buffers (max 32768 messages in the driver queue),
+        in turns of at most ReadBurst messages (read on after an overrun)
+        """
+        polled = [index for index, module in enumerate(self.Modules) if module.Reader is None and module.m_DLLFound]
+        frames = [0] * len(self.Modules)
+        overruns = [module.Overruns for module in self.Modules]
+        pending = polled
+        while pending:
+            remaining = []
+            for index in pending:
+                for _ in range(self.ReadBurst):
+                    status = self.ReadModule(index)
+                    if status == 3:
+                        continue
+                    if status != 0:
+                        break
+                    frames[index] += 1
+                if status in (0, 3):
+                    remaining.append(index)
+            pending = remaining
+        for index in polled:
+            module = self.Modules[index]
+            module.Drained(frames[index], module.Overruns != overruns[index])
+
+    def PollInterval(self, default):
+        """
+        s until the next call of Process: the shortest adaptive interval of the modules without reader thread,
+        at most WatchdogPeriod (staleness checks), default (s) when they all have one
+        """
+        intervals = [module.Poll.Interval for module in self.Modules if module.Reader is None and module.m_DLLFound]
+        return min(min(intervals), self.WatchdogPeriod) if intervals else default
+
+    def ReadModule(self, index):
+        """
+        Read one message of a module: 0 ok, 1 empty buffer, 2 error, 3 messages lost (receive queue overrun)
+        """
+        module = self.Modules[index]
+        try:
+            status = module.ReadMessage()
+        except:
+            print("CAN read error on module " + self.Names[index])
+            return 2
+
+        if status == PCAN_ERROR_OK:
+            return 0
+        elif status == PCAN_ERROR_QRCVEMPTY:
+            return 1
+        elif status & PCAN_ERROR_QOVERRUN:
+            return 3
+        else:
+            print("PCAN_ERROR " + str(hex(status)))
+            return 2
+
+    def SendCommands(self, now):
+        for index in range(len(self.Modules)):
+            if now >= self.NextCommand[index]:
+                self.SendCommand(index)
+                self.NextCommand[index] = self.NextSlot(index, now)
+
+    def NextSlot(self, index, now):
+        """
+        Next command time of a module: its slot of the period (modules evenly spread from the start time),
+        at least half a period after now, without drift from the execution times
+        """
+        phase = self.StartTime + (self.FirstSlot + index) * self.CommandPeriod / self.Slots
+        slot = phase + (math.floor((now - phase) / self.CommandPeriod) + 1) * self.CommandPeriod
+        if slot - now < self.CommandPeriod / 2:
+            slot += self.CommandPeriod
+        return slot
+
+    def SendCommand(self, index):
+        """
+        CAN bus sent command message of a module, first check ID
+        """
+        module = self.Modules[index]
+        name = self.Names[index]
+        try:
+            module.GetDeviceId()
+        except:
+            print("PCAN ID " + str(hex(module.PcanId)) + " error for module " + name)
+            return
+
+        datas = tuple(self.CommandDatas[index])
+        print("sent bytes on module " + name + ", can id " + hex(COMMAND_ID) + ": " + str(datas))
+        try:
+            module.WriteMessage(COMMAND_ID, datas)
+        except:
+            print("CAN sent error on module " + name)
+
+    def Snapshots(self):
+        """
+        Consistent copies of the decoded values of the modules (PcanRW.Snapshot), in the configuration order
+        """
+        return [module.Snapshot() for module in self.Modules]
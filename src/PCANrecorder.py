@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Class PcanRecorder, append-only recording of the raw received CAN frames (all buses) to memory-mapped segment files
+
+Each segment is a fixed-size file: a header, then fixed-size records.
+Record: hardware timestamp (µs, TPCANTimestamp), CAN ID, device identifier (0x1, 0x2 for modules A, B, 32 bits),
+DLC, message type and the 8 data bytes (the first segments, SPETCAN1, had a one byte device identifier: still read).
+The header holds the number of valid records, updated after each record, so that a segment is readable while
+written or after a crash.
+
+Records are written in place in the mapped file (no allocation, no system call per frame), the kernel writes
+the pages back to the disk. When the current segment is full, the recording goes on in the next one, created and
+mapped in advance by a housekeeping thread, which also closes the full segments and deletes the oldest ones beyond
+the retention size: the reader threads never wait for the file system.
+
+@author: yvan
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+SEGMENT_MAGIC = b'SPETCAN2'
+SEGMENT_SUFFIX = '.can'
+SEGMENT_HEADER = struct.Struct('<8sHHIdQ')  # magic, header size, record size, sequence number, creation time (s), records
+SEGMENT_HEADER_SIZE = 64
+SEGMENT_COUNT = struct.Struct('<Q')  # records number, at the end of the header structure
+SEGMENT_COUNT_OFFSET = SEGMENT_HEADER.size - SEGMENT_COUNT.size
+SEGMENT_CREATED = struct.Struct('<d')  # creation time, before the records number
+SEGMENT_CREATED_OFFSET = SEGMENT_COUNT_OFFSET - SEGMENT_CREATED.size
+RECORD = struct.Struct('<QIIBB2x8s')  # timestamp (µs), CAN ID, device identifier, DLC, message type, data
+RECORD_SIZE = RECORD.size  # 28 bytes
+RECORD_KEY = struct.Struct('<QII' + str(RECORD_SIZE - 16) + 'x')  # timestamp, CAN ID and device of a record
+# Records of the SPETCAN1 segments, device identifier on one byte
+RECORD_V1 = struct.Struct('<QIBBBx8s')
+RECORD_V1_KEY = struct.Struct('<QIB' + str(RECORD_V1.size - 13) + 'x')
+RECORD_FORMATS = {SEGMENT_MAGIC: (RECORD, RECORD_KEY), b'SPETCAN1': (RECORD_V1, RECORD_V1_KEY)}  # magic -> structures
+
+
+def segment_name(sequence, created):
+    return 'spet_' + time.strftime('%Y%m%d_%H%M%S', time.localtime(created)) + '_' + '%06d' % sequence + SEGMENT_SUFFIX
+
+
+def segment_sequence(name):
+    """
+    Sequence number of a segment file name, None if it isn't a segment
+    """
+    if not (name.startswith('spet_') and name.endswith(SEGMENT_SUFFIX)):
+        return None
+    try:
+        return int(name[:-len(SEGMENT_SUFFIX)].rsplit('_', 1)[1])
+    except ValueError:
+        return None
+
+
+def list_segments(directory):
+    """
+    Segment files of directory, in recording order
+    """
+    segments = []
+    for name in os.listdir(directory):
+        sequence = segment_sequence(name)
+        if sequence is not None:
+            segments.append((sequence, os.path.join(directory, name)))
+    return [path for sequence, path in sorted(segments)]
+
+
+def read_header(buffer):
+    """
+    Returns (sequence, creation time, records number) of a segment buffer (bytes, mmap...)
+    """
+    magic, header_size, record_size, sequence, created, count = SEGMENT_HEADER.unpack_from(buffer)
+    if magic not in RECORD_FORMATS or header_size != SEGMENT_HEADER_SIZE or \
+            record_size != RECORD_FORMATS[magic][0].size:
+        raise ValueError("not a SPET CAN segment")
+    return sequence, created, count
+
+
+def record_structures(buffer):
+    """
+    (record, record key) structures of the records of a segment buffer (checked by read_header)
+    """
+    return RECORD_FORMATS[SEGMENT_HEADER.unpack_from(buffer)[0]]
+
+
+def read_segment(path):
+    """
+    Yields the records of a segment file as tuples (timestamp µs, CAN ID, device identifier, DLC, message type, data)
+    """
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            sequence, created, count = read_header(buffer)
+            record = record_structures(buffer)[0]
+            count = min(count, (len(buffer) - SEGMENT_HEADER_SIZE) // record.size)
+            for fields in record.iter_unpack(buffer[SEGMENT_HEADER_SIZE:SEGMENT_HEADER_SIZE + count * record.size]):
+                yield fields
+
+
+class PcanRecorder():
+    """
+    Recorder shared by the PcanRW objects: PcanRW.Recorder = recorder, then each processed frame is recorded
+    """
+
+    def __init__(self, directory, segment_size=64 * 1024 * 1024, retention_size=4 * 1024 * 1024 * 1024):
+        """
+        directory = segment files directory (created if needed)
+        segment_size = bytes, size of each segment file
+        retention_size = bytes, the oldest segments are deleted beyond this total size (0 = no deletion),
+                         the next segment allocated in advance not included
+        """
+        self.Directory = directory
+        self.RecordsPerSegment = max(1, (segment_size - SEGMENT_HEADER_SIZE) // RECORD_SIZE)
+        self.SegmentSize = SEGMENT_HEADER_SIZE + self.RecordsPerSegment * RECORD_SIZE
+        self.RetentionSize = retention_size
+        self.Lock = threading.Lock()  # both modules reader threads record in the same segment
+        self.SequenceLock = threading.Lock()  # segments created by the housekeeping thread, or late by a reader
+        self.File = None
+        self.Map = None
+        self.Offset = 0
+        self.Count = 0
+        self.RecordsNumber = 0  # since creation
+        self.DeletedSegments = 0
+        self.LateSegments = 0  # segments created by a reader thread, the next one not ready in time
+        self.Current = 0  # sequence number of the current segment
+        self.Next = None  # (path, file, map, sequence number) of the next segment, created in advance
+        self.Full = []  # (file, map) of the full segments, closed by the housekeeping thread
+        self.Wake = threading.Event()
+        self.Running = True
+
+        os.makedirs(directory, exist_ok=True)
+        self.Segments = list_segments(directory)
+        self.Sequence = segment_sequence(os.path.basename(self.Segments[-1])) if self.Segments else 0
+        self.StartSegment(self.CreateSegment())
+        self.Housekeeper = threading.Thread(target=self.Housekeeping, name="PcanRecorder", daemon=True)
+        self.Housekeeper.start()
+
+    def __del__(self):
+        self.Close()
+
+    def CreateSegment(self):
+        """
+        Next segment file (size allocated at once, sparse file) and its map, header without record
+        File name with the creation time, header creation time set again when the recording starts in it
+        """
+        with self.SequenceLock:
+            self.Sequence += 1
+            sequence = self.Sequence
+        created = time.time()
+        path = os.path.join(self.Directory, segment_name(sequence, created))
+        file = open(path, 'w+b')
+        file.truncate(self.SegmentSize)
+        segment_map = mmap.mmap(file.fileno(), self.SegmentSize)
+        SEGMENT_HEADER.pack_into(segment_map, 0, SEGMENT_MAGIC, SEGMENT_HEADER_SIZE, RECORD_SIZE, sequence, created, 0)
+        return path, file, segment_map, sequence
+
+    def StartSegment(self, segment):
+        """
+        Record in segment from now on (lock held, or at creation), the full one closed by the housekeeping thread
+        """
+        if self.Map is not None:
+            self.Full.append((self.File, self.Map))
+        path, self.File, self.Map, self.Current = segment
+        SEGMENT_CREATED.pack_into(self.Map, SEGMENT_CREATED_OFFSET, time.time())
+        self.Offset = SEGMENT_HEADER_SIZE
+        self.Count = 0
+        self.Segments.append(path)
+        self.Wake.set()
+
+    def Housekeeping(self):
+        """
+        Housekeeping thread: next segment created in advance, full segments closed, retention
+        """
+        while self.Running:
+            self.Wake.wait(1)
+            self.Wake.clear()
+            with self.Lock:
+                full, self.Full = self.Full, []
+                prepare = self.Running and self.Next is None
+            for file, segment_map in full:
+                segment_map.close()
+                file.close()
+            if prepare:
+                try:
+                    segment = self.CreateSegment()
+                except OSError:
+                    print("recorder: segment creation error in " + self.Directory)
+                    continue
+                with self.Lock:
+                    if self.Running and segment[3] > self.Current:
+                        self.Next = segment
+                        segment = None
+                if segment is not None:  # closed, or a later one created by a reader thread meanwhile
+                    self.DiscardSegment(segment)
+                    self.Wake.set()
+            self.Retention()
+
+    def DiscardSegment(self, segment):
+        """
+        Close and delete a segment created in advance, without record
+        """
+        path, file, segment_map, sequence = segment
+        segment_map.close()
+        file.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def Retention(self):
+        """
+        Delete the oldest segments (not the current one) beyond the retention size
+        """
+        if self.RetentionSize <= 0:
+            return
+        removed = []
+        with self.Lock:
+            while len(self.Segments) > 1 and len(self.Segments) * self.SegmentSize > self.RetentionSize:
+                removed.append(self.Segments.pop(0))
+        for path in removed:
+            try:
+                os.remove(path)
+                self.DeletedSegments += 1
+                if os.path.exists(path + '.idx'):  # PCANlog indexes
+                    os.remove(path + '.idx')
+            except OSError:
+                pass
+
+    def Record(self, timestamp, device_id, can_id, dlc, msgtype, datas):
+        """
+        Append a frame to the current segment
+
+        Parameters:
+            timestamp = µs, from TPCANTimestamp
+            device_id = PCAN device identifier of the bus
+            can_id, dlc, msgtype = TPCANMsg fields
+            datas = 8 data bytes (bytes or bytearray)
+        """
+        with self.Lock:
+            if self.Map is None:
+                return
+            if self.Count >= self.RecordsPerSegment:
+                if self.Next is None:  # housekeeping thread late
+                    self.LateSegments += 1
+                    self.Next = self.CreateSegment()
+                self.StartSegment(self.Next)
+                self.Next = None
+            RECORD.pack_into(self.Map, self.Offset, timestamp, can_id, device_id, dlc, msgtype, datas)
+            self.Offset += RECORD_SIZE
+            self.Count += 1
+            SEGMENT_COUNT.pack_into(self.Map, SEGMENT_COUNT_OFFSET, self.Count)
+            self.RecordsNumber += 1
+
+    def Flush(self):
+        """
+        Write the modified pages back to the disk now (blocking, not to call from the reader thread)
+        """
+        with self.Lock:
+            if self.Map is not None:
+                self.Map.flush()
+
+    def Close(self):
+        """
+        Stop the housekeeping thread and close the segments (the one created in advance deleted)
+        """
+        self.Running = False
+        self.Wake.set()
+        housekeeper = getattr(self, 'Housekeeper', None)
+        if housekeeper is not None and housekeeper is not threading.current_thread():
+            housekeeper.join()
+        with self.Lock:
+            if self.Map is not None:
+                self.Map.flush()
+                self.Full.append((self.File, self.Map))
+                self.File = None
+                self.Map = None
+            full, self.Full = self.Full, []
+            segment, self.Next = self.Next, None
+        for file, segment_map in full:
+            segment_map.close()
+            file.close()
+        if segment is not None:
+            self.DiscardSegment(segment)
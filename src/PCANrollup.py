@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Class PcanRollups, multi-resolution rollups (min, max, mean, count per time bucket) of the decoded values
+of a PcanRW object, for long sessions trends (PcanRW.Rollups = rollups)
+
+Each decoded sample only updates the running min/max/sum of the current finest bucket (1 s), a closed bucket
+is written in its ring and folded in the next resolution bucket (10 s, then 1 min): O(1) per sample.
+Buckets are aligned on multiples of their resolution (PcanRW.ReceivedTimestamp, s), without samples no bucket.
+
+The rings of a CAN ID are allocated at its first frame, with the kept duration of each resolution
+(about 1 kB per kept bucket of all the CAN IDs of a module, 6 BAT, 9 DRIVE, 3 per MPPT: 20 MB by default).
+
+Usage:
+    spet_a.Rollups = PcanRollups()
+    times, mins, maxs, means, counts = spet_a.Rollups.Rollup('BAT_SOC', start, end, max_points=2000)
+
+@author: yvan
+"""
+
+import math
+
+import numpy as np
+
+from PCAN_RW import STATE
+from PCANhistory import signal_names
+
+# (bucket duration, kept duration) in s, from the finest resolution
+RESOLUTIONS = ((1, 30 * 60), (10, 6 * 3600), (60, 48 * 3600))
+
+
+class RollupRing():
+    """
+    Closed buckets of one CAN ID at one resolution
+    """
+    def __init__(self, resolution, capacity, signals):
+        self.Resolution = resolution
+        self.Capacity = capacity
+        self.Times = np.zeros(capacity)  # s, bucket start
+        self.Counts = np.zeros(capacity, dtype=np.int32)
+        self.Mins = np.zeros((capacity, signals), dtype=np.float32)
+        self.Maxs = np.zeros((capacity, signals), dtype=np.float32)
+        self.Means = np.zeros((capacity, signals), dtype=np.float32)
+        self.Count = 0  # written buckets since creation
+
+    def Write(self, start, count, mins, maxs, sums):
+        position = self.Count % self.Capacity
+        self.Times[position] = start
+        self.Counts[position] = count
+        self.Mins[position] = mins
+        self.Maxs[position] = maxs
+        self.Means[position] = [value / count for value in sums]
+        self.Count += 1
+
+    def First(self):
+        """
+        Start of the oldest kept bucket, None if none
+        """
+        if not self.Count:
+            return None
+        return self.Times[self.Count % self.Capacity if self.Count > self.Capacity else 0]
+
+    def Window(self, column, start=None, end=None):
+        """
+        Copies (times, mins, maxs, means, counts) of the kept buckets starting in [start, end[, oldest first
+        """
+        if self.Count <= self.Capacity:
+            order = slice(0, self.Count)
+            times = self.Times[order]
+        else:
+            order = np.roll(np.arange(self.Capacity), -(self.Count % self.Capacity))
+            times = self.Times[order]
+        first = 0 if start is None else np.searchsorted(times, start - self.Resolution, 'right')
+        stop = len(times) if end is None else np.searchsorted(times, end, 'left')
+        if isinstance(order, slice):
+            order = slice(first, stop)
+        else:
+            order = order[first:stop]
+        return (self.Times[order].copy(), self.Mins[order, column].astype(float), self.Maxs[order, column].astype(float),
+                self.Means[order, column].astype(float), self.Counts[order].copy())
+
+
+class Bucket():
+    """
+    Bucket being filled at one resolution: running count, min, max and sum of each signal
+    """
+    def __init__(self, signals):
+        self.Start = -math.inf
+        self.End = -math.inf
+        self.Count = 0
+        self.Mins = [math.inf] * signals
+        self.Maxs = [-math.inf] * signals
+        self.Sums = [0.0] * signals
+
+    def Reset(self, start, resolution):
+        self.Start = start
+        self.End = start + resolution
+        self.Count = 0
+        signals = len(self.Sums)
+        self.Mins[:] = [math.inf] * signals  # in place, lists bound in the generated add function
+        self.Maxs[:] = [-math.inf] * signals
+        self.Sums[:] = [0.0] * signals
+
+
+class RollupGroup():
+    """
+    Rollups of the signals of one CAN ID at all the resolutions
+    """
+    def __init__(self, can_id, resolutions):
+        self.CanId = can_id
+        self.Names = signal_names(can_id)
+        self.Resolutions = [resolution for resolution, kept in resolutions]
+        self.Rings = [RollupRing(resolution, max(1, int(kept // resolution)), len(self.Names))
+                      for resolution, kept in resolutions]
+        self.Buckets = [Bucket(len(self.Names)) for resolution in self.Resolutions]
+        self.add = self.compile()
+
+    def compile(self):
+        """
+        Generate the add function add(pcan_rw, timestamp) of this CAN ID (same principle as FrameLayout):
+        the finest bucket updated with straight comparisons
+        """
+        lines = ['def add(rw, t):',  # late samples in the current bucket, except after a timestamps reset
+                 '    if t >= bucket.End or t < bucket.Start - ' + str(self.Resolutions[-1]) + ':',
+                 '        group.Close(t)']
+        for i, name in enumerate(self.Names):
+            lines += ['    v = ' + STATE.Expression(name),
+                      '    if v < mins[' + str(i) + ']: mins[' + str(i) + '] = v',
+                      '    if v > maxs[' + str(i) + ']: maxs[' + str(i) + '] = v',
+                      '    sums[' + str(i) + '] += v']
+        lines.append('    bucket.Count += 1')
+        bucket = self.Buckets[0]
+        namespace = {'group': self, 'bucket': bucket, 'mins': bucket.Mins, 'maxs': bucket.Maxs, 'sums': bucket.Sums}
+        exec('\n'.join(lines), namespace)
+        return namespace['add']
+
+    def Close(self, t):
+        """
+        Write the finest bucket, fold it in the coarser ones, and start the bucket of t
+        """
+        self.Fold(0, t)
+        resolution = self.Resolutions[0]
+        self.Buckets[0].Reset(math.floor(t / resolution) * resolution, resolution)
+
+    def Fold(self, level, t):
+        """
+        Write the bucket of level, and add it to the bucket of the next level (closed first if t is beyond it)
+        """
+        bucket = self.Buckets[level]
+        if not bucket.Count:
+            return
+        self.Rings[level].Write(bucket.Start, bucket.Count, bucket.Mins, bucket.Maxs, bucket.Sums)
+        if level + 1 == len(self.Buckets):
+            return
+        upper = self.Buckets[level + 1]
+        resolution = self.Resolutions[level + 1]
+        start = math.floor(bucket.Start / resolution) * resolution
+        if start != upper.Start:
+            self.Fold(level + 1, t)
+            upper.Reset(start, resolution)
+        upper.Count += bucket.Count
+        for i in range(len(upper.Sums)):
+            upper.Mins[i] = min(upper.Mins[i], bucket.Mins[i])
+            upper.Maxs[i] = max(upper.Maxs[i], bucket.Maxs[i])
+            upper.Sums[i] += bucket.Sums[i]
+
+    def Current(self, level, column):
+        """
+        (start, min, max, mean, count) of the bucket being filled at level, with the not yet folded finer buckets,
+        None if empty
+        """
+        bucket = self.Buckets[level]
+        count, low, high, total = 0, math.inf, -math.inf, 0.0
+        for finer in self.Buckets[:level + 1]:
+            if finer.Count and finer.Start >= bucket.Start:
+                count += finer.Count
+                low = min(low, finer.Mins[column])
+                high = max(high, finer.Maxs[column])
+                total += finer.Sums[column]
+        if not count:
+            return None
+        return bucket.Start, low, high, total / count, count
+
+
+class PcanRollups():
+    """
+    Rollups of all the decoded signals of one PcanRW object
+    resolutions = ((bucket duration, kept duration), ...) in s, from the finest
+    """
+    def __init__(self, resolutions=RESOLUTIONS):
+        self.Resolutions = tuple(resolutions)
+        self.Groups = {}  # CAN ID -> RollupGroup, from its first frame
+        self.Adders = {}
+        self.Columns = {}  # signal name -> (RollupGroup, column)
+
+    def Append(self, pcan_rw):
+        """
+        Adds the decoded values of the last processed frame (called by PcanRW.ProcessMessageCan)
+        """
+        add = self.Adders.get(pcan_rw.ReceivedId)
+        if add is None:
+            group = self.Groups[pcan_rw.ReceivedId] = RollupGroup(pcan_rw.ReceivedId, self.Resolutions)
+            add = self.Adders[pcan_rw.ReceivedId] = group.add
+            for column, name in enumerate(group.Names):
+                self.Columns[name] = (group, column)
+        add(pcan_rw, pcan_rw.ReceivedTimestamp)
+
+    def Column(self, name):
+        """
+        (RollupGroup, column) of a signal name, (None, None) before its first frame
+        """
+        return self.Columns.get(name, (None, None))
+
+    def Select(self, name, start=None, end=None, max_points=4000):
+        """
+        Resolution level to show a signal from start to end (s, None = oldest kept, latest):
+        the finest one still keeping start, with at most max_points buckets, else the coarsest
+        """
+        group, column = self.Column(name)
+        if group is None:
+            return len(self.Resolutions) - 1
+        for level, ring in enumerate(group.Rings):
+            first = ring.First()
+            if first is None:
+                return level  # less than one bucket of this resolution
+            kept = start is None or start >= first or ring.Count <= ring.Capacity  # nothing of the range dropped
+            low = first if start is None else max(start, first)
+            high = group.Buckets[level].End if end is None else min(end, group.Buckets[level].End)
+            if kept and (high - low) / ring.Resolution <= max_points:
+                return level
+        return len(self.Resolutions) - 1
+
+    def Rollup(self, name, start=None, end=None, level=None, max_points=4000):
+        """
+        Arrays (bucket start times, mins, maxs, means, counts) of a signal from start to end (s, None = all kept),
+        the bucket being filled included, at level (index in resolutions, default selected with max_points)
+        """
+        group, column = self.Column(name)
+        if group is None:
+            empty = np.zeros(0)
+            return empty, empty, empty, empty, np.zeros(0, dtype=np.int32)
+        if level is None:
+            level = self.Select(name, start, end, max_points)
+        times, mins, maxs, means, counts = group.Rings[level].Window(column, start, end)
+        current = group.Current(level, column)
+        if current is not None and (end is None or current[0] < end):
+            times, mins, maxs, means, counts = (np.append(array, value) for array, value in
+                                                zip((times, mins, maxs, means, counts), current))
+        return times, mins, maxs, means, counts
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Class PcanSharedModules, the modules of PCANmodules acquired in their own processes: each process reads, decodes
+and checks one module (own interpreter and GIL) and publishes its decoded values in a shared memory block,
+the user interface process only maps the blocks and reads them. Decoding bursts no longer slow the display,
+and the modules are decoded on several cores.
+
+The block has a fixed layout (SharedLayout): a header (sequence, writes number, write time), then the decoded
+values: the PcanRW state arrays (integers and floats, copied as they are) and the status texts.
+Writes are protected by a sequence lock: the writer makes the sequence odd, packs the values, then makes it even
+again; a reader copies the values between two reads of the same even sequence, else tries again.
+The writer never waits for the readers.
+
+The histories and rollups (diagnostic tab) stay in the acquisition processes, the records are written in a
+sub-directory per module, the alarm journals in a file per module.
+
+Usage:
+    modules = PcanSharedModules(parse_modules("A=0x1,B=0x2"), partial(PCANBasicSim, rate=2))
+    modules.Start(time.time())
+    snapshots = modules.Snapshots()
+or run spetUI.py with the SPET_PROCESSES environment variable set.
+
+@author: yvan
+"""
+
+import atexit
+import multiprocessing
+import os
+import struct
+import time
+from array import array
+from multiprocessing import shared_memory
+
+from PCAN_RW import *
+from PCANdiscovery import PcanDiscovery
+from PCANmodules import PcanModules
+
+HEADER = struct.Struct('<QQd')  # sequence (odd while written), writes number, write time (time.time())
+TEXT_SIZE = 96  # bytes of the status texts (utf-8, truncated)
+
+
+def template_module():
+    """
+    PcanRW object without device, values of the Init functions
+    """
+    template = PcanRW.__new__(PcanRW)
+    template.Reader = None
+    template.NewState()
+    template.LeclancheInit()
+    template.MpptInit()
+    template.DriveInit()
+    return template
+
+
+class SharedLayout():
+    """
+    Fixed layout of the decoded values of a module: the bytes of the state arrays (PCAN_RW STATE), then the status
+    texts (TEXT_SIZE bytes each)
+    """
+    def __init__(self):
+        template = template_module()
+        self.Defaults = (template.Integers, template.Floats, {name: getattr(template, name) for name in STATE.Texts})
+        self.IntegersBytes = len(template.Integers) * template.Integers.itemsize
+        self.FloatsBytes = len(template.Floats) * template.Floats.itemsize
+        self.Texts = tuple(STATE.Texts)
+        self.TextsStruct = struct.Struct('<' + (str(TEXT_SIZE) + 's') * len(self.Texts))
+        self.Size = self.IntegersBytes + self.FloatsBytes + self.TextsStruct.size
+
+    def write(self, rw, buffer, offset):
+        """
+        Copy the decoded values of rw in buffer at offset
+        """
+        floats = offset + self.IntegersBytes
+        texts = floats + self.FloatsBytes
+        buffer[offset:floats] = memoryview(rw.Integers).cast('B')
+        buffer[floats:texts] = memoryview(rw.Floats).cast('B')
+        self.TextsStruct.pack_into(buffer, texts, *[getattr(rw, name).encode() for name in self.Texts])
+
+    def read(self, data):
+        """
+        PcanSnapshot of the decoded values copied from a block (bytes of Size)
+        """
+        integers = array('q')
+        integers.frombytes(data[:self.IntegersBytes])
+        floats = array('d')
+        floats.frombytes(data[self.IntegersBytes:self.IntegersBytes + self.FloatsBytes])
+        texts = self.TextsStruct.unpack_from(data, self.IntegersBytes + self.FloatsBytes)
+        return PcanSnapshot(integers, floats, {name: text.rstrip(b'\0').decode('utf-8', 'ignore')
+                                               for name, text in zip(self.Texts, texts)})
+
+    def default(self):
+        """
+        PcanSnapshot of the Init values
+        """
+        integers, floats, texts = self.Defaults
+        return PcanSnapshot(integers[:], floats[:], dict(texts))
+
+
+class SharedBlock():
+    """
+    Shared memory block of one module: header then values (SharedLayout), created by the user interface process
+    (name None), mapped by name in the acquisition process
+    """
+    def __init__(self, layout, name=None):
+        self.Layout = layout
+        self.Size = HEADER.size + layout.Size
+        self.Owner = name is None
+        if self.Owner:
+            self.Memory = shared_memory.SharedMemory(create=True, size=self.Size)
+            HEADER.pack_into(self.Memory.buf, 0, 0, 0, 0)
+        else:
+            self.Memory = shared_memory.SharedMemory(name=name)
+        self.Name = self.Memory.name
+        self.Buffer = self.Memory.buf
+        sequence, self.Writes, written = HEADER.unpack_from(self.Buffer, 0)
+        self.Sequence = sequence + (sequence & 1)  # even, after a writer stopped while writing
+        self.Last = None  # (values, writes number, write time) of the last consistent read
+
+    def Write(self, rw):
+        """
+        Publish the decoded values of rw (its lock held and its status updated by the caller)
+        """
+        self.Sequence += 1
+        HEADER.pack_into(self.Buffer, 0, self.Sequence, self.Writes, time.time())
+        self.Layout.write(rw, self.Buffer, HEADER.size)
+        self.Sequence += 1
+        self.Writes += 1
+        HEADER.pack_into(self.Buffer, 0, self.Sequence, self.Writes, time.time())
+
+    def Read(self, retries=1000):
+        """
+        (PcanSnapshot, writes number, write time) of a consistent copy, the last one read if no write completed
+        during the retries, None before the first write
+        """
+        for _ in range(retries):
+            sequence, writes, written = HEADER.unpack_from(self.Buffer, 0)
+            if sequence & 1:
+                time.sleep(0)
+                continue
+            data = self.Buffer[HEADER.size:self.Size].tobytes()  # one copy, decoded after the check
+            if HEADER.unpack_from(self.Buffer, 0)[0] == sequence:
+                if writes:
+                    self.Last = (self.Layout.read(data), writes, written)
+                return self.Last
+        return self.Last
+
+    def Close(self):
+        if self.Buffer is None:
+            return
+        self.Buffer = None
+        self.Memory.close()
+        if self.Owner:
+            self.Memory.unlink()
+
+
+def module_process(block_name, config, index, start_time, api_factory, discovery_path, record_directory, period,
+                   stop, alarm_path=None, poll_bounds=POLL_BOUNDS):
+    """
+    Acquisition process of the module config[index]: its PcanModules, the decoded values published every period s
+    (or sooner, adaptive poll interval without receive event) until stop (shared flag) is set
+    """
+    pcan_basic = None if api_factory is None else api_factory()
+    modules = PcanModules([config[index]], pcan_basic, PcanDiscovery(pcan_basic, discovery_path),
+                          first_slot=index, slots=len(config), poll_bounds=poll_bounds)
+    module = modules.Modules[0]
+    if record_directory is not None:
+        from PCANrecorder import PcanRecorder
+        module.Recorder = PcanRecorder(os.path.join(record_directory, config[index][0]))
+    journal = None
+    if alarm_path is not None:
+        from PCANalarms import AlarmJournal, PcanAlarms, module_journal_path
+        journal = AlarmJournal(module_journal_path(alarm_path, config[index][0]))
+        module.Alarms = PcanAlarms(journal, config[index][0])
+    block = SharedBlock(SharedLayout(), block_name)
+    modules.Start(start_time)
+    try:
+        while not stop.value:
+            modules.Process(time.time())
+            with module.Lock:
+                module.UpdateStatus()
+                block.Write(module)
+            time.sleep(min(period, modules.PollInterval(period)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        modules.Stop()
+        block.Close()
+        if journal is not None:
+            journal.Close()
+        if module.Recorder is not None:
+            module.Recorder.Close()
+
+
+class PcanSharedModules():
+    """
+    Same use as PcanModules for the user interface, each module acquired in its own process
+    config = [(name, device ID), ...]
+    api_factory = PCAN-Basic API object constructor of the processes (class, or functools.partial of a class),
+                  None for PCANBasic()
+    discovery_path = PcanDiscovery map file, None in memory only
+    record_directory = PcanRecorder directory, one sub-directory per module, None without records
+    period = s between two publications of the decoded values
+    alarm_path = PCANalarms journal file, one per module (alarms_A.csv...), None without alarm journal
+    poll_bounds = (min, max) ms between two reads of a receive queue without receive event (PcanModules)
+    """
+    def __init__(self, config, api_factory=None, discovery_path=None, record_directory=None, period=0.05,
+                 alarm_path=None, poll_bounds=POLL_BOUNDS):
+        self.Config = list(config)
+        self.Names = [name for name, device_id in self.Config]
+        self.ApiFactory = api_factory
+        self.DiscoveryPath = discovery_path
+        self.RecordDirectory = record_directory
+        self.Period = period
+        self.AlarmPath = alarm_path
+        self.PollBounds = poll_bounds
+        self.Layout = SharedLayout()
+        self.Blocks = [SharedBlock(self.Layout) for _ in self.Config]
+        self.Context = multiprocessing.get_context('spawn')  # as on Windows, no fork of the running threads
+        self.StopFlag = self.Context.RawValue('b', 0)  # no lock: a killed process can't leave it locked
+        self.Processes = [None] * len(self.Config)
+        self.StartTime = 0
+        self.Restarts = 0
+
+    def __len__(self):
+        return len(self.Config)
+
+    def Start(self, now):
+        self.StartTime = now
+        for index in range(len(self.Config)):
+            self.StartProcess(index)
+        atexit.register(self.Stop)
+
+    def StartProcess(self, index):
+        process = self.Context.Process(target=module_process, name="SPET module " + self.Names[index], daemon=True,
+                                       args=(self.Blocks[index].Name, self.Config, index, self.StartTime,
+                                             self.ApiFactory, self.DiscoveryPath, self.RecordDirectory, self.Period,
+                                             self.StopFlag, self.AlarmPath, self.PollBounds))
+        process.start()
+        self.Processes[index] = process
+
+    def Process(self, now):
+        """
+        Periodic call: restart the stopped acquisition processes (same command slots)
+        """
+        if self.StopFlag.value:
+            return
+        for index, process in enumerate(self.Processes):
+            if process is not None and not process.is_alive():
+                print("acquisition process of module " + self.Names[index] + " stopped (" + str(process.exitcode) +
+                      "), restarted")
+                self.Restarts += 1
+                self.StartProcess(index)
+
+    def Snapshots(self):
+        """
+        Consistent copies of the decoded values of the modules, in the configuration order
+        (Init values before the first publication)
+        """
+        snapshots = []
+        for block in self.Blocks:
+            published = block.Read()
+            snapshots.append(self.Layout.default() if published is None else published[0])
+        return snapshots
+
+    def Ages(self, now):
+        """
+        s since the last publication of each module, None before the first one
+        """
+        ages = []
+        for block in self.Blocks:
+            sequence, writes, written = HEADER.unpack_from(block.Buffer, 0)
+            ages.append(now - written if writes else None)
+        return ages
+
+    def Stop(self):
+        if self.StopFlag.value:
+            return
+        self.StopFlag.value = 1
+        for process in self.Processes:
+            if process is not None:
+                process.join(2)
+                if process.is_alive():
+                    process.terminate()
+        for block in self.Blocks:
+            block.Close()
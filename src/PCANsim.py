@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Class PCANBasicSim, drop-in replacement of PCANBasic (PCANlib.py) without PEAK hardware nor libpcanbasic.so
+
+Simulated PCAN-USB channels, each one with a device ID, generate the SPET project traffic:
+Leclanché battery tpdo_1...tpdo_6, MPPT converters (3 messages each from 0x155) and motor drive 0x1AA...0x1B2,
+encoded with the PCAN_RW frame layouts, at configurable rates, with drive bursts and injected faults.
+Other CAN IDs can be added, as sent by the other devices of a shared vehicle bus.
+
+Messages are produced lazily at Read calls, with the timestamps they would have had on the bus,
+into a receive queue of the driver size (32768 messages, PCAN_ERROR_QOVERRUN when read too late).
+
+Usage:
+    pcan_basic = PCANBasicSim(rate=10, faults=[SimFault('bat_error', start=30, duration=5, value=13)])
+    spet_a = PcanRW(0x1, pcan_basic)
+or run spetUI.py with the SPET_SIMULATION environment variable set.
+
+@author: yvan
+"""
+
+import math
+import random
+import time
+from collections import deque
+
+from PCANlib import *
+from PCAN_RW import FRAME_LAYOUTS, LECLANCHE_LAYOUTS, DRIVE_LAYOUTS, MPPT_FIRST_ID, value_of, field_codes
+
+
+# Raw ranges of the integer struct codes, values are clamped before packing
+CODE_RANGES = {'B': (0, 0xFF), 'b': (-0x80, 0x7F), 'H': (0, 0xFFFF), 'h': (-0x8000, 0x7FFF), 'I': (0, 0xFFFFFFFF),
+               'i': (-0x80000000, 0x7FFFFFFF), 'Q': (0, 2**64 - 1), 'q': (-2**63, 2**63 - 1)}
+
+
+class SimFault():
+    """
+    Fault injected in the generated traffic from start to start + duration (seconds after channel initialisation)
+
+    kind = 'bat_error'   : Leclanché active error code value (BAT_ACTIVE_ERR and matching BAT_FLAGS_ERR bit)
+           'bat_warning' : Leclanché active warning code value
+           'mppt_error'  : MPPT_ERR bits value of converter unit
+           'drive_error' : DRIVE_ERR bits value
+           'silence'     : CAN IDs in ids are no longer sent (watchdogs)
+           'unplug'      : the channel disappears (reads and device ID fail)
+    device = device ID concerned, None for all simulated devices
+    """
+    def __init__(self, kind, start=0, duration=math.inf, value=0, unit=0, ids=(), device=None):
+        self.kind = kind
+        self.start = start
+        self.duration = duration
+        self.value = value
+        self.unit = unit
+        self.ids = tuple(ids)
+        self.device = device
+
+    def active(self, t, device):
+        return self.start <= t < self.start + self.duration and (self.device is None or self.device == device)
+
+
+class SimChannel():
+    """
+    State of one simulated PCAN channel: device, receive queue, filter, generators schedule
+    """
+    def __init__(self, handle, device_id):
+        self.handle = handle
+        self.device_id = device_id
+        self.initialized = False
+        self.t0 = 0  # monotonic time of initialisation
+        self.t = 0  # bus time (s after initialisation) up to which messages are generated
+        self.queue = deque()
+        self.overrun = False
+        self.filter_mode = PCAN_FILTER_OPEN
+        self.filter_ranges = []
+        self.next_due = {}  # CAN ID -> next emission time
+        self.heartbeat = 0
+        # counters
+        self.generated = 0
+        self.filtered = 0
+        self.lost = 0
+        self.transmitted = deque(maxlen=1000)  # (time, CAN ID, datas) written by the application
+
+    def accepts(self, can_id):
+        if self.filter_mode == PCAN_FILTER_OPEN:
+            return True
+        for from_id, to_id in self.filter_ranges:
+            if from_id <= can_id <= to_id:
+                return True
+        return False
+
+
+class PCANBasicSim():
+    """
+    PCAN-Basic API simulation, same methods and return values as PCANBasic
+
+    devices      = {channel handle value: device ID}, default PCAN_USBBUS1 -> 0x1, PCAN_USBBUS2 -> 0x2 (modules A, B)
+    rate         = messages frequency factor (1 = nominal SPET bus, 10 = ten times more messages)
+    mppt_units   = MPPT converters present on each bus (max 28)
+    burst_period = seconds between drive bursts (0 = no burst), during burst_length seconds the drive messages
+                   are burst_factor times more frequent and the currents are higher
+    faults       = list of SimFault
+    queue_size   = receive queue of the driver (messages)
+    foreign_ids  = {CAN ID: period (s)} of the other devices messages on the bus (data bytes 0)
+    """
+    # Nominal periods (s) of the SPET messages
+    BAT_PERIOD = 0.1
+    MPPT_PERIOD = 0.2
+    DRIVE_PERIOD = 0.05
+
+    def __init__(self, devices=None, rate=1.0, mppt_units=10, burst_period=0, burst_length=1, burst_factor=10,
+                 faults=(), queue_size=32768, seed=None, foreign_ids=None):
+        if devices is None:
+            devices = {PCAN_USBBUS1.value: 0x1, PCAN_USBBUS2.value: 0x2}
+        self.channels = {}
+        for handle, device_id in devices.items():
+            self.channels[value_of(handle)] = SimChannel(value_of(handle), device_id)
+        self.rate = rate
+        self.mppt_units = min(mppt_units, 28)
+        self.burst_period = burst_period
+        self.burst_length = burst_length
+        self.burst_factor = burst_factor
+        self.faults = list(faults)
+        self.queue_size = queue_size
+        self.random = random.Random(seed)
+        self.clock = time.monotonic  # replaced for accelerated or stepped simulations
+
+        self.periods = {}  # CAN ID -> nominal period
+        for can_id in LECLANCHE_LAYOUTS:
+            self.periods[can_id] = self.BAT_PERIOD
+        for unit in range(self.mppt_units):
+            for message in range(3):
+                self.periods[MPPT_FIRST_ID + 3*unit + message] = self.MPPT_PERIOD
+        for can_id in DRIVE_LAYOUTS:
+            self.periods[can_id] = self.DRIVE_PERIOD
+        self.codes = {can_id: field_codes(FRAME_LAYOUTS[can_id].struct.format) for can_id in self.periods}
+        self.foreign_ids = dict(foreign_ids or {})
+        self.periods.update(self.foreign_ids)
+
+    def get_channel(self, Channel):
+        return self.channels.get(value_of(Channel))
+
+    def bus_time(self, channel):
+        return self.clock() - channel.t0
+
+    def plugged(self, channel, t):
+        for fault in self.faults:
+            if fault.kind == 'unplug' and fault.active(t, channel.device_id):
+                return False
+        return True
+
+    # PCAN-Basic API
+
+    def Initialize(self, Channel, Btr0Btr1, HwType=TPCANType(0), IOPort=c_uint(0), Interrupt=c_ushort(0)):
+        channel = self.get_channel(Channel)
+        if channel is None:
+            return PCAN_ERROR_ILLHW
+        if channel.initialized:
+            return PCAN_ERROR_INITIALIZE
+        channel.initialized = True
+        channel.t0 = self.clock()
+        channel.t = 0
+        channel.queue.clear()
+        channel.overrun = False
+        channel.filter_mode = PCAN_FILTER_OPEN
+        channel.filter_ranges = []
+        channel.generated = 0
+        channel.filtered = 0
+        channel.lost = 0
+        channel.next_due = {can_id: self.random.uniform(0, period) for can_id, period in self.periods.items()}
+        return PCAN_ERROR_OK
+
+    def Uninitialize(self, Channel):
+        if value_of(Channel) == PCAN_NONEBUS.value:
+            for channel in self.channels.values():
+                channel.initialized = False
+            return PCAN_ERROR_OK
+        channel = self.get_channel(Channel)
+        if channel is None or not channel.initialized:
+            return PCAN_ERROR_INITIALIZE
+        channel.initialized = False
+        return PCAN_ERROR_OK
+
+    def Reset(self, Channel):
+        channel = self.get_channel(Channel)
+        if channel is None or not channel.initialized:
+            return PCAN_ERROR_INITIALIZE
+        channel.queue.clear()
+        return PCAN_ERROR_OK
+
+    def GetStatus(self, Channel):
+        channel = self.get_channel(Channel)
+        if channel is None or not channel.initialized:
+            return PCAN_ERROR_INITIALIZE
+        return PCAN_ERROR_OK
+
+    def Read(self, Channel):
+        msg = TPCANMsg()
+        timestamp = TPCANTimestamp()
+        channel = self.get_channel(Channel)
+        if channel is None or not channel.initialized:
+            return PCAN_ERROR_INITIALIZE, msg, timestamp
+        if not self.plugged(channel, self.bus_time(channel)):
+            return PCAN_ERROR_ILLHW, msg, timestamp
+
+        if not channel.queue:
+            self.generate(channel, self.bus_time(channel))
+        if channel.overrun:
+            channel.overrun = False
+            return PCAN_ERROR_QOVERRUN, msg, timestamp
+        if not channel.queue:
+            return PCAN_ERROR_QRCVEMPTY, msg, timestamp
+
+        t, can_id, datas = channel.queue.popleft()
+        msg.ID = can_id
+        msg.MSGTYPE = PCAN_MESSAGE_STANDARD.value
+        msg.LEN = 8
+        msg.DATA = datas
+        micros = int(t * 1000000)
+        timestamp.micros = micros % 1000
+        timestamp.millis = (micros // 1000) & 0xFFFFFFFF
+        timestamp.millis_overflow = (micros // 1000) >> 32
+        return PCAN_ERROR_OK, msg, timestamp
+
+    def Write(self, Channel, MessageBuffer):
+        channel = self.get_channel(Channel)
+        if channel is None or not channel.initialized:
+            return PCAN_ERROR_INITIALIZE
+        channel.transmitted.append((self.bus_time(channel), MessageBuffer.ID, bytes(MessageBuffer.DATA)))
+        return PCAN_ERROR_OK
+
+    def FilterMessages(self, Channel, FromID, ToID, Mode):
+        """
+        As the driver, the filter is expanded with each call: a single range, from the lowest to the highest ID given
+        since the filter was closed
+        """
+        channel = self.get_channel(Channel)
+        if channel is None or not channel.initialized:
+            return PCAN_ERROR_INITIALIZE
+        if value_of(Mode) != PCAN_MODE_STANDARD.value:
+            return PCAN_ERROR_OK  # no extended messages on the SPET buses
+        from_id, to_id = value_of(FromID), value_of(ToID)
+        if channel.filter_mode == PCAN_FILTER_CUSTOM and channel.filter_ranges:
+            first, last = channel.filter_ranges[0]
+            from_id, to_id = min(first, from_id), max(last, to_id)
+        channel.filter_mode = PCAN_FILTER_CUSTOM
+        channel.filter_ranges = [(from_id, to_id)]
+        return PCAN_ERROR_OK
+
+    def GetValue(self, Channel, Parameter):
+        parameter = value_of(Parameter)
+        if parameter == PCAN_ATTACHED_CHANNELS_COUNT.value:
+            return PCAN_ERROR_OK, len(self.channels)
+        if parameter == PCAN_ATTACHED_CHANNELS.value:
+            channels = (TPCANChannelInformation * len(self.channels))()
+            for info, channel in zip(channels, self.channels.values()):
+                info.channel_handle = channel.handle
+                info.device_type = PCAN_USB.value
+                info.device_name = b"PCAN-USB (simulated)"
+                info.device_id = channel.device_id
+                info.channel_condition = PCAN_CHANNEL_OCCUPIED if channel.initialized else PCAN_CHANNEL_AVAILABLE
+            return PCAN_ERROR_OK, channels
+
+        channel = self.get_channel(Channel)
+        if parameter == PCAN_CHANNEL_CONDITION.value:
+            if channel is None or (channel.initialized and not self.plugged(channel, self.bus_time(channel))):
+                return PCAN_ERROR_OK, PCAN_CHANNEL_UNAVAILABLE
+            return PCAN_ERROR_OK, PCAN_CHANNEL_OCCUPIED if channel.initialized else PCAN_CHANNEL_AVAILABLE
+        if channel is None or not channel.initialized:
+            return PCAN_ERROR_INITIALIZE, 0
+        if parameter == PCAN_DEVICE_ID.value:
+            if not self.plugged(channel, self.bus_time(channel)):
+                return PCAN_ERROR_ILLHW, 0
+            return PCAN_ERROR_OK, channel.device_id
+        if parameter == PCAN_MESSAGE_FILTER.value:
+            return PCAN_ERROR_OK, channel.filter_mode
+        return PCAN_ERROR_ILLPARAMTYPE, 0  # PCAN_RECEIVE_EVENT included: readers poll the simulation
+
+    def SetValue(self, Channel, Parameter, Buffer):
+        channel = self.get_channel(Channel)
+        if channel is None or not channel.initialized:
+            return PCAN_ERROR_INITIALIZE
+        if value_of(Parameter) == PCAN_MESSAGE_FILTER.value:
+            channel.filter_mode = PCAN_FILTER_OPEN if Buffer == PCAN_FILTER_OPEN else PCAN_FILTER_CLOSE
+            channel.filter_ranges = []
+            return PCAN_ERROR_OK
+        return PCAN_ERROR_ILLPARAMTYPE
+
+    def GetErrorText(self, Error, Language=0):
+        return PCAN_ERROR_OK, ("PCAN simulation error " + hex(value_of(Error))).encode()
+
+    def LookUpChannel(self, Parameters):
+        wanted = dict(pair.split(b"=") for pair in Parameters.replace(b" ", b"").split(b",") if b"=" in pair)
+        for channel in self.channels.values():
+            if LOOKUP_DEVICE_ID in wanted and int(wanted[LOOKUP_DEVICE_ID], 0) != channel.device_id:
+                continue
+            return PCAN_ERROR_OK, TPCANHandle(channel.handle)
+        return PCAN_ERROR_OK, TPCANHandle(PCAN_NONEBUS.value)
+
+    def FilteredFrames(self, Channel):
+        """
+        Not in PCAN-Basic (the driver doesn't count them): messages dropped by the channel filter
+        since its initialisation
+        """
+        channel = self.get_channel(Channel)
+        if channel is None or not channel.initialized:
+            return PCAN_ERROR_INITIALIZE, 0
+        return PCAN_ERROR_OK, channel.filtered
+
+    # Traffic generation
+
+    def in_burst(self, t):
+        return self.burst_period > 0 and t % self.burst_period < self.burst_length
+
+    def generate(self, channel, t_now):
+        """
+        Queue the messages due between the last generation and t_now (bus time), in time order
+        Older messages are lost beyond the queue size, as with the driver
+        """
+        if t_now - channel.t > self.queue_size * self.BAT_PERIOD:  # long pause: skip to the recent history
+            channel.t = t_now - self.queue_size * self.BAT_PERIOD
+            channel.overrun = True
+        due = []
+        for can_id, next_t in channel.next_due.items():
+            period = self.periods[can_id] / self.rate
+            burst = can_id in DRIVE_LAYOUTS and self.burst_period > 0
+            next_t = max(next_t, channel.t)
+            while next_t <= t_now:
+                due.append((next_t, can_id))
+                next_t += period / self.burst_factor if burst and self.in_burst(next_t) else period
+            channel.next_due[can_id] = next_t
+        channel.t = t_now
+        due.sort()
+
+        for t, can_id in due:
+            if self.silenced(can_id, t, channel.device_id):
+                continue
+            channel.generated += 1
+            if not channel.accepts(can_id):
+                channel.filtered += 1
+                continue
+            if len(channel.queue) >= self.queue_size:
+                channel.lost += 1
+                channel.overrun = True
+                continue
+            if can_id in self.foreign_ids:
+                channel.queue.append((t, can_id, (0, 0, 0, 0, 0, 0, 0, 0)))
+            else:
+                channel.queue.append((t, can_id, self.encode(can_id, self.physical(channel, can_id, t))))
+
+    def silenced(self, can_id, t, device_id):
+        for fault in self.faults:
+            if fault.kind == 'silence' and can_id in fault.ids and fault.active(t, device_id):
+                return True
+        return False
+
+    def encode(self, can_id, values):
+        """
+        Physical values (in layout fields order) to the 8 data bytes
+        """
+        layout = FRAME_LAYOUTS[can_id]
+        raw = []
+        for (name, divisor), offset, code, value in zip(layout.fields, layout.offsets, self.codes[can_id], values):
+            if code in ('f', 'd'):
+                raw.append(float(value - offset) * divisor)
+            else:
+                low, high = CODE_RANGES[code]
+                raw.append(min(high, max(low, int(round((value - offset) * divisor)))))
+        return tuple(layout.struct.pack(*raw))
+
+    def fault_value(self, kind, t, device_id, unit=None):
+        value = 0
+        for fault in self.faults:
+            if fault.kind == kind and fault.active(t, device_id) and (unit is None or fault.unit == unit):
+                value |= fault.value
+        return value
+
+    def physical(self, channel, can_id, t):
+        """
+        Realistic SPET values at bus time t (s), in the layout fields order
+        """
+        device = channel.device_id
+        noise = self.random.gauss
+        burst = 1 if self.in_burst(t) else 0
+        current = 60 + 40 * math.sin(t / 20) + 150 * burst + noise(0, 2)  # A, battery discharge
+        soc = max(5.0, 90 - t / 120)  # %
+        voltage = 360 + 0.6 * soc + noise(0, 0.3)  # V
+
+        if can_id == 0x100:
+            channel.heartbeat = (channel.heartbeat + 1) & 0xFF
+            err = self.fault_value('bat_error', t, device)
+            warn = self.fault_value('bat_warning', t, device)
+            return channel.heartbeat, soc, err, warn, 100, 250
+        if can_id == 0x101:
+            return channel.heartbeat, 95, 0x01 | 0x08, 1 if soc > 99 else 0, voltage, current
+        if can_id == 0x102:
+            return 3.55 + soc / 500 + noise(0, 0.002), 12, 3.60 + soc / 500 + noise(0, 0.002), 47
+        if can_id == 0x103:
+            t_mean = 25 + current / 40 + t / 600
+            return t_mean - 2, t_mean, t_mean + 3, 3, 9
+        if can_id == 0x104:
+            return 0, 1, 1, 1, 0, 0, 0, 0
+        if can_id == 0x105:
+            err = self.fault_value('bat_error', t, device)
+            warn = self.fault_value('bat_warning', t, device)
+            return (1 << (err - 1)) if err else 0, (1 << (warn - 1)) if warn else 0
+
+        if can_id in DRIVE_LAYOUTS:
+            power = voltage * current  # W
+            speed = 1200 + 8 * current  # rpm
+            if can_id == 0x1AA:
+                return self.fault_value('drive_error', t, device), 0
+            if can_id == 0x1AB:
+                return 0.93 * power, power
+            if can_id == 0x1AC:
+                phase = 2 * math.pi * speed / 60 * t
+                return (current * math.sin(phase), current * math.sin(phase - 2 * math.pi / 3),
+                        current * math.sin(phase + 2 * math.pi / 3), voltage)
+            if can_id == 0x1AD:
+                return 0.93 * power / (speed * 2 * math.pi / 60), speed
+            if can_id == 0x1AE:
+                return (speed * t * 6) % 360, min(100.0, current / 2), 0, min(100.0, current / 2)
+            if can_id == 0x1AF:
+                return 120.5 + t / 3600, 35 + current / 20, 45 + current / 10
+            if can_id == 0x1B0:
+                t_sic = 40 + current / 8
+                return t_sic + noise(0, 0.2), t_sic + noise(0, 0.2), t_sic + noise(0, 0.2), 0
+            if can_id == 0x1B1:
+                return 0xFF, 0, 0, 0, 0xFF, 0, 0, 0
+            return 12.0, 4.0  # 0x1B2, 4-20mA
+
+        unit, message = divmod(can_id - MPPT_FIRST_ID, 3)
+        sun = 0.8 + 0.2 * math.sin(t / 60 + unit)
+        if message == 0:
+            return self.fault_value('mppt_error', t, device, unit), 0
+        if message == 1:
+            return 38 + 2 * sun, 8.5 * sun, (38 + 2 * sun) * 8.5 * sun, 30 + 10 * sun
+        return voltage / 8, 320 * sun / (voltage / 8), 320 * sun + noise(0, 1), 32 + 10 * sun
@@ -1,18 +1,205 @@
+import base64
+import hashlib
+import os
+import sys
+from urllib.parse import urlparse
+
 import numpy as np
-from bokeh.models import ColumnDataSource, Range1d, Text, Circle
+from bokeh.core.properties import field
+from bokeh.models import ColumnDataSource, Range1d, Text, Circle, CDSView, IndexFilter
 from bokeh.plotting import figure
 
 from PIL import Image
 from requests import get
 from io import BytesIO
 
+# bundled images (logos...): next to this file, or in the pyinstaller bundle
+ASSETS_DIRECTORY = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
+IMAGES = {}  # sha256 of the image file -> (data URI, width, height)
+IMAGE_DIGESTS = {}  # image path or URL -> sha256 of its content
+
+
+def image_file(img_path):
+    """
+    Local file of an image: the path itself, else the bundled asset of the same file name (URL or moved file),
+    None if neither exists
+    """
+    if urlparse(img_path).scheme not in ("http", "https") and os.path.isfile(img_path):
+        return img_path
+    bundled = os.path.join(ASSETS_DIRECTORY, os.path.basename(urlparse(img_path).path))
+    if os.path.isfile(bundled):
+        return bundled
+    return None
+
+
+def get_image(img_path, timeout: float = None):
+    """
+    (data URI, width, height) of an image, cached by content: each file is read and encoded once per process.
+    An URL is resolved to the bundled file of the same name, and only downloaded when there is none and a
+    timeout (s) is given. Raises FileNotFoundError when the image can't be found without the network.
+    """
+    digest = IMAGE_DIGESTS.get(img_path)
+    if digest is not None:
+        return IMAGES[digest]
+    path = image_file(img_path)
+    if path is not None:
+        with open(path, "rb") as file:
+            content = file.read()
+    elif timeout is not None:
+        response = get(img_path, timeout=timeout)
+        response.raise_for_status()
+        content = response.content
+    else:
+        raise FileNotFoundError("image not bundled: " + img_path)
+    digest = hashlib.sha256(content).hexdigest()
+    if digest not in IMAGES:
+        image = Image.open(BytesIO(content))
+        width, height = image.size
+        uri = "data:" + Image.MIME.get(image.format, "image/png") + ";base64," + base64.b64encode(content).decode()
+        IMAGES[digest] = (uri, width, height)
+    IMAGE_DIGESTS[img_path] = digest
+    return IMAGES[digest]
+
+
+def boxes_overlap(box_a, box_b):
+    return box_a[0] < box_b[2] and box_b[0] < box_a[2] and box_a[1] < box_b[3] and box_b[1] < box_a[3]
+
+
+class StaticGlyphs():
+    """
+    Static glyphs of a Dashboard (backgrounds, scales, labels), drawn by vectorized renderers: the items of one
+    add() are the rows of one renderer. With merge, they are added to the previous renderer of the same glyph and
+    style when none of the glyphs drawn since overlaps them, so the drawing order of overlapping glyphs is kept.
+    Overlaps are tested on boxes surely covering the items (x min, y min, x max, y max), renderers drawn
+    without add() or cover() are assumed to cover everything.
+    """
+    def __init__(self, fig, pixcel_factor, merge: bool = False):
+        self.fig = fig
+        self.pixcel_factor = pixcel_factor
+        self.merge = merge
+        self.renderers = {}  # (glyph, columns, style) -> last renderer
+        self.columns = {}  # renderer id -> columns lists
+        self.boxes = {}  # renderer id -> boxes of the drawn items
+
+    def circle_box(self, x, y, radius: float = 0, pixels: float = 0):
+        radius = radius + pixels / self.pixcel_factor
+        return x - radius, y - radius, x + radius, y + radius
+
+    def text_box(self, x, y, text, text_size):
+        # any alignment and angle: half width and height of the text box both ways
+        lines = str(text).split("\n")
+        extent = (0.7 * max(len(line) for line in lines) + 1.2 * len(lines)) * text_size / self.pixcel_factor
+        return x - extent, y - extent, x + extent, y + extent
+
+    def covered(self, renderer, boxes):
+        renderers = self.fig.renderers
+        for drawn in renderers[renderers.index(renderer) + 1:]:
+            drawn_boxes = self.boxes.get(drawn.id)
+            if drawn_boxes is None:
+                return True
+            for drawn_box in drawn_boxes:
+                for box in boxes:
+                    if boxes_overlap(drawn_box, box):
+                        return True
+        return False
+
+    def cover(self, renderers, boxes):
+        """
+        Boxes drawn by renderers made outside of add() (dynamic glyphs)
+        """
+        for renderer in renderers:
+            self.boxes[renderer.id] = list(boxes)
+
+    def add(self, glyph: str, boxes: list, style: dict = None, **columns):
+        """
+        Draw len(boxes) items of a glyph method of the figure ("segment", "text"...), columns = glyph properties,
+        scalars (same for all the items) or sequences, style = not vectorized properties (arc direction...)
+        """
+        style = {} if style is None else style
+        items = len(boxes)
+        for name, values in columns.items():
+            if np.ndim(values) == 0:
+                columns[name] = [values.item() if isinstance(values, np.generic) else values] * items
+            else:
+                columns[name] = values.tolist() if isinstance(values, np.ndarray) else list(values)
+        key = (glyph, tuple(sorted(columns)), tuple(sorted(style.items())))
+        renderer = self.renderers.get(key)
+        if renderer is None or not self.merge or self.covered(renderer, boxes):
+            renderer = getattr(self.fig, glyph)(source=ColumnDataSource(data={}),
+                                                **{name: field(name) for name in columns}, **style)
+            self.renderers[key] = renderer
+            self.columns[renderer.id] = {name: [] for name in columns}
+            self.boxes[renderer.id] = []
+        data = self.columns[renderer.id]
+        for name, values in columns.items():
+            data[name] += values
+        self.boxes[renderer.id] += boxes
+        renderer.data_source.data = {name: values if isinstance(values[0], str) else np.array(values)
+                                     for name, values in data.items()}
+        return renderer
+
+
+class DynamicSource():
+    """
+    ColumnDataSource shared by all the dynamic glyphs of a Dashboard (consolidated render mode): one row per
+    needle, needle indicator, boolean, enum and counter, each glyph drawn from its row through a view.
+    The changes are collected and sent as a single patch() of the changed rows (per row values: smaller than
+    binary slices of the columns for a few tens of rows), the coordinates rounded to digits.
+    """
+    numeric_columns = ("x0", "y0", "x1", "y1", "x2", "y2", "alpha")
+    text_columns = ("color", "text")
+
+    def __init__(self, digits: int = 4):
+        self.digits = digits
+        self.source = ColumnDataSource(data={name: np.zeros(0) for name in self.numeric_columns} |
+                                            {name: [] for name in self.text_columns})
+        self.rows = 0
+        self.changes = {}  # column -> {row: value}
+        self.batching = False  # True: the changes are kept until flush()
+
+    def add_row(self, **values) -> int:
+        data = {}
+        for name in self.numeric_columns:
+            data[name] = np.append(self.source.data[name], float(values.get(name, 0)))
+        for name in self.text_columns:
+            data[name] = list(self.source.data[name]) + [values.get(name, "")]
+        self.source.data = data
+        self.rows += 1
+        return self.rows - 1
+
+    def view(self, row: int) -> CDSView:
+        return CDSView(filter=IndexFilter(indices=[row]))
+
+    def update(self, row: int, **values):
+        for name, value in values.items():
+            self.changes.setdefault(name, {})[row] = value
+        if not self.batching:
+            self.flush()
+
+    def flush(self):
+        if not self.changes:
+            return
+        patches = {}
+        for name, rows in self.changes.items():
+            column = self.source.data[name]
+            if name in self.numeric_columns:
+                rows = {row: round(float(value), self.digits) for row, value in rows.items()}
+            changed = [(row, value) for row, value in sorted(rows.items()) if column[row] != value]
+            if changed:
+                patches[name] = changed
+        self.changes = {}
+        if patches:
+            self.source.patch(patches)
+
 
 class Needle():
     def __init__(self, fig, x0, y0, start_angle, end_angle, min_value, max_value, needle_lenght: float = 0.9,
                  inner_needle_lenght: float = 0.6, initial_value: float = 0, line_width: int = 4,
-                 inner_line_width: int = 8, line_color: str = "black"):
+                 inner_line_width: int = 8, line_color: str = "black", dynamic: DynamicSource = None,
+                 static: StaticGlyphs = None, pixcel_factor: float = None, deadband: float = 1):
 
         self.fig = fig
+        self.static = static
         self.x0 = x0
         self.y0 = y0
         self.start_angle = start_angle
@@ -26,14 +213,34 @@ class Needle():
         self.text_format = None
         self.x_text = None
         self.y_text = None
-        self.needle_source = ColumnDataSource(data=dict())
-        self.indicator_source = ColumnDataSource(data=dict())
-        self.set_needle_value(self.value)
-        self.fig.line(x="x", y="y", source=self.needle_source, line_width=line_width,
-                      line_color=line_color)
-
-        self.fig.line(x="x_inner", y="y_inner", source=self.needle_source, line_width=inner_line_width,
-                      line_color=line_color)
+        self.text = None
+        # pixcel_factor given: end points from a lookup table, one position per deadband pixels of the tip travel
+        self.positions = None
+        self.step = None
+        if pixcel_factor is not None:
+            self.set_positions(pixcel_factor, deadband)
+        self.dynamic = dynamic
+        if self.dynamic is None:
+            self.needle_source = ColumnDataSource(data=dict())
+            self.indicator_source = ColumnDataSource(data=dict())
+            self.set_needle_value(self.value)
+            renderers = [self.fig.line(x="x", y="y", source=self.needle_source, line_width=line_width,
+                                       line_color=line_color),
+                         self.fig.line(x="x_inner", y="y_inner", source=self.needle_source,
+                                       line_width=inner_line_width, line_color=line_color)]
+        else:
+            self.row = self.dynamic.add_row(x0=x0, y0=y0)
+            self.indicator_row = None
+            self.set_needle_value(self.value)
+            renderers = [self.fig.segment(x0="x0", y0="y0", x1="x1", y1="y1", source=self.dynamic.source,
+                                          view=self.dynamic.view(self.row), line_width=line_width,
+                                          line_color=line_color),
+                         self.fig.segment(x0="x0", y0="y0", x1="x2", y1="y2", source=self.dynamic.source,
+                                          view=self.dynamic.view(self.row), line_width=inner_line_width,
+                                          line_color=line_color)]
+        if self.static is not None:
+            self.static.cover(renderers, [self.static.circle_box(x0, y0, max(needle_lenght, inner_needle_lenght),
+                                                                 max(line_width, inner_line_width))])
 
 
     def add_indicator(self, radius: float = 0.5, angle: float = -np.pi / 2, text_angle: float = 0,
@@ -43,11 +250,22 @@ class Needle():
         self.text_format = self.set_text_format(round_nb=round_nb, unit=unit)
         self.value = initial_value
         self.set_text_position(angle=angle, length=radius)
-        self.set_needle_value(self.value)
+        if self.dynamic is None:
+            self.set_needle_value(self.value)
+
+            glyph = Text(x="x_text", y="y_text", text="text", text_color=indicator_color, text_align="center",
+                         text_baseline="middle", text_font_size=str(text_size) + "px", angle=text_angle)
+            renderer = self.fig.add_glyph(self.indicator_source, glyph)
+        else:
+            self.indicator_row = self.dynamic.add_row(x0=self.x_text[0], y0=self.y_text[0])
+            self.set_needle_value(self.value)
 
-        glyph = Text(x="x_text", y="y_text", text="text", text_color=indicator_color, text_align="center",
-                     text_baseline="middle", text_font_size=str(text_size) + "px", angle=text_angle)
-        self.fig.add_glyph(self.indicator_source, glyph)
+            glyph = Text(x="x0", y="y0", text="text", text_color=indicator_color, text_align="center",
+                         text_baseline="middle", text_font_size=str(text_size) + "px", angle=text_angle)
+            renderer = self.fig.add_glyph(self.dynamic.source, glyph, view=self.dynamic.view(self.indicator_row))
+        if self.static is not None:
+            self.static.cover([renderer], [self.static.text_box(self.x_text[0], self.y_text[0], "-00000" + unit,
+                                                                text_size)])
 
     def get_angle(self, value: float):
         return self.start_angle + (self.end_angle - self.start_angle) * \
@@ -65,26 +283,59 @@ class Needle():
     def set_text_format(self, round_nb: int = 0, unit: str = ""):
         return "{:." + str(round_nb) + "f}" + unit
 
+    def set_positions(self, pixcel_factor: float, deadband: float = 1):
+        steps = max(1, int(np.ceil(abs(self.end_angle - self.start_angle) * self.needle_lenght * pixcel_factor
+                                   / deadband)))
+        angles = np.linspace(self.start_angle, self.end_angle, steps + 1)
+        self.positions = list(zip((self.x0 + self.needle_lenght * np.cos(angles)).tolist(),
+                                  (self.y0 + self.needle_lenght * np.sin(angles)).tolist(),
+                                  (self.x0 + self.inner_needle_lenght * np.cos(angles)).tolist(),
+                                  (self.y0 + self.inner_needle_lenght * np.sin(angles)).tolist()))
+        self.step_factor = steps / (self.max_value - self.min_value)
+        self.step = None
+
     def set_needle_value(self, value):
         self.value = value
-        position = self.get_position(self.value, self.needle_lenght)
-        inner_position = self.get_position(self.value, self.inner_needle_lenght)
+        if self.with_indicator:
+            text = self.text_format.format(self.value)
+            if text != self.text:
+                self.text = text
+                if self.dynamic is not None:
+                    self.dynamic.update(self.indicator_row, text=text)
+                else:
+                    self.indicator_source.data = {"x_text": self.x_text,
+                                                  "y_text": self.y_text,
+                                                  "text": [text]}
+        if self.positions is None:
+            position = self.get_position(self.value, self.needle_lenght)
+            inner_position = self.get_position(self.value, self.inner_needle_lenght)
+        else:
+            step = (min(max(value, self.min_value), self.max_value) - self.min_value) * self.step_factor  # NaN kept
+            if self.step is not None and not abs(step - self.step) >= 1:
+                return  # the tip would move less than the deadband (or NaN value)
+            self.step = int(round(step))
+            x, y, x_inner, y_inner = self.positions[self.step]
+            position = (x, y)
+            inner_position = (x_inner, y_inner)
+        if self.dynamic is not None:
+            self.dynamic.update(self.row, x1=position[0], y1=position[1],
+                                x2=inner_position[0], y2=inner_position[1])
+            return
         self.needle_source.data = {"x": [self.x0, position[0]],
                                    "y": [self.y0, position[1]],
                                    "x_inner": [self.x0, inner_position[0]],
                                    "y_inner": [self.y0, inner_position[1]]}
-        if self.with_indicator:
-            self.indicator_source.data = {"x_text": self.x_text,
-                                          "y_text": self.y_text,
-                                          "text": [self.text_format.format(self.value)]}
 
 
 class Gauge():
     def __init__(self, fig, pixcel_factor, x0: float = 0, y0: float = 0, r: float = 1, start_angle: float = np.pi,
-                 end_angle: float = 0, min_value: float = 0, max_value: float = 100, direction: str = 'clock'):
+                 end_angle: float = 0, min_value: float = 0, max_value: float = 100, direction: str = 'clock',
+                 dynamic: DynamicSource = None, static: StaticGlyphs = None):
 
         self.fig = fig
         self.pixcel_factor = pixcel_factor
+        self.dynamic = dynamic
+        self.static = StaticGlyphs(fig, pixcel_factor) if static is None else static
         self.x0 = x0
         self.y0 = y0
         self.r = r
@@ -102,20 +353,23 @@ class Gauge():
         if circle_radius is None:
             circle_radius = self.r
 
-        self.fig.arc(x=self.x0, y=self.y0, radius=circle_radius, start_angle=self.start_angle,
-                     end_angle=self.end_angle, direction=self.direction, line_color=line_color,
-                     line_width=line_width)
+        self.static.add("arc", [self.static.circle_box(self.x0, self.y0, circle_radius, line_width)],
+                        style={"direction": self.direction}, x=self.x0, y=self.y0, radius=circle_radius,
+                        start_angle=self.start_angle, end_angle=self.end_angle, line_color=line_color,
+                        line_width=line_width)
 
     def add_annular(self, values: list[tuple], colors: list[str], inner_radius: float = 0.7,
                     outer_radius: float = None, fill_alpha: float = 1, limited: bool = True):
         if outer_radius is None:
             outer_radius = self.r
-        for value, color in zip(values, colors):
-            first_angle = self.get_angle(value=value[0], limited=limited)
-            second_angle = self.get_angle(value=value[1], limited=limited)
-            self.fig.annular_wedge(x=self.x0, y=self.y0, inner_radius=inner_radius, outer_radius=outer_radius,
-                                   start_angle=first_angle, end_angle=second_angle, color=color,
-                                   alpha=fill_alpha, direction=self.direction)
+        values = np.array(values, dtype=float).reshape(-1, 2)
+        boxes = [self.static.circle_box(self.x0, self.y0, outer_radius)] * len(values)
+        self.static.add("annular_wedge", boxes, style={"direction": self.direction}, x=self.x0, y=self.y0,
+                        inner_radius=inner_radius, outer_radius=outer_radius,
+                        start_angle=self.get_angle(value=values[:, 0], limited=limited),
+                        end_angle=self.get_angle(value=values[:, 1], limited=limited),
+                        fill_color=colors[:len(values)], line_color=colors[:len(values)], fill_alpha=fill_alpha,
+                        line_alpha=fill_alpha)
 
     def add_ticks(self, tick_nb: int = 10, sub_tick_nb: int = 2, outer_radius: float = None,
                   tick_length: float = 0.2, sub_tick_length: float = None, tick_width: int = 2,
@@ -125,20 +379,18 @@ class Gauge():
         if sub_tick_length is None:
             sub_tick_length = tick_length / 2
 
-        for tick_index, tick_value in enumerate(np.linspace(self.min_value, self.max_value,
-                                                            (tick_nb * sub_tick_nb) + 1)):
-            if tick_index % sub_tick_nb == 0:
-                actual_tick_length = tick_length
-                actual_tick_width = tick_width
-            else:
-                actual_tick_length = sub_tick_length
-                actual_tick_width = sub_tick_width
+        tick_values = np.linspace(self.min_value, self.max_value, (tick_nb * sub_tick_nb) + 1)
+        main_ticks = np.arange(len(tick_values)) % sub_tick_nb == 0
+        tick_lengths = np.where(main_ticks, tick_length, sub_tick_length)
+        tick_widths = np.where(main_ticks, tick_width, sub_tick_width)
+        self.add_segments(tick_values, outer_radius, outer_radius - tick_lengths, tick_widths, tick_color)
 
-            tick_position = [self.get_position(tick_value, length=outer_radius),
-                             self.get_position(tick_value, length=outer_radius - actual_tick_length)]
-            self.fig.line(x=[tick_position[0][0], tick_position[1][0]],
-                          y=[tick_position[0][1], tick_position[1][1]],
-                          line_width=actual_tick_width, line_color=tick_color)
+    def add_segments(self, tick_values, outer_radius, inner_radius, line_width, line_color):
+        x_outer, y_outer = self.get_position(tick_values, length=outer_radius)
+        x_inner, y_inner = self.get_position(tick_values, length=inner_radius)
+        boxes = [self.static.circle_box(self.x0, self.y0, outer_radius, np.max(line_width))] * len(tick_values)
+        self.static.add("segment", boxes, x0=x_outer, y0=y_outer, x1=x_inner, y1=y_inner,
+                        line_width=np.broadcast_to(line_width, len(tick_values)), line_color=line_color)
 
     def add_ticks_label(self, label_nb: int = 5, label_radius: float = 0.7, round_nb: int = 0,
                         unit: str = "", label_color: str = "black", label_size: int = 20, label_values: list = None):
@@ -146,46 +398,48 @@ class Gauge():
         if label_values is None:
             label_values = np.linspace(self.min_value, self.max_value, label_nb + 1)
 
-        for label_value in label_values:
-            label_position = self.get_position(label_value, length=label_radius)
-            text_value = self.set_text_format(round_nb=round_nb, unit=unit).format(label_value)
-            self.fig.text(x=[label_position[0]], y=[label_position[1]], text=[text_value],
-                          text_align="center", text_baseline="middle", text_color=label_color,
-                          text_font_size=str(label_size) + "px")
+        label_values = np.asarray(label_values, dtype=float)
+        x_labels, y_labels = self.get_position(label_values, length=label_radius)
+        text_format = self.set_text_format(round_nb=round_nb, unit=unit)
+        texts = [text_format.format(label_value) for label_value in label_values]
+        boxes = [self.static.text_box(x, y, text, label_size) for x, y, text in zip(x_labels, y_labels, texts)]
+        self.static.add("text", boxes, x=x_labels, y=y_labels, text=texts, text_align="center",
+                        text_baseline="middle", text_color=label_color, text_font_size=str(label_size) + "px")
 
     def add_inner_circle(self, r: float = 0.1, fill_color: str = "black", line_color:
                          str = "black", line_width: int = 2):
 
-        self.fig.circle(x=self.x0, y=self.y0, size=int(2*r*self.pixcel_factor), fill_color=fill_color, line_color=line_color,
+        self.static.add("circle", [self.static.circle_box(self.x0, self.y0, r, line_width)], x=self.x0, y=self.y0,
+                        size=int(2*r*self.pixcel_factor), fill_color=fill_color, line_color=line_color,
                         line_width=line_width)
 
     def add_custom_tick(self, tick_value, outer_radius: float = None, tick_length: float = 0.3,  tick_width: int = 8,
                         tick_color: str = "red"):
         if outer_radius is None:
             outer_radius = self.r
-        tick_position = [self.get_position(tick_value, length=outer_radius),
-                         self.get_position(tick_value, length=outer_radius - tick_length)]
-        self.fig.line(x=[tick_position[0][0], tick_position[1][0]],
-                      y=[tick_position[0][1], tick_position[1][1]],
-                      line_width=tick_width, line_color=tick_color)
+        self.add_segments(np.array([tick_value], dtype=float), outer_radius, outer_radius - tick_length, tick_width,
+                          tick_color)
 
 
     def add_label(self, label, r: float = 0.3, angle: float = None, text_color: str = "black", text_size: int = 20,
                   text_align: str = "center", text_baseline: str = "middle"):
         if angle is None:
             angle = self.get_angle((self.max_value-self.min_value)/2)
-        self.fig.text(x=[self.x0 + r * np.cos(angle)], y=[self.y0 + r * np.sin(angle)], text=[label],
-                      text_align=text_align, text_baseline=text_baseline,
-                      text_color=text_color, text_font_size=str(text_size) + "px")
+        x, y = self.x0 + r * np.cos(angle), self.y0 + r * np.sin(angle)
+        self.static.add("text", [self.static.text_box(x, y, label, text_size)], x=x, y=y, text=label,
+                        text_align=text_align, text_baseline=text_baseline, text_color=text_color,
+                        text_font_size=str(text_size) + "px")
 
     def add_needle(self, needle_name: str, needle_lenght: float = 0.9, initial_value: float = 0,
                    line_width: int = 4, needle_color: str = "black", inner_needle_lenght: float = 0.6,
-                   inner_line_width: float = 8):
+                   inner_line_width: float = 8, deadband: float = 1):
+        # deadband: pixels, needle moves smaller than this are not sent (None: exact position of each value)
         needle = Needle(fig=self.fig, x0=self.x0, y0=self.y0, start_angle=self.start_angle,
                         end_angle=self.end_angle, min_value=self.min_value, max_value=self.max_value,
                         needle_lenght=needle_lenght, initial_value=initial_value,
                         line_width=line_width, line_color=needle_color, inner_line_width=inner_line_width,
-                        inner_needle_lenght=inner_needle_lenght)
+                        inner_needle_lenght=inner_needle_lenght, dynamic=self.dynamic, static=self.static,
+                        pixcel_factor=None if deadband is None else self.pixcel_factor, deadband=deadband)
         self.needles.append(needle)
         setattr(self, needle_name, needle)
 
@@ -202,9 +456,10 @@ class Gauge():
         return "{:." + str(round_nb) + "f}" + unit
 
     def get_angle(self, value: float, limited: bool = True):
+        # value: float or NumPy array of values
         if limited:
             return self.start_angle + (self.end_angle - self.start_angle) * \
-                   (max(self.min_value, min(self.max_value, value)) - self.min_value) / \
+                   (np.clip(value, self.min_value, self.max_value) - self.min_value) / \
                    (self.max_value - self.min_value)
         else:
             return self.start_angle + (self.end_angle - self.start_angle) * \
@@ -218,27 +473,44 @@ class Gauge():
 class Boolean():
     def __init__(self, fig, x0: float = 0, y0: float = 0, true_color: str = "green", false_color: str = "gray",
                  true_alpha: float = 1, false_alpha: float = 1, initial_value: bool = False, size: int = 30,
-                 line_color: str = "black", line_width: str = 2):
+                 line_color: str = "black", line_width: str = 2, dynamic: DynamicSource = None,
+                 static: StaticGlyphs = None):
 
         self.fig = fig
         self.x0 = x0
         self.y0 = y0
+        self.dynamic = dynamic
+        self.static = static
         self.initial_value = initial_value
         self.false_alpha = false_alpha
         self.true_alpha = true_alpha
         self.false_color = false_color
         self.true_color = true_color
         self.value = None
-        self.boolean_source = ColumnDataSource(data=dict())
-        self.set_value(initial_value)
-        glyph = Circle(x="x", y="y", size=size, fill_alpha="alpha", fill_color="color",
-                       line_width=line_width, line_color=line_color)
-        self.fig.add_glyph(self.boolean_source, glyph)
+        if self.dynamic is None:
+            self.boolean_source = ColumnDataSource(data=dict())
+            self.set_value(initial_value)
+            glyph = Circle(x="x", y="y", size=size, fill_alpha="alpha", fill_color="color",
+                           line_width=line_width, line_color=line_color)
+            renderer = self.fig.add_glyph(self.boolean_source, glyph)
+        else:
+            self.row = self.dynamic.add_row(x0=x0, y0=y0)
+            self.set_value(initial_value)
+            glyph = Circle(x="x0", y="y0", size=size, fill_alpha="alpha", fill_color="color",
+                           line_width=line_width, line_color=line_color)
+            renderer = self.fig.add_glyph(self.dynamic.source, glyph, view=self.dynamic.view(self.row))
+        if self.static is not None:
+            self.static.cover([renderer], [self.static.circle_box(x0, y0, pixels=size / 2 + line_width)])
 
     def set_value(self, new_value: float):
         if self.value != new_value:
             self.value = new_value
-            if self.value:
+            if self.dynamic is not None:
+                if self.value:
+                    self.dynamic.update(self.row, alpha=self.true_alpha, color=self.true_color)
+                else:
+                    self.dynamic.update(self.row, alpha=self.false_alpha, color=self.false_color)
+            elif self.value:
                 self.boolean_source.data = {"x": [self.x0], "y": [self.y0],
                                             "alpha": [self.true_alpha],
                                             "color": [self.true_color]}
@@ -250,32 +522,54 @@ class Boolean():
     def add_label(self, label, x: float = 0, y: float = 0, text_color: str = "black", text_size: int = 20,
                   text_align: str = "left", text_baseline: str = "middle"):
 
-        self.fig.text(x=[x + self.x0], y=[y + self.y0], text=[label], text_align=text_align, text_baseline=text_baseline,
-                      text_color=text_color, text_font_size=str(text_size) + "px")
+        if self.static is None:
+            self.fig.text(x=[x + self.x0], y=[y + self.y0], text=[label], text_align=text_align,
+                          text_baseline=text_baseline, text_color=text_color, text_font_size=str(text_size) + "px")
+        else:
+            self.static.add("text", [self.static.text_box(x + self.x0, y + self.y0, label, text_size)], x=x + self.x0,
+                            y=y + self.y0, text=label, text_align=text_align, text_baseline=text_baseline,
+                            text_color=text_color, text_font_size=str(text_size) + "px")
 
 
 class Enum():
     def __init__(self, fig, x0: float = 0, y0: float = 0, colors=None,
-                 initial_value: int = 0, size: int = 30, line_color: str = "saddlebrown", line_width: int = 2):
+                 initial_value: int = 0, size: int = 30, line_color: str = "saddlebrown", line_width: int = 2,
+                 dynamic: DynamicSource = None, static: StaticGlyphs = None):
 
         self.fig = fig
         self.x0 = x0
         self.y0 = y0
+        self.dynamic = dynamic
+        self.static = static
         if colors is None:
             self.colors = ["gray", "green", "gold", "red"]
         else:
             self.colors = colors
         self.value = None
-        self.enum_source = ColumnDataSource(data=dict())
-        self.set_value(initial_value)
-        glyph = Circle(x="x", y="y", size=size, fill_alpha=1, fill_color="color",
-                       line_width=line_width, line_color=line_color)
-        self.fig.add_glyph(self.enum_source, glyph)
+        if self.dynamic is None:
+            self.enum_source = ColumnDataSource(data=dict())
+            self.set_value(initial_value)
+            glyph = Circle(x="x", y="y", size=size, fill_alpha=1, fill_color="color",
+                           line_width=line_width, line_color=line_color)
+            renderer = self.fig.add_glyph(self.enum_source, glyph)
+        else:
+            self.row = self.dynamic.add_row(x0=x0, y0=y0)
+            self.set_value(initial_value)
+            glyph = Circle(x="x0", y="y0", size=size, fill_alpha=1, fill_color="color",
+                           line_width=line_width, line_color=line_color)
+            renderer = self.fig.add_glyph(self.dynamic.source, glyph, view=self.dynamic.view(self.row))
+        if self.static is not None:
+            self.static.cover([renderer], [self.static.circle_box(x0, y0, pixels=size / 2 + line_width)])
 
     def set_value(self, new_value: float):
         if self.value != new_value:
             self.value = new_value
-            if (self.value >= 0) & (self.value < len(self.colors)):
+            if self.dynamic is not None:
+                if (self.value >= 0) & (self.value < len(self.colors)):
+                    self.dynamic.update(self.row, color=self.colors[self.value])
+                else:
+                    self.dynamic.update(self.row, color=self.colors[0])
+            elif (self.value >= 0) & (self.value < len(self.colors)):
                 self.enum_source.data = {"x": [self.x0], "y": [self.y0],
                                             "color": [self.colors[self.value]]}
             else:
@@ -285,26 +579,43 @@ class Enum():
     def add_label(self, label, x: float = 0, y: float = 0, text_color: str = "black", text_size: int = 20,
                   text_align: str = "left", text_baseline: str = "middle"):
 
-        self.fig.text(x=[x + self.x0], y=[y + self.y0], text=[label], text_align=text_align, text_baseline=text_baseline,
-                      text_color=text_color, text_font_size=str(text_size) + "px")
+        if self.static is None:
+            self.fig.text(x=[x + self.x0], y=[y + self.y0], text=[label], text_align=text_align,
+                          text_baseline=text_baseline, text_color=text_color, text_font_size=str(text_size) + "px")
+        else:
+            self.static.add("text", [self.static.text_box(x + self.x0, y + self.y0, label, text_size)], x=x + self.x0,
+                            y=y + self.y0, text=label, text_align=text_align, text_baseline=text_baseline,
+                            text_color=text_color, text_font_size=str(text_size) + "px")
 
 class Counter():
     def __init__(self, fig, x0: float = 0, y0: float = 0, digit_nb: int = 5, decimal_nb: int = 1, unit: str = "",
                  initial_value: int = 0, text_size: int = 30, text_color: str = "black", text_align="center",
-                 text_baseline="middle"):
+                 text_baseline="middle", dynamic: DynamicSource = None, static: StaticGlyphs = None):
 
         self.fig = fig
         self.x = x0
         self.y = y0
+        self.dynamic = dynamic
+        self.static = static
         self.digit_nb = digit_nb
         self.decimal_nb = decimal_nb
         self.unit = unit
         self.value = None
-        self.counter_source = ColumnDataSource(data=dict())
-        self.set_value(initial_value)
-        glyph = Text(x="x_text", y="y_text", text="text", text_color=text_color, text_align=text_align,
-                     text_baseline=text_baseline, text_font_size=str(text_size) + "px")
-        self.fig.add_glyph(self.counter_source, glyph)
+        if self.dynamic is None:
+            self.counter_source = ColumnDataSource(data=dict())
+            self.set_value(initial_value)
+            glyph = Text(x="x_text", y="y_text", text="text", text_color=text_color, text_align=text_align,
+                         text_baseline=text_baseline, text_font_size=str(text_size) + "px")
+            renderer = self.fig.add_glyph(self.counter_source, glyph)
+        else:
+            self.row = self.dynamic.add_row(x0=x0, y0=y0)
+            self.set_value(initial_value)
+            glyph = Text(x="x0", y="y0", text="text", text_color=text_color, text_align=text_align,
+                         text_baseline=text_baseline, text_font_size=str(text_size) + "px")
+            renderer = self.fig.add_glyph(self.dynamic.source, glyph, view=self.dynamic.view(self.row))
+        if self.static is not None:  # digits, decimal point and unit: constant length
+            text = "0" * (digit_nb + decimal_nb + 1) + unit
+            self.static.cover([renderer], [self.static.text_box(x0, y0, text, text_size)])
 
     def set_value(self, value):
         if value != self.value:
@@ -318,6 +629,9 @@ class Counter():
                 dig = str(min(max(0, int(self.value)), 10**self.digit_nb-1))
                 text = "0" * (self.digit_nb - self.decimal_nb - len(dig)) + dig + self.unit
 
+            if self.dynamic is not None:
+                self.dynamic.update(self.row, text=text)
+                return
             self.counter_source.data = {"x_text": [self.x],
                                         "y_text": [self.y],
                                         "text": [text]}
@@ -325,7 +639,11 @@ class Counter():
 class Dashboard():
 
     def __init__(self, size: int = 400, background_fill: str = None,
-                 x_lim: tuple = (-1.1, 1.1), y_lim: tuple = (-1.1, 1.1)):
+                 x_lim: tuple = (-1.1, 1.1), y_lim: tuple = (-1.1, 1.1), consolidated: bool = False,
+                 merge_static: bool = False):
+        # consolidated: all the needles, booleans, enums and counters in one source, updated with one patch per set_values
+        # merge_static: static glyphs of all the gauges merged in a few renderers when they don't overlap dynamic ones
+        self.dynamic = DynamicSource() if consolidated else None
         self.image_factor = (y_lim[1] - y_lim[0])/(x_lim[1] - x_lim[0])
         self.pixcel_factor = size/(x_lim[1] - x_lim[0])
         self.fig = figure(title=None, toolbar_location=None, match_aspect=True, width=size,
@@ -338,6 +656,7 @@ class Dashboard():
         self.fig.outline_line_color = None
         self.fig.x_range = Range1d(*x_lim)
         self.fig.y_range = Range1d(*y_lim)
+        self.static = StaticGlyphs(self.fig, self.pixcel_factor, merge=merge_static)
 
     def set_text_format(self, round_nb: int = 0, unit: str = ""):
         return "{:." + str(round_nb) + "f}" + unit
@@ -352,12 +671,15 @@ class Dashboard():
         else:
             direction = "anticlock"
         if with_background:
-            self.fig.circle(x=x0+background_x, y=y0+background_y, size=int(2*background_r*self.pixcel_factor),
+            self.static.add("circle", [self.static.circle_box(x0+background_x, y0+background_y, background_r,
+                                                              background_line_width)],
+                            x=x0+background_x, y=y0+background_y, size=int(2*background_r*self.pixcel_factor),
                             fill_color=background_color, line_color=background_line_color,
                             line_width=background_line_width)
 
         gauge = Gauge(fig=self.fig, pixcel_factor=self.pixcel_factor, x0=x0, y0=y0, r=r, start_angle=start_angle,
-                      end_angle=end_angle, min_value=min_value, max_value=max_value, direction=direction)
+                      end_angle=end_angle, min_value=min_value, max_value=max_value, direction=direction,
+                      dynamic=self.dynamic, static=self.static)
         setattr(self, gauge_name, gauge)
 
     def add_booolean(self, boolean_name: str, x0: float = 0, y0: float = 0, true_color: str = "lightgreen",
@@ -367,7 +689,7 @@ class Dashboard():
 
         boolean = Boolean(fig=self.fig, x0=x0, y0=y0, true_color=true_color, false_color=false_color,
                            true_alpha=true_alpha, false_alpha=false_alpha, initial_value=initial_value, size=size,
-                           line_color=line_color, line_width=line_width)
+                           line_color=line_color, line_width=line_width, dynamic=self.dynamic, static=self.static)
         setattr(self, boolean_name, boolean)
 
     def add_enum(self, enum_name: str, x0: float = 0, y0: float = 0, colors: list = None,
@@ -375,7 +697,7 @@ class Dashboard():
                  line_width: int = 3):
         size = int(2*r*self.pixcel_factor)
         enum = Enum(fig=self.fig, x0=x0, y0=y0, colors=colors, initial_value=initial_value, size=size,
-                       line_color=line_color, line_width=line_width)
+                       line_color=line_color, line_width=line_width, dynamic=self.dynamic, static=self.static)
         setattr(self, enum_name, enum)
 
     def add_counter(self, counter_name, x: float = 0, y: float = 0, digit_nb: int = 4, decimal_nb: int = 1,
@@ -384,45 +706,44 @@ class Dashboard():
 
         counter = Counter(fig=self.fig, x0=x, y0=y, digit_nb=digit_nb, decimal_nb=decimal_nb, unit=unit,
                           initial_value=initial_value, text_size=text_size, text_color=text_color,
-                          text_align=text_align, text_baseline=text_baseline)
+                          text_align=text_align, text_baseline=text_baseline, dynamic=self.dynamic,
+                          static=self.static)
         setattr(self, counter_name, counter)
 
     def add_background(self, x0: float, y0: float, height: float, width: float, angle_r: float = 0.2,
                        fill_color:str = None, line_color: str = "saddlebrown", line_width: int = 5):
+        corners_x = np.array([x0 + angle_r, x0 + width - angle_r, x0 + width - angle_r, x0 + angle_r])
+        corners_y = np.array([y0 + angle_r, y0 + angle_r, y0 + height - angle_r, y0 + height - angle_r])
+        corner_boxes = [self.static.circle_box(x, y, angle_r, line_width) for x, y in zip(corners_x, corners_y)]
         if fill_color is not None:
-            self.fig.circle(x=[x0 + angle_r, x0 + width - angle_r, x0 + angle_r, x0 + width - angle_r],
-                            y=[y0 + angle_r, y0 + angle_r, y0 + height - angle_r, y0 + height - angle_r],
-                            size=int(2 * angle_r * self.pixcel_factor), fill_color=fill_color)
-            self.fig.rect(x=x0 + width / 2, y=y0 + height / 2, width=width - 2 * angle_r, height=height,
-                          color=fill_color)
-            self.fig.rect(x=x0 + width / 2, y=y0 + height / 2, width=width, height=height - 2 * angle_r,
-                          color=fill_color)
-
-        self.fig.segment(x0=x0 + angle_r - 1 / self.pixcel_factor, x1=x0 + width - angle_r + 1 / self.pixcel_factor,
-                         y0=y0, y1=y0, line_color=line_color, line_width=line_width)
-        self.fig.segment(x0=x0 + angle_r - 1 / self.pixcel_factor, x1=x0 + width - angle_r + 1 / self.pixcel_factor,
-                         y0=y0 + height, y1=y0 + height, line_color=line_color, line_width=line_width)
-        self.fig.segment(x0=x0, x1=x0, y0=y0 + angle_r - 1 / self.pixcel_factor,
-                         y1=y0 + height - angle_r + 1 / self.pixcel_factor, line_color=line_color,
-                         line_width=line_width)
-        self.fig.segment(x0=x0 + width, x1=x0 + width, y0=y0 + angle_r - 1 / self.pixcel_factor,
-                         y1=y0 + height - angle_r + 1 / self.pixcel_factor, line_color=line_color,
-                         line_width=line_width)
-
-        self.fig.arc(x=x0+angle_r, y=y0+angle_r, radius=angle_r, start_angle=np.pi,
-                     end_angle=3*np.pi/2, line_color=line_color, line_width=line_width)
-        self.fig.arc(x=x0+width-angle_r, y=y0+angle_r, radius=angle_r, start_angle=3*np.pi/2,
-                     end_angle=0, line_color=line_color, line_width=line_width)
-        self.fig.arc(x=x0+width-angle_r, y=y0+height-angle_r, radius=angle_r, start_angle=0,
-                     end_angle=np.pi/2, line_color=line_color, line_width=line_width)
-        self.fig.arc(x=x0+angle_r, y=y0+height-angle_r, radius=angle_r, start_angle=np.pi/2,
-                     end_angle=np.pi, line_color=line_color, line_width=line_width)
+            self.static.add("circle", corner_boxes, x=corners_x, y=corners_y, size=int(2 * angle_r * self.pixcel_factor),
+                            fill_color=fill_color, line_color="#1f77b4")
+            self.static.add("rect", [(x0, y0, x0 + width, y0 + height)] * 2, x=x0 + width / 2, y=y0 + height / 2,
+                            width=[width - 2 * angle_r, width], height=[height, height - 2 * angle_r],
+                            fill_color=fill_color, line_color=fill_color)
+
+        pixel = 1 / self.pixcel_factor
+        margin = line_width * pixel
+        self.static.add("segment", [(x0 - margin, y0 - margin, x0 + width + margin, y0 + margin),
+                                    (x0 - margin, y0 + height - margin, x0 + width + margin, y0 + height + margin),
+                                    (x0 - margin, y0 - margin, x0 + margin, y0 + height + margin),
+                                    (x0 + width - margin, y0 - margin, x0 + width + margin, y0 + height + margin)],
+                        x0=[x0 + angle_r - pixel, x0 + angle_r - pixel, x0, x0 + width],
+                        x1=[x0 + width - angle_r + pixel, x0 + width - angle_r + pixel, x0, x0 + width],
+                        y0=[y0, y0 + height, y0 + angle_r - pixel, y0 + angle_r - pixel],
+                        y1=[y0, y0 + height, y0 + height - angle_r + pixel, y0 + height - angle_r + pixel],
+                        line_color=line_color, line_width=line_width)
+
+        self.static.add("arc", corner_boxes, x=corners_x, y=corners_y, radius=angle_r,
+                        start_angle=[np.pi, 3 * np.pi / 2, 0, np.pi / 2], end_angle=[3 * np.pi / 2, 0, np.pi / 2, np.pi],
+                        line_color=line_color, line_width=line_width)
 
     def add_label(self, label, x: float = 0, y: float = 0, text_color: str = "black", text_size: int = 20,
                   text_align: str = "left", text_baseline: str = "middle"):
 
-        self.fig.text(x=[x], y=[y], text=[label], text_align=text_align, text_baseline=text_baseline,
-                      text_color=text_color, text_font_size=str(text_size) + "px")
+        self.static.add("text", [self.static.text_box(x, y, label, text_size)], x=x, y=y, text=label,
+                        text_align=text_align, text_baseline=text_baseline, text_color=text_color,
+                        text_font_size=str(text_size) + "px")
 
     # def add_image(self, img_path, x0, y0, size):
     #     picture = Image.open(img_path)
@@ -437,15 +758,23 @@ class Dashboard():
     #     # self.fig.image_url(url=[img_path], x=x0, y=y0, w=size, h=size*height/width)
     #     self.fig.image_url(url=[fileurl], x=x0, y=y0, w=size, h=size*height/width)
 
-    def add_image(self, img_path, x0, y0, size):
-        image_raw = get(img_path)
-        image = Image.open(BytesIO(image_raw.content))
-        width, height = image.size
-        self.fig.image_url(url=[img_path], x=x0, y=y0, w=size, h=size*height/width)
+    def add_image(self, img_path, x0, y0, size, timeout: float = None):
+        # embedded in the document (data URI): the browser doesn't fetch it, see get_image for the timeout
+        uri, width, height = get_image(img_path, timeout=timeout)
+        self.fig.image_url(url=[uri], x=x0, y=y0, w=size, h=size*height/width)
 
     def set_values(self, new_values: dict):
-        for name, new_value in new_values.items():
-            getattr(self, name).set_value(new_value)
+        if self.dynamic is None:
+            for name, new_value in new_values.items():
+                getattr(self, name).set_value(new_value)
+            return
+        self.dynamic.batching = True
+        try:
+            for name, new_value in new_values.items():
+                getattr(self, name).set_value(new_value)
+        finally:
+            self.dynamic.batching = False
+            self.dynamic.flush()
 
     def get_gauge(self, gauge_name: str) -> Gauge:
         return getattr(self, gauge_name)
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the frame to gauge pipeline, headless and without PCAN hardware (PCANsim synthetic frames)
+
+Stages:
+    read       PCANBasic.Read overhead (simulated driver queue, already filled)
+    filter     PcanRW.ReadMessage on a shared bus, driver acceptance filter open then set
+    decode     PcanRW.ProcessMessageCan, all frames (alone, with history, rollups, alarms) and for each device family
+    dbc        decoders compiled from spet.dbc (PCANdbc) against the built-in layouts
+    status     LeclancheStatus, MpptStatus, DriveStatus, UpdateStatus without change, CheckWatchdogs staleness pass
+    shared     PCANshared block publication and consistent read, compared to PcanRW.Snapshot
+    indicators spetUI.indicator_values aggregation (_update_indicators)
+    dashboard  Dashboard.set_values of the cockpit view, with the Bokeh PATCH-DOC messages size
+
+For each measure: throughput (calls/s), p50/p99 latency (ns) and allocations (tracemalloc, bytes per call).
+Results are written as JSON, and compared to previous results to show regressions:
+
+    python spetBench.py --output bench.json
+    python spetBench.py --compare bench.json --tolerance 0.2
+
+@author: yvan
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from PCANlib import *
+from PCAN_RW import PcanRW, FRAME_LAYOUTS, LECLANCHE_LAYOUTS, MPPT_LAYOUTS, DRIVE_LAYOUTS, dbc_layouts
+from PCANsim import PCANBasicSim, SimFault
+
+
+def quiet():
+    """
+    Context without the prints of the measured functions (device search...)
+    """
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def measure(name, func, args_list, repeat=3):
+    """
+    Measures func(*args) over args_list:
+    throughput from the whole loop (best of repeat), latencies from individually timed calls,
+    allocations from a tracemalloc pass
+    """
+    perf_counter_ns = time.perf_counter_ns
+    gc.collect()
+    gc.disable()
+    try:
+        best = None
+        for _ in range(repeat):
+            t0 = perf_counter_ns()
+            for args in args_list:
+                func(*args)
+            elapsed = perf_counter_ns() - t0
+            best = elapsed if best is None else min(best, elapsed)
+
+        latencies = []
+        for args in args_list:
+            t0 = perf_counter_ns()
+            func(*args)
+            latencies.append(perf_counter_ns() - t0)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    for args in args_list:
+        func(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    n = len(args_list)
+    return {"name": name,
+            "calls": n,
+            "throughput": n * 1e9 / best if best else 0,
+            "p50_ns": latencies[n // 2],
+            "p99_ns": latencies[min(n - 1, (99 * n) // 100)],
+            "alloc_peak_bytes": (peak - base) / n,  # transient allocations, per call
+            "alloc_net_bytes": (current - base) / n}  # kept allocations, per call
+
+
+def synthetic_frames(count, seed=1):
+    """
+    count frames of module A traffic (simulated bus, 28 MPPTs, drive bursts), as (TPCANMsg, TPCANTimestamp)
+    """
+    sim = PCANBasicSim(rate=1, mppt_units=28, burst_period=10, burst_length=2, seed=seed, queue_size=count,
+                       faults=[SimFault('mppt_error', start=5, duration=5, value=0x10, unit=4)])
+    clock = [0.0]
+    sim.clock = lambda: clock[0]
+    sim.Initialize(PCAN_USBBUS1, PCAN_BAUD_250K)
+    frames = []
+    while len(frames) < count:
+        clock[0] += 1
+        status, msg, timestamp = sim.Read(PCAN_USBBUS1)
+        while status == PCAN_ERROR_OK and len(frames) < count:
+            frames.append((msg, timestamp))
+            status, msg, timestamp = sim.Read(PCAN_USBBUS1)
+    return frames
+
+
+def new_module(device_id=0x1):
+    """
+    PcanRW object on a simulated bus, watchdogs flags cleared as after a first valid check
+    """
+    with quiet():
+        module = PcanRW(device_id, PCANBasicSim(seed=device_id))
+    module.BAT_WATCHDOG_FLAG = 0
+    module.MPPT_WATCHDOG_FLAG = 0
+    module.DRIVE_WATCHDOG_FLAG = 0
+    return module
+
+
+def bench_read(frames_nb):
+    # queue filled for the throughput, latency and allocations passes
+    sim = PCANBasicSim(rate=1, mppt_units=28, seed=1, queue_size=3 * frames_nb)
+    clock = [0.0]
+    sim.clock = lambda: clock[0]
+    sim.Initialize(PCAN_USBBUS1, PCAN_BAUD_250K)
+    channel = sim.get_channel(PCAN_USBBUS1)
+    while len(channel.queue) < 3 * frames_nb:
+        clock[0] += 1
+        sim.generate(channel, clock[0])
+    channel.overrun = False
+    return [measure("PCANBasic.Read", sim.Read, [(PCAN_USBBUS1,)] * frames_nb, repeat=1)]
+
+
+# Messages of the other devices of a shared vehicle bus, about as many as the SPET ones (820 messages/s), of which
+# 160 messages/s within the 0x100-0x212 window of the driver filter (received, counted in IgnoredFrames)
+SHARED_BUS_IDS = {can_id: 0.05 for can_id in range(0x080, 0x0A0)}
+SHARED_BUS_IDS.update({can_id: 0.1 for can_id in range(0x120, 0x130)})
+SHARED_BUS_IDS.update({can_id: 0.5 for can_id in range(0x300, 0x310)})
+
+
+def bench_filter(frames_nb):
+    """
+    PcanRW.ReadMessage of frames_nb messages of a shared bus: the whole traffic read with the filter open,
+    only the SPET messages with the acceptance filter (the other ones dropped by the driver),
+    and with the hot path metrics (PCANmetrics)
+    """
+    from PCANmetrics import PcanMetrics
+    results = []
+    for name, ranges, metrics in (("open", None, False), ("filtered", PcanRW.AcceptedRanges, False),
+                                  ("filtered with metrics", PcanRW.AcceptedRanges, True)):
+        sim = PCANBasicSim(rate=1, mppt_units=28, seed=1, queue_size=3 * frames_nb, foreign_ids=SHARED_BUS_IDS)
+        clock = [0.0]
+        sim.clock = lambda: clock[0]
+        with quiet():
+            module = PcanRW(0x1, sim)
+            module.AcceptedRanges = ranges
+            module.SetFilter()
+        if metrics:
+            PcanMetrics().Attach('A', module)
+        module.BAT_WATCHDOG_FLAG = 0
+        module.MPPT_WATCHDOG_FLAG = 0
+        module.DRIVE_WATCHDOG_FLAG = 0
+        channel = sim.get_channel(PCAN_USBBUS1)
+        while len(channel.queue) < 3 * frames_nb:  # queue filled for the three passes
+            clock[0] += 1
+            sim.generate(channel, clock[0])
+        channel.overrun = False
+        result = measure("PcanRW.ReadMessage shared bus, " + name, module.ReadMessage, [()] * frames_nb, repeat=1)
+        result["read_per_bus_s"] = (channel.generated - channel.filtered) / clock[0]
+        result["dropped_per_bus_s"] = channel.filtered / clock[0]
+        results.append(result)
+    return results
+
+
+def bench_decode(frames):
+    module = new_module()
+    results = [measure("ProcessMessageCan all IDs", module.ProcessMessageCan, frames)]
+    from PCANhistory import PcanHistory
+    history_module = new_module()
+    history_module.History = PcanHistory()
+    results.append(measure("ProcessMessageCan with history", history_module.ProcessMessageCan, frames))
+    from PCANrollup import PcanRollups
+    rollups_module = new_module()
+    rollups_module.Rollups = PcanRollups()
+    results.append(measure("ProcessMessageCan with rollups", rollups_module.ProcessMessageCan, frames))
+    from PCANalarms import AlarmJournal, PcanAlarms
+    alarms_module = new_module()
+    alarms_module.Alarms = PcanAlarms(AlarmJournal(), 'A')
+    results.append(measure("ProcessMessageCan with alarms", alarms_module.ProcessMessageCan, frames))
+    for name, layouts in (("Leclanche", LECLANCHE_LAYOUTS), ("MPPT", MPPT_LAYOUTS), ("Drive", DRIVE_LAYOUTS)):
+        family = [frame for frame in frames if frame[0].ID in layouts]
+        if family:
+            results.append(measure("ProcessMessageCan " + name, module.ProcessMessageCan, family))
+    return results
+
+
+def bench_dbc(frames, path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "spet.dbc")):
+    t0 = time.perf_counter()
+    compiled = {}
+    for layouts in dbc_layouts(path):
+        compiled.update(layouts)
+    compile_s = time.perf_counter() - t0
+
+    results = []
+    decoded = []
+    for name, layouts in (("built-in", FRAME_LAYOUTS), ("DBC", compiled)):
+        module = new_module()
+        decoders = {can_id: layout.decode for can_id, layout in layouts.items()}
+        args = [(decoders[msg.ID], module, bytearray(msg.DATA)) for msg, timestamp in frames if msg.ID in decoders]
+        results.append(measure("FrameLayout.decode " + name, decode_frame, args))
+        decoded.append(module.Snapshot().__dict__)
+    results[-1]["compile_s"] = compile_s
+    results[-1]["layouts"] = len(compiled)
+    results[-1]["same_values"] = decoded[0] == decoded[1]
+    return results
+
+
+def decode_frame(decode, module, datas):
+    decode(module, datas)
+
+
+def bench_status(frames, calls):
+    module = new_module()
+    for msg, timestamp in frames:
+        module.ProcessMessageCan(msg, timestamp)
+    results = [measure(name, getattr(module, name), [()] * calls)
+               for name in ("LeclancheStatus", "MpptStatus", "DriveStatus")]
+    results.append(measure("UpdateStatus unchanged", module.UpdateStatus, [()] * calls))
+    results.append(measure("CheckWatchdogs (staleness)", module.CheckWatchdogs,
+                           [(module.ReceivedTimestamp,)] * (calls // 10)))
+    return results
+
+
+def bench_shared(frames, calls):
+    from PCANshared import SharedLayout, SharedBlock
+    module = new_module()
+    for msg, timestamp in frames:
+        module.ProcessMessageCan(msg, timestamp)
+    module.LeclancheStatus()
+    module.MpptStatus()
+    module.DriveStatus()
+    layout = SharedLayout()
+    block = SharedBlock(layout)  # acquisition process side
+    reader = SharedBlock(layout, block.Name)  # user interface side
+    try:
+        results = [measure("PcanRW.Snapshot", module.Snapshot, [()] * calls),
+                   measure("SharedBlock.Write", block.Write, [(module,)] * calls),
+                   measure("SharedBlock.Read", reader.Read, [()] * calls)]
+    finally:
+        reader.Close()
+        block.Close()
+    for result in results[1:]:
+        result["block_bytes"] = block.Size
+    return results
+
+
+def decoded_snapshots(frames, count):
+    """
+    count pairs of module A/B snapshots along the synthetic traffic
+    """
+    mod_a = new_module(0x1)
+    mod_b = new_module(0x2)
+    step = max(1, len(frames) // count)
+    snapshots = []
+    for i in range(count):
+        for msg, timestamp in frames[i * step:(i + 1) * step]:
+            mod_a.ProcessMessageCan(msg, timestamp)
+            mod_b.ProcessMessageCan(msg, timestamp)
+        snapshots.append((mod_a.Snapshot(), mod_b.Snapshot()))
+    return snapshots
+
+
+def bench_indicators(frames, calls):
+    with quiet():
+        from spetUI import indicator_values
+    snapshots = decoded_snapshots(frames, calls)
+    return [measure("indicator_values", indicator_values,
+                    [(pair, i / 60) for i, pair in enumerate(snapshots)])]
+
+
+def bench_dashboard(frames, calls):
+    with quiet():
+        from spetUI import indicator_values
+    values = [(indicator_values(pair, i / 60),) for i, pair in enumerate(decoded_snapshots(frames, calls))]
+    return [bench_board(values, consolidated=False), bench_board(values, consolidated=True)]
+
+
+def bench_board(values, consolidated):
+    from bokeh.document import Document
+    from bokeh.protocol import Protocol
+    from bokeh.core.json_encoder import serialize_json
+    with quiet():
+        from spetDashboard import cockpit_view
+
+    t0 = time.perf_counter()
+    with quiet():
+        board = cockpit_view(consolidated=consolidated)
+    build_s = time.perf_counter() - t0
+    doc = Document()
+    doc.add_root(board.fig)
+    doc_bytes = len(serialize_json(doc.to_json()))
+
+    events = []
+    doc.on_change(lambda event: events.append(event))
+    name = "Dashboard.set_values" + (" consolidated" if consolidated else "")
+    result = measure(name, board.set_values, values, repeat=1)
+
+    # websocket size of one tick: PATCH-DOC messages of the changes made by the latest set_values
+    protocol = Protocol()
+    sizes = []
+    counts = []
+    for value in values[:50]:
+        events.clear()
+        board.set_values(*value)
+        counts.append(len(events))
+        if events:
+            message = protocol.create("PATCH-DOC", events)
+            sizes.append(len(message.header_json) + len(message.metadata_json) + len(message.content_json)
+                         + sum(len(buffer.to_bytes()) for buffer in message.buffers))
+        else:
+            sizes.append(0)
+    result["patch_bytes_per_tick"] = sum(sizes) / len(sizes)
+    result["events_per_tick"] = sum(counts) / len(counts)
+    result["document_bytes"] = doc_bytes
+    result["renderers"] = len(board.fig.renderers)
+    result["build_s"] = build_s
+    return result
+
+
+STAGES = ("read", "filter", "decode", "dbc", "status", "shared", "indicators", "dashboard")
+
+
+def run(stages, frames_nb, seed):
+    random.seed(seed)
+    frames = synthetic_frames(frames_nb, seed)
+    results = []
+    for stage in stages:
+        print("stage " + stage + "...", file=sys.stderr)
+        if stage == "read":
+            stage_results = bench_read(frames_nb)
+        elif stage == "filter":
+            stage_results = bench_filter(frames_nb)
+        elif stage == "decode":
+            stage_results = bench_decode(frames)
+        elif stage == "dbc":
+            stage_results = bench_dbc(frames)
+        elif stage == "status":
+            stage_results = bench_status(frames, frames_nb // 10)
+        elif stage == "shared":
+            stage_results = bench_shared(frames, frames_nb // 10)
+        elif stage == "indicators":
+            stage_results = bench_indicators(frames, 1000)
+        else:
+            stage_results = bench_dashboard(frames, 200)
+        for result in stage_results:
+            result["stage"] = stage
+        results += stage_results
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"python": platform.python_version(), "platform": platform.platform(), "machine": platform.machine(),
+            "commit": commit, "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def compare(results, previous, tolerance):
+    """
+    Print the measures whose throughput dropped more than tolerance (0.2 = 20%), return their number
+    """
+    before = {(result["stage"], result["name"]): result for result in previous["results"]}
+    regressions = 0
+    for result in results:
+        old = before.get((result["stage"], result["name"]))
+        if old is None or not old["throughput"]:
+            continue
+        ratio = result["throughput"] / old["throughput"]
+        if ratio < 1 - tolerance:
+            regressions += 1
+            print("REGRESSION {:<40} {:>12.0f} -> {:>12.0f} calls/s ({:+.0%})".format(
+                result["name"], old["throughput"], result["throughput"], ratio - 1))
+    return regressions
+
+
+def print_results(results):
+    print("{:<11} {:<40} {:>12} {:>9} {:>9} {:>10}".format("stage", "measure", "calls/s", "p50 ns", "p99 ns", "alloc B"))
+    for result in results:
+        print("{:<11} {:<40} {:>12.0f} {:>9} {:>9} {:>10.1f}".format(
+            result["stage"], result["name"], result["throughput"], result["p50_ns"], result["p99_ns"],
+            result["alloc_peak_bytes"]))
+        if "patch_bytes_per_tick" in result:
+            print("{:<11} document {:.0f} B, {} renderers, built in {:.3f} s, {:.0f} B and {:.1f} events per tick".format(
+                "", result["document_bytes"], result["renderers"], result["build_s"],
+                result["patch_bytes_per_tick"], result["events_per_tick"]))
+        if "read_per_bus_s" in result:
+            print("{:<11} {:.0f} messages read and {:.0f} dropped by the driver per bus second, {:.1%} of a core".format(
+                "", result["read_per_bus_s"], result["dropped_per_bus_s"], result["read_per_bus_s"] / result["throughput"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SPET frame to gauge pipeline benchmarks")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma separated, among " + ", ".join(STAGES))
+    parser.add_argument("--frames", type=int, default=20000, help="synthetic frames")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON results file")
+    parser.add_argument("--compare", help="previous JSON results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="throughput drop reported as regression")
+    args = parser.parse_args()
+
+    stages = [stage for stage in args.stages.split(",") if stage]
+    for stage in stages:
+        if stage not in STAGES:
+            parser.error("unknown stage " + stage)
+
+    results = run(stages, args.frames, args.seed)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"environment": environment(), "frames": args.frames, "seed": args.seed, "results": results},
+                      file, indent=1)
+    if args.compare:
+        with open(args.compare) as file:
+            if compare(results, json.load(file), args.tolerance):
+                sys.exit(1)
@@ -3,6 +3,9 @@ from bokeh.plotting import output_file, show
 
 # import os
 
+ROMAN = ("I", "II", "III", "IV", "V", "VI", "VII", "VIII")  # module numbers on the dashboard
+STATUS_FAMILIES = (("drive", "Drive"), ("bat", "Battery"), ("mppt", "MPPT"))
+
 
 def create_rpm_indicators(board, x0, y0, label_size= 22, text_size = 25, tick_width = 6,
                          tick_length=0.3, ):
@@ -126,43 +129,65 @@ def create_mppt_indicators(board, x0, y0, ind_name, nb, label_size=13, text_size
         board.get_gauge(name).add_needle("neddle_1", needle_color="white", initial_value=10)
         board.get_gauge(name).add_inner_circle(r=0.22)
 
-def create_status_indicators(board, x0, y0, width=3.6,height=1.8, ):
-    names = ["stat_drive_1", "stat_drive_2", "stat_bat_1", "stat_bat_2","stat_mppt_1", "stat_mppt_2"]
-    labels = ["Drive I", "Drive II", "Battery I", "Battery II", "MPPT I", "MPPT II"]
-    x1 = [0.55, 2.15]
-    y1 = [1.4, 0.9, 0.4]
-    board.add_background(x0=x0, y0=y0, angle_r=0.25, width=width, height=height, fill_color="black")
-    board.add_label("Status", x=x0+width/2, y=y0+height+0.2, text_align="center", text_size=30)
-    for i, name in enumerate(names):
-        board.add_enum(name, x0=x0 + x1[i % 2], y0=y0 + y1[int(i/2)])
-        board.get_enum(name).add_label(labels[i], x=0.3, text_color="lightgray")
-
+def module_label(index):
+    return ROMAN[index] if index < len(ROMAN) else str(index + 1)
 
-def cockpit_view():
 
-    board = Dashboard(size=1000, x_lim=(0, 9.2), y_lim=(0, 8.4))
-    board.add_background(x0=0.1, y0=0.1, angle_r=0.25, width=9, height=8.2)
-    create_battery_indicators(board, x0=5.3, y0=4.1, ind_name="Battery I", gauge_nb=1)
-    create_battery_indicators(board, x0=7.8, y0=4.1, ind_name="Battery II", gauge_nb=2)
+def status_width(modules):
+    """
+    Width of the status panel: labelled enums up to 2 modules, then a grid with one column per module
+    """
+    return max(3.6, 1.8 + 0.55 * (modules - 1))
 
-    create_mppt_indicators(board, x0=5.3, y0=1.45, nb=1, ind_name="MPPT I")
-    create_mppt_indicators(board, x0=7.8, y0=1.45, nb=2, ind_name="MPPT II")
 
-    create_drive_indicators(board, x0=5.3, y0=6.75, nb=1, ind_name="Drive I")
-    create_drive_indicators(board, x0=7.8, y0=6.75, nb=2, ind_name="Drive II")
+def create_status_indicators(board, x0, y0, modules=2, height=1.8, ):
+    width = status_width(modules)
+    board.add_background(x0=x0, y0=y0, angle_r=0.25, width=width, height=height, fill_color="black")
+    board.add_label("Status", x=x0+width/2, y=y0+height+0.2, text_align="center", text_size=30)
+    if modules <= 2:
+        x1 = [0.55, 2.15]
+        y1 = [1.4, 0.9, 0.4]
+        for row, (family, label) in enumerate(STATUS_FAMILIES):
+            for i in range(modules):
+                name = "stat_" + family + "_" + str(i + 1)
+                board.add_enum(name, x0=x0 + x1[i], y0=y0 + y1[row])
+                board.get_enum(name).add_label(label + " " + module_label(i), x=0.3, text_color="lightgray")
+        return
+    y1 = [1.2, 0.75, 0.3]
+    for i in range(modules):
+        board.add_label(module_label(i), x=x0 + 1.45 + 0.55 * i, y=y0 + 1.6, text_align="center",
+                        text_color="lightgray", text_size=16)
+    for row, (family, label) in enumerate(STATUS_FAMILIES):
+        board.add_label(label, x=x0 + 0.2, y=y0 + y1[row], text_color="lightgray")
+        for i in range(modules):
+            board.add_enum("stat_" + family + "_" + str(i + 1), x0=x0 + 1.45 + 0.55 * i, y0=y0 + y1[row], r=0.17)
+
+
+def cockpit_view(modules=2, consolidated=True, merge_static=True):
+    """
+    Cockpit view of the modules (PcanModules order): rpm, status and logo on the left, then a column of
+    drive, battery and MPPT gauges per module, numbered I, II...
+    """
+    x_modules = max(5.3, 1.7 + status_width(modules))  # first column, right of the status panel
+    width = round(x_modules + 2.5 * modules - 1.1, 2)
+    board = Dashboard(size=int(round(1000 * width / 9.2)), x_lim=(0, width), y_lim=(0, 8.4),
+                      consolidated=consolidated, merge_static=merge_static)
+    board.add_background(x0=0.1, y0=0.1, angle_r=0.25, width=width - 0.2, height=8.2)
+    for i in range(modules):
+        create_battery_indicators(board, x0=x_modules + 2.5 * i, y0=4.1, ind_name="Battery " + module_label(i),
+                                  gauge_nb=i + 1)
+    for i in range(modules):
+        create_mppt_indicators(board, x0=x_modules + 2.5 * i, y0=1.45, nb=i + 1, ind_name="MPPT " + module_label(i))
+    for i in range(modules):
+        create_drive_indicators(board, x0=x_modules + 2.5 * i, y0=6.75, nb=i + 1, ind_name="Drive " + module_label(i))
 
     create_rpm_indicators(board, x0=2.1, y0=4.05)
-    create_status_indicators(board, x0=0.3, y0=6.05)
+    create_status_indicators(board, x0=0.3, y0=6.05, modules=modules)
 
-    img_path = "https://heig-vd.ch/images/default-source/img-institut-iese/iese_heig-vd_logotype_rouge-rvb.png?sfvrsn=345f44e5_0"
     try:
-        board.add_image(img_path, x0=0.3, y0=1.4, size=3)
-    except:
-        print("no internet connection to add logo")
-
-    ## local file display doesn't work (grey zone...)
-    # img_path = os.path.join(os.getcwd(), 'iese_heig-vd_logotype_rouge-rvb.png')
-    # board.add_image(img_path, x0=0.3, y0=0.3, size=3.5)  # 4 division de pixels entiers (1024x352)
+        board.add_image("iese_heig-vd_logotype_rouge-rvb.png", x0=0.3, y0=1.4, size=3)  # bundled, 1024x352
+    except FileNotFoundError:
+        print("logo file not found")
 
     return board
 
@@ -0,0 +1,182 @@
+"""
+Diagnostic view: live time series of both SPET modules (battery voltage/current, cells min/max voltage,
+MPPT power per unit, drive phase currents), from the PcanRW histories (PCANhistory)
+
+Each update only streams the new samples (ColumnDataSource.stream), with rollover: the browser keeps a fixed
+number of points. When more samples arrived than the points budget of an update, they are decimated on the server
+by keeping the min and max of each signal per bin, so peaks remain visible.
+
+@author: yvan
+"""
+
+import numpy as np
+from bokeh.layouts import gridplot
+from bokeh.models import ColumnDataSource, DataRange1d
+from bokeh.palettes import Category10_10
+from bokeh.plotting import figure
+
+from PCANhistory import signal_names
+from PCAN_RW import MPPT_FIRST_ID
+
+MODULE_DASHES = ("solid", "dashed", "dotted", "dashdot")  # modules A, B... (then again)
+
+
+def decimate_min_max(columns, bins):
+    """
+    Indexes of the samples to keep: first, last, and the min and max of each column in each of the bins
+    (in time order, without duplicates)
+    """
+    length = len(columns[0])
+    if length <= 2 * bins:
+        return np.arange(length)
+    keep = [0, length - 1]
+    edges = np.linspace(0, length, bins + 1).astype(int)
+    for start, stop in zip(edges[:-1], edges[1:]):
+        for values in columns:
+            window = values[start:stop]
+            keep.append(start + int(np.argmin(window)))
+            keep.append(start + int(np.argmax(window)))
+    return np.unique(keep)
+
+
+def column_name(signal):
+    return signal.replace("[", "_").replace("]", "")  # MPPT_W[3] -> MPPT_W_3
+
+
+class StreamedGroup:
+    """
+    Samples of one CAN ID of one module streamed in a ColumnDataSource ("t" and a column per plotted signal)
+    """
+    def __init__(self, module, can_id, rollover, bins, window):
+        self.module = module
+        self.can_id = can_id
+        self.signals = []
+        self.columns = []
+        self.rollover = rollover
+        self.bins = bins
+        self.window = window  # s of history sent at the first update
+        self.last_time = None
+        self.times = None  # new samples, between fetch and stream
+        self.values = None
+        self.source = ColumnDataSource({"t": []})
+
+    def column(self, signal):
+        """
+        Column name of a signal of this CAN ID, added to the streamed ones
+        """
+        if signal not in signal_names(self.can_id):
+            raise ValueError(signal + " is not a signal of CAN ID " + hex(self.can_id))
+        if signal not in self.signals:
+            self.signals.append(signal)
+            self.columns.append(column_name(signal))
+            self.source.data[self.columns[-1]] = []
+        return column_name(signal)
+
+    def fetch(self):
+        """
+        Copies of the samples received since the last update (the last window seconds at the first one),
+        returns the time of the first new sample, None if none
+        """
+        history = self.module.History
+        self.times = None
+        if history is None or not self.signals:
+            return None
+        with self.module.Lock:  # the reader thread appends meanwhile
+            if self.last_time is None:
+                times, values = history.Signal(self.signals[0], seconds=self.window)
+                start = times[0] if len(times) else None
+            else:
+                start = np.nextafter(self.last_time, np.inf)
+            columns = []
+            for signal in self.signals:
+                times, values = history.Signal(signal, start=start)
+                columns.append(values.copy())
+            times = times.copy()
+        if not len(times):
+            return None
+        self.times = times
+        self.values = columns
+        self.last_time = times[-1]
+        return times[0]
+
+    def stream(self, t0):
+        """
+        Send the fetched samples, decimated, x axis in s from t0
+        """
+        if self.times is None:
+            return
+        keep = decimate_min_max(self.values, self.bins)
+        data = {"t": self.times[keep] - t0}
+        for name, values in zip(self.columns, self.values):
+            data[name] = values[keep]
+        self.source.stream(data, rollover=self.rollover)
+        self.times = None
+        self.values = None
+
+
+class DiagnosticView:
+    """
+    Figures of the diagnostic tab, one per Bokeh document (session)
+    modules = {"A": PcanRW, "B": PcanRW}, with their History set
+    """
+    def __init__(self, modules, mppt_units=10, rollover=3000, bins=25, window=120, width=700, height=260):
+        self.modules = modules
+        self.rollover = rollover
+        self.bins = bins
+        self.window = window
+        self.groups = {}  # (module name, CAN ID) -> StreamedGroup
+        self.t0 = None  # s, time origin of the x axes (first sample)
+        self.x_range = DataRange1d(follow="end", follow_interval=window, range_padding=0)  # shared, following the latest samples
+
+        figures = []
+        figures.append(self.add_figure("Battery voltage [V]", 0x101, ["BAT_VOLTAGE"], width, height))
+        figures.append(self.add_figure("Battery current [A]", 0x101, ["BAT_CURRENT"], width, height))
+        figures.append(self.add_figure("Cell voltage min / max [V]", 0x102, ["CELL_V_MIN", "CELL_V_MAX"], width, height))
+        figures.append(self.add_figure("Drive phase currents [Arms]", 0x1AC,
+                                       ["DRIVE_MOTOR_CURRENT_U", "DRIVE_MOTOR_CURRENT_V", "DRIVE_MOTOR_CURRENT_W"],
+                                       width, height))
+        for name in self.modules:
+            mppt_figure = self.new_figure("MPPT power, module " + name + " [W]", width, height)
+            for unit in range(mppt_units):
+                group = self.get_group(name, MPPT_FIRST_ID + 3*unit + 2)
+                mppt_figure.line("t", group.column("MPPT_W[" + str(unit) + "]"), source=group.source,
+                                 color=Category10_10[unit % 10], legend_label=str(unit))
+            mppt_figure.legend.orientation = "horizontal"
+            mppt_figure.legend.click_policy = "hide"
+            figures.append(mppt_figure)
+        self.layout = gridplot(figures, ncols=2, sizing_mode="stretch_width")
+
+    def new_figure(self, title, width, height):
+        return figure(title=title, width=width, height=height, x_range=self.x_range, x_axis_label="s",
+                      output_backend="webgl", tools="xpan,xwheel_zoom,reset,save", active_scroll="xwheel_zoom")
+
+    def get_group(self, name, can_id):
+        key = (name, can_id)
+        if key not in self.groups:
+            self.groups[key] = StreamedGroup(self.modules[name], can_id, self.rollover, self.bins, self.window)
+        return self.groups[key]
+
+    def add_figure(self, title, can_id, signals, width, height):
+        fig = self.new_figure(title, width, height)
+        for i, name in enumerate(self.modules):
+            dash = MODULE_DASHES[i % len(MODULE_DASHES)]
+            group = self.get_group(name, can_id)
+            for color, signal in zip(Category10_10, signals):
+                fig.line("t", group.column(signal), source=group.source, color=color, line_dash=dash,
+                         legend_label=signal.lower() + " " + name)
+        fig.legend.location = "top_left"
+        fig.legend.click_policy = "hide"
+        return fig
+
+    def update(self):
+        """
+        Periodic call: stream the new samples of all the figures
+        """
+        starts = [group.fetch() for group in self.groups.values()]
+        if self.t0 is None:
+            starts = [start for start in starts if start is not None]
+            if not starts:
+                return
+            self.t0 = min(starts)
+        for group in self.groups.values():
+            group.stream(self.t0)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures of the SPET tests: modules of the flat src directory (Source Root), PcanRW objects and frames of a simulated
+bus (PCANsim)
+
+    python -m pytest -q
+
+@author: yvan
+"""
+
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC)
+
+from PCANlib import *
+from PCAN_RW import PcanRW
+from PCANsim import PCANBasicSim, SimFault
+
+
+@pytest.fixture
+def new_module():
+    """
+    new_module(device_id=0x1, pcan_basic=None): PcanRW object on a simulated bus (default), watchdogs flags cleared
+    as after a first valid check, reader stopped at the end of the test
+    """
+    modules = []
+
+    def new_module(device_id=0x1, pcan_basic=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            module = PcanRW(device_id, PCANBasicSim(seed=device_id) if pcan_basic is None else pcan_basic)
+        module.BAT_WATCHDOG_FLAG = 0
+        module.MPPT_WATCHDOG_FLAG = 0
+        module.DRIVE_WATCHDOG_FLAG = 0
+        modules.append(module)
+        return module
+    yield new_module
+    for module in modules:
+        module.StopReader()
+
+
+@pytest.fixture
+def module(new_module):
+    """
+    PcanRW object of device ID 0x1 on a simulated bus
+    """
+    return new_module()
+
+
+@pytest.fixture
+def send():
+    """
+    send(module, can_id, datas, seconds): ProcessMessageCan of a frame received at a hardware time (s)
+    """
+    def send(module, can_id, datas, seconds):
+        msg = TPCANMsg()
+        msg.ID = can_id
+        msg.LEN = 8
+        msg.MSGTYPE = PCAN_MESSAGE_STANDARD.value
+        msg.DATA[:] = bytes(datas)
+        micros = round(seconds * 1000000)
+        timestamp = TPCANTimestamp()
+        timestamp.micros = micros % 1000
+        timestamp.millis = (micros // 1000) & 0xFFFFFFFF
+        timestamp.millis_overflow = (micros // 1000) >> 32
+        module.ProcessMessageCan(msg, timestamp)
+    return send
+
+
+@pytest.fixture(scope='session')
+def frames():
+    """
+    20000 frames of module A traffic (28 MPPTs, drive bursts, an MPPT error), as (TPCANMsg, TPCANTimestamp)
+    """
+    sim = PCANBasicSim(rate=1, mppt_units=28, burst_period=10, burst_length=2, seed=1, queue_size=20000,
+                       faults=[SimFault('mppt_error', start=5, duration=5, value=0x10, unit=4)])
+    clock = [0.0]
+    sim.clock = lambda: clock[0]
+    sim.Initialize(PCAN_USBBUS1, PCAN_BAUD_250K)
+    frames = []
+    while len(frames) < 20000:
+        clock[0] += 1
+        status, msg, timestamp = sim.Read(PCAN_USBBUS1)
+        while status == PCAN_ERROR_OK and len(frames) < 20000:
+            frames.append((msg, timestamp))
+            status, msg, timestamp = sim.Read(PCAN_USBBUS1)
+    return frames
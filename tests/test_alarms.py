@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Edge detection of the flag words and watchdogs (PcanAlarms) in the alarm journal
+
+@author: yvan
+"""
+
+from PCAN_RW import *
+from PCANalarms import AlarmJournal, PcanAlarms, WATCHDOG_CODE
+
+DATAS = bytes([0x01, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])  # non-zero values, no watchdog error bit
+
+
+def send_all(send, module, seconds):
+    """
+    All the decoded messages received at seconds
+    """
+    for can_id in sorted(FRAME_LAYOUTS):
+        send(module, can_id, DATAS, seconds)
+
+
+def test_flag_edges(module, send):
+    journal = AlarmJournal()
+    module.Alarms = PcanAlarms(journal, 'A')
+    send(module, 0x105, bytes([0, 0, 0, 0x05, 0, 0, 0, 0]), 10.0)  # codes 1 and 3 raised
+    send(module, 0x105, bytes([0, 0, 0, 0x05, 0, 0, 0, 0]), 10.1)  # unchanged, no event
+    send(module, 0x105, bytes([0, 0, 0, 0x04, 0, 0, 0, 0x02]), 10.2)  # code 1 cleared, warning 2 raised
+    send(module, MPPT_FIRST_ID + 3 * 4, bytes([0, 0, 0, 0x10, 0, 0, 0, 0]), 10.3)  # MPPT 4 code 5
+    events = [(timestamp, module_name, unit, source, code, rising)
+              for time_s, timestamp, module_name, unit, source, code, rising in journal.Query()]
+    assert events == [(10.0, 'A', None, 'BAT_FLAGS_ERR', 1, True), (10.0, 'A', None, 'BAT_FLAGS_ERR', 3, True),
+                      (10.2, 'A', None, 'BAT_FLAGS_ERR', 1, False), (10.2, 'A', None, 'BAT_FLAGS_WARN', 2, True),
+                      (10.3, 'A', 4, 'MPPT_ERR', 5, True)]
+    assert [event[4] for event in journal.Query(code=1)] == ['BAT_FLAGS_ERR', 'BAT_FLAGS_ERR']
+    assert [event[3] for event in journal.Query(unit=4)] == [4]
+
+
+def test_watchdog_edges(module, send):
+    journal = AlarmJournal()
+    module.Alarms = PcanAlarms(journal, 'A')
+    send_all(send, module, 20.0)
+    module.CheckWatchdogs(20.1)
+    module.CheckWatchdogs(22.0)  # all stale
+    module.CheckWatchdogs(22.1)  # still stale, no new edge
+    send_all(send, module, 22.2)
+    module.CheckWatchdogs(22.3)
+    edges = [(timestamp, source, rising) for time_s, timestamp, module_name, unit, source, code, rising
+             in journal.Query(code=WATCHDOG_CODE)]
+    assert edges == [(22.0, 'BAT_WATCHDOG', True), (22.0, 'MPPT_WATCHDOG', True), (22.0, 'DRIVE_WATCHDOG', True),
+                     (22.3, 'BAT_WATCHDOG', False), (22.3, 'MPPT_WATCHDOG', False), (22.3, 'DRIVE_WATCHDOG', False)]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Dashboard updates (customDashboard): patches of the shared DynamicSource, pixel deadband of the needles
+
+@author: yvan
+"""
+
+import math
+
+import pytest
+from bokeh.models import ColumnDataSource
+from bokeh.plotting import figure
+
+from customDashboard import DynamicSource, Needle
+
+
+@pytest.fixture
+def patches(monkeypatch):
+    """
+    Arguments of the ColumnDataSource.patch() calls
+    """
+    calls = []
+    patch = ColumnDataSource.patch
+
+    def recorded_patch(source, patches, setter=None):
+        calls.append(patches)
+        patch(source, patches, setter)
+    monkeypatch.setattr(ColumnDataSource, 'patch', recorded_patch)
+    return calls
+
+
+def test_flush_single_patch_of_changed_rows(patches):
+    dynamic = DynamicSource(digits=4)
+    for row in range(3):
+        dynamic.add_row(x0=row, y0=0, text="-", color="gray")
+    dynamic.batching = True
+    dynamic.update(0, x1=0.123456, text="12 V")
+    dynamic.update(1, x1=0.0, text="-", color="gray")  # unchanged values
+    dynamic.update(2, x0=2.00001, color="green")  # x0 unchanged once rounded
+    dynamic.update(0, text="13 V")  # last value of the tick kept
+    assert patches == []
+
+    dynamic.flush()
+    assert patches == [{'x1': [(0, 0.1235)], 'text': [(0, "13 V")], 'color': [(2, "green")]}]
+    dynamic.flush()
+    assert len(patches) == 1 and dynamic.changes == {}
+
+    dynamic.batching = False
+    dynamic.update(1, alpha=0.5)
+    assert patches[1:] == [{'alpha': [(1, 0.5)]}]
+
+
+def test_needle_pixel_deadband(patches):
+    pixcel_factor = 100  # pixels per data unit
+    dynamic = DynamicSource(digits=6)
+    needle = Needle(figure(), 0, 0, math.pi, 0, 0, 100, needle_lenght=0.9, dynamic=dynamic,
+                    pixcel_factor=pixcel_factor, deadband=1)
+    steps = len(needle.positions) - 1
+    assert steps == math.ceil(math.pi * 0.9 * pixcel_factor)
+    value_per_pixel = 100 / steps
+    del patches[:]
+
+    needle.set_needle_value(0.4 * value_per_pixel)  # under the deadband: dropped
+    needle.set_needle_value(-5)  # below the scale, still at the start
+    assert patches == [] and needle.step == 0
+
+    needle.set_needle_value(1.01 * value_per_pixel)  # 1 pixel
+    assert len(patches) == 1 and needle.step == 1
+    (row, x1), = patches[0]['x1']
+    (row, y1), = patches[0]['y1']
+    assert math.hypot(x1 + 0.9, y1) * pixcel_factor == pytest.approx(1, abs=0.01)  # tip moved
+
+    needle.set_needle_value(1.5 * value_per_pixel)
+    needle.set_needle_value(float('nan'))
+    assert len(patches) == 1
+
+    coarse = Needle(figure(), 0, 0, math.pi, 0, 0, 100, needle_lenght=0.9, dynamic=dynamic,
+                    pixcel_factor=pixcel_factor, deadband=4)
+    assert len(coarse.positions) - 1 == math.ceil(math.pi * 0.9 * pixcel_factor / 4)
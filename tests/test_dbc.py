@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Layouts compiled from spet.dbc (PCANdbc) against the built-in tables of PCAN_RW.py: same formats, fields, watchdogs,
+and same decoded state on random frames
+
+@author: yvan
+"""
+
+import os
+import random
+
+import PCAN_RW
+from PCAN_RW import *
+from PCANshared import template_module
+
+
+def random_frames(rng, can_ids, count):
+    return [(rng.choice(can_ids), bytearray(rng.getrandbits(8) for _ in range(8))) for _ in range(count)]
+
+
+def test_dbc_layouts_match_builtin():
+    leclanche, mppt, drive = dbc_layouts(os.path.join(os.path.dirname(PCAN_RW.__file__), 'spet.dbc'))
+    compiled = {**leclanche, **mppt, **drive}
+    assert set(compiled) == set(FRAME_LAYOUTS)
+    for can_id, builtin in FRAME_LAYOUTS.items():
+        layout = compiled[can_id]
+        assert field_codes(layout.struct.format) == field_codes(builtin.struct.format), hex(can_id)
+        assert layout.fields == builtin.fields, hex(can_id)
+        assert (layout.watchdog, layout.watchdog_bit, layout.unit, layout.post, layout.offsets) == \
+               (builtin.watchdog, builtin.watchdog_bit, builtin.unit, builtin.post, builtin.offsets), hex(can_id)
+
+    builtin_module, dbc_module = template_module(), template_module()
+    rng = random.Random(2)
+    for can_id, datas in random_frames(rng, sorted(compiled), 20000):
+        FRAME_LAYOUTS[can_id].decode(builtin_module, datas)
+        compiled[can_id].decode(dbc_module, datas)
+    assert builtin_module.Integers.tobytes() == dbc_module.Integers.tobytes()
+    assert builtin_module.Floats.tobytes() == dbc_module.Floats.tobytes()
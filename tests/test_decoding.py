@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Decoding equivalence: the precompiled FrameLayout decoders against the former per ID decoding (hex strings of the
+data bytes, hex2num, i16, hex2float)
+
+@author: yvan
+"""
+
+import random
+
+from PCAN_RW import *
+
+
+def unsigned(datas, first, end):
+    return hex2num(bytes(datas[first:end]).hex())
+
+
+def signed(datas, first, end):
+    return i16(unsigned(datas, first, end))
+
+
+def single(datas, first):
+    return hex2float(bytes(datas[first:first + 4]).hex())
+
+
+# CAN ID -> baseline decoding, {name: value} of the data bytes
+BASELINE = {
+    0x100: lambda d: {'BAT_HEARTBEAT1': d[0], 'BAT_SOC': d[1] / 2, 'BAT_ACTIVE_ERR': d[2], 'BAT_ACTIVE_WARN': d[3],
+                      'BAT_CHARGE_I_LIM': unsigned(d, 4, 6) / 10, 'BAT_DISCHARGE_I_LIM': unsigned(d, 6, 8) / 10},
+    0x101: lambda d: {'BAT_HEARTBEAT2': d[0], 'BAT_SOH': d[1] / 2, 'BAT_STATUS_1': d[2], 'BAT_STATUS_2': d[3],
+                      'BAT_VOLTAGE': unsigned(d, 4, 6) / 10, 'BAT_CURRENT': signed(d, 6, 8) / 10,
+                      'BMS_OK': d[2] & 0x01, 'BMS_IDLE': d[2] & 0x02, 'BMS_CHARGE': d[2] & 0x04,
+                      'BMS_DISCHARGE': d[2] & 0x08, 'BAT_FULL': d[3] & 0x01,
+                      'BAT_POWER': unsigned(d, 4, 6) / 10 * (signed(d, 6, 8) / 10) / 1000},
+    0x102: lambda d: {'CELL_V_MIN': unsigned(d, 0, 2) / 1000, 'CELL_V_MIN_ID': unsigned(d, 2, 4),
+                      'CELL_V_MAX': unsigned(d, 4, 6) / 1000, 'CELL_V_MAX_ID': unsigned(d, 6, 8)},
+    0x103: lambda d: {'BAT_T_MIN': signed(d, 0, 2) / 10, 'BAT_T_MEAN': signed(d, 2, 4) / 10,
+                      'BAT_T_MAX': signed(d, 4, 6) / 10, 'BAT_T_MIN_ID': d[6], 'BAT_T_MAX_ID': d[7]},
+    0x104: lambda d: {'BAT_STATE_CHARGING': d[0], 'BAT_STATE_DISCHARGING': d[1], 'BAT_STATE_CONTACTOR_1': d[2],
+                      'BAT_STATE_CONTACTOR_2': d[3], 'BAT_STATE_CONTACTOR_3': d[4], 'BAT_STATE_CONTACTOR_4': d[5],
+                      'BAT_STATE_BALANCING': d[6], 'GPIO': d[7], 'BAT_IO_1': d[7] & 0x01, 'BAT_IO_2': d[7] & 0x02,
+                      'BAT_IO_3': d[7] & 0x04, 'BAT_IO_4': d[7] & 0x08, 'BAT_IO_5': d[7] & 0x10},
+    0x105: lambda d: {'BAT_FLAGS_ERR': unsigned(d, 0, 4), 'BAT_FLAGS_WARN': unsigned(d, 4, 8)},
+    0x1AA: lambda d: {'DRIVE_ERR': unsigned(d, 0, 4), 'DRIVE_WARN': unsigned(d, 4, 8)},
+    0x1AB: lambda d: {'DRIVE_MOTOR_MECA_POWER': single(d, 0), 'DRIVE_ELEC_POWER': single(d, 4)},
+    0x1AC: lambda d: {'DRIVE_MOTOR_CURRENT_U': signed(d, 0, 2) / 100, 'DRIVE_MOTOR_CURRENT_V': signed(d, 2, 4) / 100,
+                      'DRIVE_MOTOR_CURRENT_W': signed(d, 4, 6) / 100, 'DRIVE_DC_BUS_V': unsigned(d, 6, 8) / 100},
+    0x1AD: lambda d: {'DRIVE_MOTOR_TORQUE': single(d, 0), 'DRIVE_MOTOR_SPEED': single(d, 4)},
+    0x1AE: lambda d: {'DRIVE_MOTOR_POSITION': unsigned(d, 0, 2) / 100, 'DRIVE_POWER_ORDER': unsigned(d, 2, 4) / 100,
+                      'DRIVE_RESERVED1': unsigned(d, 4, 6), 'DRIVE_POWER_LEVER': unsigned(d, 6, 8) / 100},
+    0x1AF: lambda d: {'DRIVE_HOURS': single(d, 0), 'DRIVE_PCB_TEMP': signed(d, 4, 6) / 100,
+                      'DRIVE_MOTOR_TEMP': signed(d, 6, 8) / 100},
+    0x1B0: lambda d: {'DRIVE_SIC_U_TEMP': signed(d, 0, 2) / 100, 'DRIVE_SIC_V_TEMP': signed(d, 2, 4) / 100,
+                      'DRIVE_SIC_W_TEMP': signed(d, 4, 6) / 100, 'DRIVE_RESERVED2': unsigned(d, 6, 8)},
+    0x1B1: lambda d: {'DRIVE_INPUT_0': d[0], 'DRIVE_INPUT_1': d[1], 'DRIVE_INPUT_2': d[2], 'DRIVE_INPUT_3': d[3],
+                      'DRIVE_OUTPUT_0': d[4], 'DRIVE_OUTPUT_1': d[5], 'DRIVE_OUTPUT_2': d[6], 'DRIVE_OUTPUT_3': d[7]},
+    0x1B2: lambda d: {'DRIVE_ANALOG_INPUT_1': single(d, 0), 'DRIVE_ANALOG_INPUT_2': single(d, 4)},
+}
+MPPT_BASELINE = (
+    lambda d: {'MPPT_ERR': unsigned(d, 0, 4), 'MPPT_WARN': unsigned(d, 4, 8)},
+    lambda d: {'MPPT_IN_V': unsigned(d, 0, 2) / 100, 'MPPT_IN_A': unsigned(d, 2, 4) / 1000,
+               'MPPT_IN_W': unsigned(d, 4, 6) / 100, 'MPPT_T1': signed(d, 6, 8) / 100},
+    lambda d: {'MPPT_V': unsigned(d, 0, 2) / 100, 'MPPT_A': unsigned(d, 2, 4) / 1000,
+               'MPPT_W': unsigned(d, 4, 6) / 100, 'MPPT_T2': signed(d, 6, 8) / 100},
+)
+# watchdog -> first CAN ID, bits of its consecutive messages
+WATCHDOG_BITS = {'BAT_WATCHDOG': (0x100, (0x01, 0x02, 0x04, 0x08, 0x10, 0x20)),
+                 'MPPT_WATCHDOG': (MPPT_FIRST_ID, (0x01, 0x02, 0x04)),
+                 'DRIVE_WATCHDOG': (0x1AA, (0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80, 0x100))}
+
+
+def same(value, expected):
+    return value == expected or (value != value and expected != expected)  # NaN floats
+
+
+def random_frames(rng, can_ids, count):
+    return [(rng.choice(can_ids), bytearray(rng.getrandbits(8) for _ in range(8))) for _ in range(count)]
+
+
+def test_layouts_match_baseline(module, send):
+    assert set(FRAME_LAYOUTS) == set(BASELINE) | set(range(MPPT_FIRST_ID, MPPT_FIRST_ID + 3 * MPPT_UNITS))
+    rng = random.Random(1)
+    for number, (can_id, datas) in enumerate(random_frames(rng, sorted(FRAME_LAYOUTS), 20000)):
+        send(module, can_id, datas, number / 1000)
+        if can_id in BASELINE:
+            expected = BASELINE[can_id](datas)
+            decoded = {name: getattr(module, name) for name in expected}
+        else:
+            unit, message = divmod(can_id - MPPT_FIRST_ID, 3)
+            expected = MPPT_BASELINE[message](datas)
+            decoded = {name: getattr(module, name)[unit] for name in expected}
+            assert module.MPPT_ID == unit
+        assert all(same(decoded[name], value) for name, value in expected.items()), (hex(can_id), decoded, expected)
+        assert all(type(decoded[name]) == type(value) for name, value in expected.items()), hex(can_id)
+
+
+def test_layouts_activate_watchdog_bits(module, send):
+    for watchdog, (first, bits) in WATCHDOG_BITS.items():
+        if watchdog == 'MPPT_WATCHDOG':
+            for unit in range(MPPT_UNITS):
+                for message, bit in enumerate(bits):
+                    send(module, first + 3 * unit + message, bytes(8), 1.0)
+                    assert module.MPPT_WATCHDOG[unit] == (bit << 1) - 1
+        else:
+            setattr(module, watchdog, 0)
+            for can_id, bit in zip(range(first, first + len(bits)), bits):
+                send(module, can_id, bytes(8), 1.0)
+                assert getattr(module, watchdog) == (bit << 1) - 1, hex(can_id)
+
+
+def test_ignored_and_sdo_frames(module, send):
+    state = module.Integers.tobytes(), module.Floats.tobytes()
+    for can_id in LECLANCHE_SDO_NAMES:
+        send(module, can_id, bytes(range(8)), 1.0)
+    send(module, 0x300, bytes(range(8)), 1.0)
+    assert (module.SdoFrames, module.IgnoredFrames) == (len(LECLANCHE_SDO_NAMES), 1)
+    assert (module.Integers.tobytes(), module.Floats.tobytes()) == state
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+PcanDiscovery: PCAN_ATTACHED_CHANNELS, then LookUpChannel, then probe of the channels, map kept in its JSON file
+
+@author: yvan
+"""
+
+import json
+
+from PCANlib import *
+from PCAN_RW import value_of
+from PCANdiscovery import PcanDiscovery
+from PCANsim import PCANBasicSim
+
+DEVICES = {PCAN_USBBUS2.value: 0x1, PCAN_USBBUS3.value: 0x2}  # module A plugged second
+
+
+class LookUpSim(PCANBasicSim):
+    """
+    Older driver: PCAN_ATTACHED_CHANNELS not supported
+    """
+    def GetValue(self, Channel, Parameter):
+        if value_of(Parameter) in (PCAN_ATTACHED_CHANNELS.value, PCAN_ATTACHED_CHANNELS_COUNT.value):
+            return PCAN_ERROR_ILLPARAMTYPE, 0
+        return PCANBasicSim.GetValue(self, Channel, Parameter)
+
+
+class ProbeSim(LookUpSim):
+    """
+    Older driver: neither PCAN_ATTACHED_CHANNELS nor LookUpChannel
+    """
+    def LookUpChannel(self, Parameters):
+        raise AttributeError("LookUpChannel not in this PCAN-Basic version")
+
+
+def test_attached_channels():
+    discovery = PcanDiscovery(PCANBasicSim(devices=DEVICES))
+    assert discovery.Find(0x1) == PCAN_USBBUS2.value
+    assert discovery.Handles == {0x1: PCAN_USBBUS2.value, 0x2: PCAN_USBBUS3.value}
+    assert discovery.Find(0x2) == PCAN_USBBUS3.value and discovery.Discoveries == 1  # from the map
+    assert discovery.Find(0x3) == PCAN_NONEBUS.value and discovery.Discoveries == 2
+
+
+def test_look_up_channel():
+    discovery = PcanDiscovery(LookUpSim(devices=DEVICES))
+    assert discovery.AttachedChannels() is None
+    assert discovery.Find(0x2) == PCAN_USBBUS3.value
+    assert discovery.Find(0x1) == PCAN_USBBUS2.value
+    assert discovery.Handles == {0x1: PCAN_USBBUS2.value, 0x2: PCAN_USBBUS3.value}
+
+
+def test_probe_keeps_occupied_channels():
+    sim = ProbeSim(devices=DEVICES)
+    discovery = PcanDiscovery(sim, channels=(PCAN_USBBUS1, PCAN_USBBUS2, PCAN_USBBUS3))
+    assert discovery.LookUp(0x1) is None
+    assert discovery.Find(0x2) == PCAN_USBBUS3.value
+    assert discovery.Handles == {0x1: PCAN_USBBUS2.value, 0x2: PCAN_USBBUS3.value}
+    assert not any(channel.initialized for channel in sim.channels.values())  # probed channels released
+
+    sim.Initialize(PCAN_USBBUS2, PCAN_BAUD_250K)  # in use by module A
+    assert discovery.Find(0x2, refresh=True) == PCAN_USBBUS3.value
+    assert discovery.Handles == {0x1: PCAN_USBBUS2.value, 0x2: PCAN_USBBUS3.value}
+    assert sim.get_channel(PCAN_USBBUS2).initialized
+
+    discovery.Handles = {0x2: PCAN_USBBUS3.value}  # unknown device of an occupied channel: not mapped
+    assert discovery.Find(0x1, refresh=True) == PCAN_NONEBUS.value
+
+
+def test_map_saved_and_loaded(tmp_path):
+    path = str(tmp_path / 'pcan_channels.json')
+    discovery = PcanDiscovery(PCANBasicSim(devices=DEVICES), path=path)
+    discovery.Find(0x1)
+    with open(path) as file:
+        assert json.load(file) == {'0x1': PCAN_USBBUS2.value, '0x2': PCAN_USBBUS3.value}
+
+    sim = ProbeSim(devices=DEVICES)
+    reloaded = PcanDiscovery(sim, path=path)
+    assert reloaded.Find(0x1) == PCAN_USBBUS2.value and reloaded.Discoveries == 0
+    assert not any(channel.initialized for channel in sim.channels.values())  # nothing probed
+
+    with open(path, 'w') as file:
+        file.write('{not json')
+    assert PcanDiscovery(sim, path=path).Handles == {}
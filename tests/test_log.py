@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+PcanLog of the recorded segments: seek and filters, replay through the PcanRW decoding equal to the recorded session
+
+@author: yvan
+"""
+
+from bisect import bisect_left
+
+from PCANlib import *
+from PCANrecorder import PcanRecorder
+from PCANlog import PcanLog, PCANBasicReplay, replay
+
+
+def record(new_module, directory, frames):
+    """
+    Module A decoding frames with a recorder in directory (64 kB segments), returns the module
+    """
+    recorder = PcanRecorder(directory, segment_size=64 * 1024, retention_size=0)
+    module = new_module()
+    module.Recorder = recorder
+    for msg, timestamp in frames:
+        module.ProcessMessageCan(msg, timestamp)
+    recorder.Close()
+    return module
+
+
+def snapshot_values(module):
+    snapshot = module.Snapshot()
+    return snapshot.Integers.tobytes(), snapshot.Floats.tobytes()
+
+
+def test_seek_and_filters(tmp_path, new_module, frames):
+    record(new_module, str(tmp_path), frames)
+    log = PcanLog(str(tmp_path))
+    records = list(log.Frames())
+    assert len(log) == len(records) == len(frames)
+    timestamps = [record[0] for record in records]
+    assert timestamps == sorted(timestamps)
+    for timestamp in range(log.Start - 10, log.End + 10, max(1, (log.End - log.Start) // 500)):
+        assert log.Seek(timestamp) == bisect_left(timestamps, timestamp), timestamp
+
+    start, end = log.TimestampAt(0.01), log.TimestampAt(0.03)
+    selected = list(log.Frames(start, end, can_ids=[0x100, 0x1AA]))
+    assert selected and selected == [record for record in records
+                                     if start <= record[0] < end and record[1] in (0x100, 0x1AA)]
+    log.Close()
+
+    reopened = PcanLog(str(tmp_path))  # from the saved indexes
+    assert list(reopened.Frames(start, end, can_ids=[0x100, 0x1AA])) == selected
+    reopened.Close()
+
+
+def test_device_filter(tmp_path):
+    recorder = PcanRecorder(str(tmp_path))
+    for device_id in (0x1, 0x123, 0xFFFFFFFF):
+        recorder.Record(1000 + device_id, device_id, 0x100, 8, PCAN_MESSAGE_STANDARD.value, bytes(range(8)))
+    recorder.Close()
+    log = PcanLog(str(tmp_path))
+    assert [record[2] for record in log.Frames(device_id=0x123)] == [0x123]
+    log.Close()
+
+
+def test_replay_equals_session(tmp_path, new_module, frames):
+    recorded = record(new_module, str(tmp_path), frames)
+    log = PcanLog(str(tmp_path))
+    replayed = new_module()
+    assert replay(log, {0x1: replayed}, watchdog_period=None) == len(frames)
+    assert snapshot_values(replayed) == snapshot_values(recorded)
+
+    driver = new_module(pcan_basic=PCANBasicReplay(log, speed=0))
+    channel = driver.m_objPCANBasic.get_channel(PCAN_USBBUS1)
+    read = 0
+    while channel.pending is not None or channel.queue:
+        if driver.ReadMessage() == PCAN_ERROR_OK:
+            read += 1
+    assert read == len(frames)
+    assert snapshot_values(driver) == snapshot_values(recorded)
+    log.Close()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus exposition of PcanMetrics: families, cumulative histogram buckets, label values escaped
+
+@author: yvan
+"""
+
+import re
+
+from PCANmetrics import PcanMetrics
+
+SAMPLE = re.compile(r'^([a-z_]+)\{(.*)\} (\S+)$')
+LABEL = re.compile(r'([a-z_]+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    """
+    ({family: (type, help)}, [(family, sample name, {label: value}, value)]) of an exposition text
+    """
+    families = {}
+    samples = []
+    helps = {}
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            name, help_text = line[7:].split(' ', 1)
+            helps[name] = help_text
+        elif line.startswith('# TYPE '):
+            name, kind = line[7:].split(' ')
+            assert name in helps and name not in families, name  # HELP then TYPE, once
+            families[name] = (kind, helps[name])
+        else:
+            match = SAMPLE.match(line)
+            assert match, line
+            name, labels, value = match.groups()
+            family = name if name in families else re.sub('_(bucket|sum|count)$', '', name)
+            assert family in families, name
+            assert list(families)[-1] == family  # samples under their family
+            samples.append((family, name, dict(LABEL.findall(labels)), float(value)))
+    return families, samples
+
+
+def test_exposition(module, frames):
+    metrics = PcanMetrics()
+    module_metrics = metrics.Attach('A "front"\\port\n', module)
+    for number, (msg, timestamp) in enumerate(frames[:3000]):
+        module_metrics.Frame(msg.ID, 100 + 1000 * number)  # decode durations (ns) of the reader
+    for drained in (0, 3, 3, 700, 40000):
+        module_metrics.Drain(drained)
+    metrics.Callback('update', 0.1)
+    metrics.Callback('update', 0.1)
+    text = metrics.Exposition()
+    assert '{module="A \\"front\\"\\\\port\\n",channel="0x51"' in text
+    families, samples = parse(text)
+
+    assert families['spet_frames_total'] == ('counter', 'Received frames per CAN ID')
+    assert families['spet_callback_scheduled_seconds'][0] == 'gauge'
+    assert {kind for kind, help_text in families.values()} == {'counter', 'gauge', 'histogram'}
+    frame_counts = [value for family, name, labels, value in samples if family == 'spet_frames_total']
+    assert sum(frame_counts) == 3000
+    assert [labels['module'] for family, name, labels, value in samples if family == 'spet_frames_total'][0] == \
+        'A \\"front\\"\\\\port\\n'
+
+    histograms = [name for name, (kind, help_text) in families.items() if kind == 'histogram']
+    assert histograms == ['spet_decode_seconds', 'spet_drain_frames', 'spet_callback_lag_seconds']
+    for histogram in histograms:
+        buckets = [(labels['le'], value) for family, name, labels, value in samples if name == histogram + '_bucket']
+        counts = [value for family, name, labels, value in samples if name == histogram + '_count']
+        assert buckets and buckets[-1][0] == '+Inf' and counts == [buckets[-1][1]], histogram
+        bounds = [float(le) for le, value in buckets[:-1]]
+        assert bounds == sorted(bounds) and len(set(bounds)) == len(bounds), histogram
+        assert [value for le, value in buckets] == sorted(value for le, value in buckets), histogram
+        assert [name for family, name, labels, value in samples if family == histogram].count(histogram + '_sum') == 1
+    drains = {labels['le']: value for family, name, labels, value in samples if name == 'spet_drain_frames_bucket'}
+    assert (drains['0'], drains['4'], drains['1024'], drains['32768'], drains['+Inf']) == (1, 3, 4, 4, 5)
+    decoded = {labels['le']: value for family, name, labels, value in samples if name == 'spet_decode_seconds_bucket'}
+    assert (decoded[repr((2**10 - 1) / 1e9)], decoded[repr((2**22 - 1) / 1e9)], decoded['+Inf']) == (1, 3000, 3000)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive poll interval of the receive queues (PollSchedule): shorter under backlog, longer when idle, within its
+bounds, overruns counted
+
+@author: yvan
+"""
+
+import pytest
+
+from PCAN_RW import *
+from PCANsim import PCANBasicSim
+
+
+def test_interval_follows_backlog():
+    poll = PollSchedule(0.002, 0.1, target=256)
+    now = 100.0
+    assert poll.Drained(10, now) == 0.1  # first drain: no elapsed time
+    intervals = []
+    for _ in range(20):  # 25600 frames/s: the target read every 10 ms
+        now += poll.Interval
+        intervals.append(poll.Drained(round(25600 * poll.Interval), now))
+    assert intervals[0] == pytest.approx(0.01) and intervals[-1] == pytest.approx(0.01)
+
+    now += poll.Interval
+    assert poll.Drained(round(512000 * poll.Interval), now) == 0.002  # burst, 0.5 ms for the target: minimum
+    idle = []
+    while now < 110:
+        now += poll.Interval
+        idle.append(poll.Drained(0, now))
+    assert all(later <= 2 * earlier for earlier, later in zip(idle, idle[1:]))  # longer by a factor 2 at most
+    assert idle[0] == 0.004 and idle[-1] == 0.1 and poll.Rate < 256 / 0.1
+    assert all(0.002 <= interval <= 0.1 for interval in intervals + idle)
+    assert (poll.Peak, poll.Drains, poll.Overruns) == (5120, 22 + len(idle), 0)
+
+    assert poll.Drained(10, now + 0.1, overrun=True) == 0.002
+    assert poll.Overruns == 1
+    assert poll.Drained(10, now + 0.1) == 0.002  # no elapsed time: unchanged
+    assert poll.PeakFill() == 5120 / QUEUE_SIZE
+
+
+def test_module_overrun(new_module):
+    sim = PCANBasicSim(queue_size=100, seed=1)
+    clock = [0.0]
+    sim.clock = lambda: clock[0]
+    module = new_module(pcan_basic=sim)
+    clock[0] = 2.0  # about 500 messages due
+
+    frames = 0  # drain of PcanRW.ReaderLoop
+    overruns = module.Overruns
+    while True:
+        status = module.ReadMessage()
+        if status == PCAN_ERROR_OK:
+            frames += 1
+        elif not status & PCAN_ERROR_QOVERRUN:
+            break
+    module.Drained(frames, module.Overruns != overruns)
+    assert (frames, module.Overruns, module.Poll.Overruns) == (100, 1, 1)
+    assert module.Poll.Interval == POLL_BOUNDS[0] / 1000
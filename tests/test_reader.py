@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Receive event of the reader (PcanRW.WaitForMessages): registered again after each channel initialisation
+
+@author: yvan
+"""
+
+import os
+
+from PCANlib import *
+from PCANsim import PCANBasicSim, value_of
+
+
+class EventSim(PCANBasicSim):
+    """
+    Simulated driver giving a new descriptor (pipe) as PCAN_RECEIVE_EVENT after each initialisation, as the Linux
+    driver
+    """
+    def __init__(self, **kwargs):
+        PCANBasicSim.__init__(self, **kwargs)
+        self.pipes = []
+        self.events = {}
+
+    def Initialize(self, Channel, Btr0Btr1, *args):
+        self.events.pop(value_of(Channel), None)
+        return PCANBasicSim.Initialize(self, Channel, Btr0Btr1, *args)
+
+    def GetValue(self, Channel, Parameter):
+        if value_of(Parameter) == PCAN_RECEIVE_EVENT.value:
+            if value_of(Channel) not in self.events:
+                self.pipes.append(os.pipe())
+                self.events[value_of(Channel)] = self.pipes[-1][0]
+            return PCAN_ERROR_OK, self.events[value_of(Channel)]
+        return PCANBasicSim.GetValue(self, Channel, Parameter)
+
+    def close(self):
+        for read_fd, write_fd in self.pipes:
+            os.close(read_fd)
+            os.close(write_fd)
+
+
+def test_receive_event_after_initialisation(new_module):
+    sim = EventSim(seed=1)
+    module = new_module(pcan_basic=sim)
+    try:
+        assert module.PcanHandle.value == PCAN_USBBUS1.value  # set at the creation
+        assert not module.WaitForMessages(0.01)
+        first = module.ReceiveEvent
+        os.write(sim.pipes[0][1], b'\x01')
+        assert first == sim.pipes[0][0] and module.WaitForMessages(0.01)
+
+        module.UnsetDevice()
+        assert (module.ReceiveEvent, module.ReceiveEventHandle) == (None, None)
+        assert module.SetDevice(PCAN_USBBUS1) == 0  # same handle, new descriptor
+        assert not module.WaitForMessages(0.01)
+        assert len(sim.pipes) == 2 and module.ReceiveEvent == sim.pipes[1][0] != first
+        os.write(sim.pipes[1][1], b'\x01')
+        assert module.WaitForMessages(0.01)
+    finally:
+        module.StopReader()
+        sim.close()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+PcanRecorder segments: rotation order, retention of the newest segments, device identifiers on 32 bits
+
+@author: yvan
+"""
+
+import os
+
+from PCANlib import *
+from PCANrecorder import PcanRecorder, list_segments, read_segment, segment_sequence
+
+
+def record(new_module, directory, frames, **sizes):
+    """
+    Module A decoding frames with a recorder in directory, returns the module and the closed recorder
+    """
+    recorder = PcanRecorder(directory, **sizes)
+    module = new_module()
+    module.Recorder = recorder
+    for msg, timestamp in frames:
+        module.ProcessMessageCan(msg, timestamp)
+    recorder.Close()
+    return module, recorder
+
+
+def test_rotation_keeps_order(tmp_path, new_module, frames):
+    module, recorder = record(new_module, str(tmp_path), frames, segment_size=64 * 1024, retention_size=0)
+    segments = list_segments(str(tmp_path))
+    sequences = [segment_sequence(os.path.basename(path)) for path in segments]
+    assert len(segments) == -(-len(frames) // recorder.RecordsPerSegment)  # the unused next segment deleted
+    assert sequences == sorted(set(sequences))
+    assert sequences[-1] - len(sequences) <= recorder.LateSegments  # segment prepared too late discarded
+    records = [record for path in segments for record in read_segment(path)]
+    assert recorder.RecordsNumber == len(records) == len(frames)
+    for (msg, timestamp), (micros, can_id, device_id, dlc, msgtype, datas) in zip(frames, records):
+        assert (can_id, device_id, datas) == (msg.ID, 0x1, bytes(msg.DATA))
+
+
+def test_retention_deletes_oldest(tmp_path, new_module, frames):
+    module, recorder = record(new_module, str(tmp_path), frames, segment_size=64 * 1024, retention_size=256 * 1024)
+    segments = list_segments(str(tmp_path))
+    assert recorder.DeletedSegments > 0
+    assert sum(os.path.getsize(path) for path in segments[:-1]) <= 256 * 1024
+    records = [record for path in segments for record in read_segment(path)]
+    assert [record[1] for record in records] == [msg.ID for msg, timestamp in frames[-len(records):]]
+
+
+def test_device_id_beyond_one_byte(tmp_path):
+    recorder = PcanRecorder(str(tmp_path))
+    for device_id in (0x1, 0x123, 0xFFFFFFFF):
+        recorder.Record(1000 + device_id, device_id, 0x100, 8, PCAN_MESSAGE_STANDARD.value, bytes(range(8)))
+    recorder.Close()
+    records = [record for path in list_segments(str(tmp_path)) for record in read_segment(path)]
+    assert [record[2] for record in records] == [0x1, 0x123, 0xFFFFFFFF]
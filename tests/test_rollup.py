@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+PcanRollups folding: the buckets of each resolution against the min, max, mean and count of the raw samples
+
+@author: yvan
+"""
+
+import math
+import random
+
+import numpy as np
+
+from PCANrollup import PcanRollups, RESOLUTIONS
+
+
+def expected_buckets(samples, resolution):
+    """
+    {bucket start: values} of the (time, value) samples
+    """
+    buckets = {}
+    for t, value in samples:
+        buckets.setdefault(math.floor(t / resolution) * resolution, []).append(value)
+    return buckets
+
+
+def test_rollup_levels_fold_samples(module, send):
+    module.Rollups = PcanRollups()
+    rng = random.Random(3)
+    samples = []
+    t = 1000.0
+    while t < 1000.0 + 400:
+        datas = bytes([rng.getrandbits(8) for _ in range(8)])
+        send(module, 0x100, datas, t)
+        samples.append((module.ReceivedTimestamp, datas[1] / 2))  # BAT_SOC
+        t += rng.uniform(0.05, 0.6)
+
+    for level, (resolution, kept) in enumerate(RESOLUTIONS):
+        times, mins, maxs, means, counts = module.Rollups.Rollup('BAT_SOC', level=level)
+        buckets = expected_buckets(samples, resolution)
+        assert list(times) == sorted(buckets), level
+        assert list(counts) == [len(buckets[start]) for start in sorted(buckets)], level
+        assert np.allclose(mins, [min(buckets[start]) for start in sorted(buckets)], rtol=1e-6)
+        assert np.allclose(maxs, [max(buckets[start]) for start in sorted(buckets)], rtol=1e-6)
+        assert np.allclose(means, [np.mean(buckets[start]) for start in sorted(buckets)], rtol=1e-5)
+
+
+def test_rollup_window_and_select(module, send):
+    module.Rollups = PcanRollups()
+    for second in range(600):
+        send(module, 0x101, bytes([0, 2 * (second % 100), 0, 0, 0, 0, 0, 0]), 2000.0 + second)  # BAT_SOH
+
+    times, mins, maxs, means, counts = module.Rollups.Rollup('BAT_SOH', 2100.0, 2200.0, level=0)
+    assert list(times) == [2100.0 + second for second in range(100)]
+    assert list(means) == [float(second) for second in range(100)]
+    assert module.Rollups.Select('BAT_SOH', 2000.0, 2600.0, max_points=100) == 1  # 60 buckets of 10 s
+    assert module.Rollups.Select('BAT_SOH', 2000.0, 2600.0, max_points=1000) == 0
+    empty = module.Rollups.Rollup('BAT_VOLTAGE_UNKNOWN')
+    assert all(len(array) == 0 for array in empty)
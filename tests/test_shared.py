@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+PCANshared: SharedBlock sequence lock (consistent copies of the decoded values), SharedLayout texts and restart of
+the stopped acquisition processes of PcanSharedModules
+
+@author: yvan
+"""
+
+import time
+
+from PCAN_RW import STATE
+from PCANshared import HEADER, TEXT_SIZE, PcanSharedModules, SharedBlock, SharedLayout
+from PCANsim import PCANBasicSim
+
+
+def values(snapshot):
+    return snapshot.Integers.tobytes(), snapshot.Floats.tobytes(), {name: getattr(snapshot, name)
+                                                                   for name in STATE.Texts}
+
+
+def decoded_module(new_module, frames):
+    module = new_module()
+    for msg, timestamp in frames[:5000]:
+        module.ProcessMessageCan(msg, timestamp)
+    module.UpdateStatus()
+    return module
+
+
+def test_write_read_snapshot(new_module, frames):
+    module = decoded_module(new_module, frames)
+    layout = SharedLayout()
+    block = SharedBlock(layout)
+    reader = SharedBlock(layout, block.Name)  # mapped as in the user interface process
+    try:
+        assert reader.Read() is None  # nothing published
+        block.Write(module)
+        snapshot, writes, written = reader.Read()
+        assert writes == 1 and abs(written - time.time()) < 10
+        assert values(snapshot) == values(module.Snapshot())
+        assert snapshot.BAT_SOC == module.BAT_SOC and snapshot.MPPT_W[4] == module.MPPT_W[4]
+    finally:
+        reader.Close()
+        block.Close()
+
+
+def test_read_during_write(new_module, frames):
+    module = decoded_module(new_module, frames)
+    layout = SharedLayout()
+    block = SharedBlock(layout)
+    reader = SharedBlock(layout, block.Name)
+    try:
+        block.Write(module)
+        published = reader.Read()
+        sequence, writes, written = HEADER.unpack_from(block.Buffer, 0)
+        HEADER.pack_into(block.Buffer, 0, sequence + 1, writes, time.time())  # writer stopped while writing
+        block.Buffer[HEADER.size:block.Size] = bytes(layout.Size)
+        assert reader.Read(retries=10) is published  # last consistent copy
+        assert SharedBlock(layout, block.Name).Read(retries=10) is None
+
+        restarted = SharedBlock(layout, block.Name)  # writer of a restarted process
+        assert restarted.Sequence == sequence + 2
+        restarted.Write(module)
+        assert values(reader.Read()[0]) == values(published[0])
+        restarted.Close()
+    finally:
+        reader.Close()
+        block.Close()
+
+
+def test_texts_truncated(new_module):
+    module = new_module()
+    layout = SharedLayout()
+    name = layout.Texts[0]
+    setattr(module, name, 'a' + 'é' * 60)  # 121 bytes, the last é cut in the middle
+    block = SharedBlock(layout)
+    try:
+        block.Write(module)
+        assert getattr(block.Read()[0], name) == 'a' + 'é' * ((TEXT_SIZE - 1) // 2)
+    finally:
+        block.Close()
+
+
+def wait(condition, timeout=30):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end
+        time.sleep(0.05)
+
+
+def test_process_restarted():
+    modules = PcanSharedModules([('A', 0x1)], PCANBasicSim, period=0.02)
+    try:
+        modules.Start(time.time())
+        wait(lambda: modules.Ages(time.time())[0] is not None)
+        first = modules.Processes[0]
+        modules.Process(time.time())
+        assert modules.Restarts == 0 and modules.Processes[0] is first
+
+        first.kill()
+        first.join(10)
+        writes = HEADER.unpack_from(modules.Blocks[0].Buffer, 0)[1]
+        modules.Process(time.time())
+        assert modules.Restarts == 1 and modules.Processes[0] is not first
+        wait(lambda: HEADER.unpack_from(modules.Blocks[0].Buffer, 0)[1] > writes)  # same block published
+        wait(lambda: modules.Snapshots()[0].BAT_VOLTAGE > 0)
+    finally:
+        modules.Stop()
+    assert not modules.Processes[0].is_alive()
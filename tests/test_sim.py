@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+PCANBasicSim traffic: message rates, drive bursts, injected faults and receive queue overrun
+
+@author: yvan
+"""
+
+from collections import Counter
+
+from PCAN_RW import *
+from PCANsim import PCANBasicSim, SimFault
+
+
+def stepped(**kwargs):
+    """
+    Simulation of PCAN_USBBUS1 initialised, clock [s] moved by the test
+    """
+    sim = PCANBasicSim(seed=1, **kwargs)
+    clock = [0.0]
+    sim.clock = lambda: clock[0]
+    sim.Initialize(PCAN_USBBUS1, PCAN_BAUD_250K)
+    return sim, clock
+
+
+def read_all(sim):
+    """
+    (status list, [(bus time s, CAN ID, datas)]) of the receive queue read until empty
+    """
+    statuses, frames = [], []
+    status, msg, timestamp = sim.Read(PCAN_USBBUS1)
+    while status != PCAN_ERROR_QRCVEMPTY:
+        statuses.append(status)
+        if status == PCAN_ERROR_OK:
+            seconds = (timestamp.millis_overflow * 2**32 + timestamp.millis) / 1000 + timestamp.micros / 1000000
+            frames.append((seconds, msg.ID, bytes(msg.DATA)))
+        status, msg, timestamp = sim.Read(PCAN_USBBUS1)
+    return statuses, frames
+
+
+def run(sim, clock, seconds, step=0.1):
+    frames = []
+    for _ in range(round(seconds / step)):
+        clock[0] += step
+        frames += read_all(sim)[1]
+    return frames
+
+
+def test_rates():
+    for rate in (1, 4):
+        sim, clock = stepped(rate=rate, mppt_units=3)
+        counts = Counter(can_id for t, can_id, datas in run(sim, clock, 10))
+        for can_id, period in ((0x100, sim.BAT_PERIOD), (MPPT_FIRST_ID + 8, sim.MPPT_PERIOD),
+                               (0x1AC, sim.DRIVE_PERIOD)):
+            expected = 10 * rate / period  # first emission within a nominal period
+            assert expected - rate - 1 <= counts[can_id] <= expected + 1, (rate, hex(can_id), counts[can_id])
+        assert MPPT_FIRST_ID + 9 not in counts  # 3 converters only
+
+
+def test_time_order_and_decoding(new_module):
+    sim, clock = stepped()
+    frames = run(sim, clock, 5)
+    times = [t for t, can_id, datas in frames]
+    assert times == sorted(times) and 0 <= times[0] and times[-1] <= 5
+    module = new_module()
+    msg = TPCANMsg()
+    for t, can_id, datas in frames:
+        msg.ID, msg.LEN, msg.MSGTYPE = can_id, 8, PCAN_MESSAGE_STANDARD.value
+        msg.DATA[:] = datas
+        module.ProcessMessageCan(msg, TPCANTimestamp())
+    assert 360 < module.BAT_VOLTAGE < 420 and 80 < module.BAT_SOC <= 90
+    assert module.BMS_OK and module.BMS_DISCHARGE and (module.BAT_ACTIVE_ERR, module.DRIVE_ERR) == (0, 0)
+
+
+def test_bursts():
+    sim, clock = stepped(burst_period=10, burst_length=2, burst_factor=10)
+    frames = run(sim, clock, 10)
+    in_burst = Counter(can_id for t, can_id, datas in frames if t < 2)
+    out_burst = Counter(can_id for t, can_id, datas in frames if 2 <= t < 10)
+    assert 2 * 10 / sim.DRIVE_PERIOD - 10 <= in_burst[0x1AC] <= 2 * 10 / sim.DRIVE_PERIOD
+    assert abs(out_burst[0x1AC] - 8 / sim.DRIVE_PERIOD) <= 1
+    assert abs(in_burst[0x100] / 2 - out_burst[0x100] / 8) <= 1  # battery messages not concerned
+
+
+def test_faults():
+    faults = [SimFault('bat_error', start=2, duration=2, value=13), SimFault('mppt_error', start=1, value=0x10, unit=2),
+              SimFault('silence', start=3, duration=1, ids=[0x1AE]), SimFault('drive_error', value=0x4, device=0x2),
+              SimFault('unplug', start=6)]
+    sim, clock = stepped(faults=faults, mppt_units=3)
+    frames = run(sim, clock, 5)
+
+    def values(can_id, first, end):
+        return {datas for t, i, datas in frames if i == can_id and first <= t < end}
+    assert {datas[2] for datas in values(0x100, 0, 2) | values(0x100, 4, 5)} == {0}
+    assert {datas[2] for datas in values(0x100, 2, 4)} == {13}
+    assert {int.from_bytes(datas[:4], 'big') for datas in values(0x105, 2, 4)} == {1 << 12}
+    assert {int.from_bytes(datas[:4], 'big') for datas in values(MPPT_FIRST_ID + 6, 1, 5)} == {0x10}
+    assert {int.from_bytes(datas[:4], 'big') for datas in values(MPPT_FIRST_ID + 3, 1, 5)} == {0}
+    assert not values(0x1AE, 3, 4) and values(0x1AE, 4, 5)
+    assert {int.from_bytes(datas[:4], 'big') for datas in values(0x1AA, 0, 5)} == {0}  # device 0x2 only
+
+    clock[0] = 6.5
+    assert sim.Read(PCAN_USBBUS1)[0] == PCAN_ERROR_ILLHW
+    assert sim.GetValue(PCAN_USBBUS1, PCAN_DEVICE_ID)[0] == PCAN_ERROR_ILLHW
+
+
+def test_queue_overrun():
+    sim, clock = stepped(queue_size=100)
+    clock[0] = 1.0  # about 250 messages due
+    statuses, frames = read_all(sim)
+    channel = sim.get_channel(PCAN_USBBUS1)
+    assert statuses[0] == PCAN_ERROR_QOVERRUN and statuses.count(PCAN_ERROR_QOVERRUN) == 1
+    assert len(frames) == 100 and channel.lost == channel.generated - 100 > 0
+    assert frames[-1][0] < 0.5  # the older messages kept, the next ones lost
+
+    clock[0] = 1.05
+    statuses, frames = read_all(sim)
+    assert PCAN_ERROR_QOVERRUN not in statuses and frames and frames[0][0] >= 1.0
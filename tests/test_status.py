@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Status texts and colors: the tables of PCAN_RW.py against the former if/elif ladders, statuses evaluated again only
+when their inputs changed (StatusDirty bits of UpdateStatus)
+
+@author: yvan
+"""
+
+import random
+
+from PCAN_RW import *
+
+LECLANCHE_LADDER = {0: '', 1: 'Cell voltage below limit', 2: 'Cell voltage above limit',
+                    3: 'Discharge current above limit', 4: 'Charge current above limit',
+                    5: 'Module temperature below limit', 6: 'Module temperature above limit',
+                    7: 'Cell Voltage Difference', 8: 'Module Temperature Difference',
+                    9: 'Cell Voltage Sum / Stack Voltage Difference', 10: 'Sensor Fault', 11: 'Precharge timeout',
+                    12: 'Contactor Fault', 13: 'Isolation Fault', 15: 'Watchdog Reset Activated',
+                    16: 'Emergency Stop Active', 17: 'BMU Communication Timeout', 19: 'FW Initialization Error',
+                    20: 'Input alarm activated (Requires GPIO Configuration)', 25: 'CAN Host Timeout',
+                    31: 'Software Error', 32: 'CAN SOFTWARE WATCHDOG'}
+
+
+def leclanche_ladder(code):
+    return LECLANCHE_LADDER[code] if code in LECLANCHE_LADDER else 'Unknow Error/Warning code'
+
+
+def bits_ladder(code, kind):
+    """
+    Former Mppt/Drive Err/Warn tables: bit 31 first, then bits 9 to 1, bits 10 to 30 unknown
+    """
+    if code & 0x80000000 != 0:
+        return 'CAN SOFTWARE WATCHDOG' if kind == 'error' else 'warning 32'
+    for bit in range(9, 0, -1):
+        if code & 1 << (bit - 1) != 0:
+            return kind + ' ' + str(bit)
+    return 'Unknow Error code' if kind == 'error' else 'Unknow Warning code'
+
+
+def leclanche_info_ladder(module):
+    text = ''
+    if module.BMS_OK > 0:
+        text = 'BMS OK'
+    if module.BMS_IDLE > 0:
+        text = text + ', BMS IDLE'
+    if module.BAT_FULL > 0:
+        text = text + ', BAT FULL'
+    if module.BAT_STATE_CHARGING > 0:
+        text = text + ', CHARGING'
+    if module.BAT_STATE_DISCHARGING > 0:
+        text = text + ', DISCHARGING'
+    if module.BAT_STATE_BALANCING > 0:
+        text = text + ', BALANCING'
+    return text
+
+
+def test_code_tables_match_ladders(module):
+    codes = [0, 0x80000000, 0xFFFFFFFF, 0x80000200, 0x200, 0x201, 0x40000000, 0x1FF]
+    codes += [1 << bit for bit in range(32)] + [(1 << bit) | 1 for bit in range(32)]
+    codes += [random.Random(1).getrandbits(32) for _ in range(1000)]
+    for code in codes:
+        assert module.Mppt_Err_table(code) == module.Drive_Err_table(code) == bits_ladder(code, 'error'), hex(code)
+        assert module.Mppt_Warn_table(code) == module.Drive_Warn_table(code) == bits_ladder(code, 'warning'), \
+            hex(code)
+    for code in range(-1, 260):
+        assert module.Leclanche_Err_Warn_table(code) == leclanche_ladder(code), code
+
+
+def test_leclanche_status_matches_ladder(module):
+    rng = random.Random(2)
+    names = ('BMS_OK', 'BMS_IDLE', 'BAT_FULL', 'BAT_STATE_CHARGING', 'BAT_STATE_DISCHARGING', 'BAT_STATE_BALANCING')
+    for _ in range(3000):
+        error, warning = rng.choice([0, 0, 0, 1, 14, 32, 40]), rng.choice([0, 0, 2, 25, 33])
+        soh = rng.choice([70.0, 79.5, 80.0, 81.0, 82.0, 90.0])
+        module.BAT_ACTIVE_ERR, module.BAT_ACTIVE_WARN, module.BAT_SOH = error, warning, soh
+        for name in names:
+            setattr(module, name, rng.choice([0, 0, 1, 8]))
+        module.LeclancheStatus()
+        if error != 0 or soh < 80:
+            expected = (leclanche_ladder(error) + (' State Of Health < 80%' if soh < 80 else ''), 'RED')
+        elif warning != 0 or soh < 82:
+            expected = (leclanche_ladder(warning) + (' State Of Health < 82%' if soh < 82 else ''), 'ORANGE')
+        else:
+            expected = (leclanche_info_ladder(module), 'GREEN')
+        assert (module.BAT_STATUS_TEXT, module.BAT_STATUS_COLOR) == expected
+
+
+def test_mppt_and_drive_status(module):
+    module.MPPT_ERR[0] = 0  # watchdog error bit of the Init values
+    module.DRIVE_ERR = 0
+    module.UpdateStatus()
+    assert (module.MPPT_STATUS_TEXT, module.MPPT_STATUS_COLOR) == ('MPPT OK', 'GREEN')
+    assert (module.DRIVE_STATUS_TEXT, module.DRIVE_STATUS_COLOR) == ('DRIVE OK', 'GREEN')
+    module.MPPT_WARN[3], module.MPPT_WARN[7] = 0x2, 0x400
+    module.MpptStatus()
+    assert (module.MPPT_STATUS_TEXT, module.MPPT_STATUS_COLOR) == ('Unknow Warning code', 'ORANGE')  # max: 0x400
+    module.MPPT_ERR[5] = 0x80000001
+    module.MpptStatus()
+    assert (module.MPPT_STATUS_TEXT, module.MPPT_STATUS_COLOR) == ('CAN SOFTWARE WATCHDOG', 'RED')
+    module.DRIVE_WARN = 0x30
+    module.DriveStatus()
+    assert (module.DRIVE_STATUS_TEXT, module.DRIVE_STATUS_COLOR) == ('warning 6', 'ORANGE')
+
+
+def test_only_changed_statuses_evaluated(module, send):
+    evaluated = []
+    for status in ('LeclancheStatus', 'MpptStatus', 'DriveStatus'):
+        setattr(module, status, lambda status=status: evaluated.append(status))
+    module.UpdateStatus()
+    assert sorted(evaluated) == ['DriveStatus', 'LeclancheStatus', 'MpptStatus']  # Init values
+    del evaluated[:]
+    module.UpdateStatus()
+    assert evaluated == [] and module.StatusDirty == 0
+
+    error = bytes([0, 0, 0, 0x10, 0, 0, 0, 0])
+    send(module, MPPT_FIRST_ID + 3 * 2, error, 1.0)
+    module.UpdateStatus()
+    assert evaluated == ['MpptStatus']
+    send(module, MPPT_FIRST_ID + 3 * 2, error, 1.1)  # same flags
+    send(module, MPPT_FIRST_ID + 3 * 2 + 1, bytes(range(8)), 1.1)  # no status input
+    send(module, 0x1AE, bytes(range(8)), 1.1)
+    send(module, 0x300, bytes(8), 1.1)  # not decoded
+    module.UpdateStatus()
+    assert evaluated == ['MpptStatus']
+
+    send(module, 0x1AA, bytes([0, 0, 0, 0, 0, 0, 0, 0x08]), 1.2)
+    send(module, 0x101, bytes([0, 2 * 90, 0x01, 0, 0, 0, 0, 0]), 1.2)
+    module.UpdateStatus()
+    module.UpdateStatus()
+    assert evaluated == ['MpptStatus', 'LeclancheStatus', 'DriveStatus']
+
+    module.CheckWatchdogs(5.0)  # stale messages reset
+    module.UpdateStatus()
+    assert sorted(evaluated[3:]) == ['DriveStatus', 'LeclancheStatus', 'MpptStatus']
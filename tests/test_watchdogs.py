@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Staleness of the decoded messages (PcanRW.CheckWatchdogs): values reset, watchdog flags and error bits
+
+@author: yvan
+"""
+
+from PCAN_RW import *
+
+DATAS = bytes([0x01, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])  # non-zero values, no watchdog error bit
+
+
+def send_all(send, module, seconds, skipped=()):
+    """
+    All the decoded messages received at seconds, except the skipped CAN IDs
+    """
+    for can_id in sorted(FRAME_LAYOUTS):
+        if can_id not in skipped:
+            send(module, can_id, DATAS, seconds)
+
+
+def test_stale_message_reset(module, send):
+    send_all(send, module, 1000.0)
+    assert module.CheckWatchdogs(1000.1) == []
+    assert (module.BAT_WATCHDOG_FLAG, module.MPPT_WATCHDOG_FLAG, module.DRIVE_WATCHDOG_FLAG) == (0, 0, 0)
+    assert module.DRIVE_WATCHDOG == 0x1FF and not module.DRIVE_ERR & 0x80000000
+    current = module.DRIVE_MOTOR_CURRENT_U
+
+    send_all(send, module, 1000.2, skipped=(0x1AC,))  # drive currents stale 250 ms after 1000.0
+    assert module.CheckWatchdogs(1000.4) == [0x1AC]
+    assert module.DRIVE_WATCHDOG_FLAG == 1 and module.DRIVE_ERR & 0x80000000
+    assert module.DRIVE_WATCHDOG == 0x1FF & ~0x04
+    assert module.DRIVE_MOTOR_CURRENT_U == STATE.Initial('DRIVE_MOTOR_CURRENT_U') != current
+    assert module.DRIVE_MOTOR_POSITION == 2.56  # other messages kept
+    assert (module.BAT_WATCHDOG_FLAG, module.MPPT_WATCHDOG_FLAG) == (0, 0)
+
+    send(module, 0x1AC, DATAS, 1000.41)
+    assert module.CheckWatchdogs(1000.42) == []
+    assert module.DRIVE_WATCHDOG_FLAG == 0 and not module.DRIVE_ERR & 0x80000000
+    assert module.DRIVE_MOTOR_CURRENT_U == current
+
+
+def test_absent_mppt_not_stale(module, send):
+    send_all(send, module, 1000.0, skipped=range(MPPT_FIRST_ID + 3 * module.MPPT_NOMBRE,
+                                                 MPPT_FIRST_ID + 3 * MPPT_UNITS))
+    assert module.CheckWatchdogs(1000.1) == []
+    assert module.CheckWatchdogs(1002.0) == sorted(can_id for can_id in FRAME_LAYOUTS
+                                                   if FRAME_LAYOUTS[can_id].unit is None
+                                                   or FRAME_LAYOUTS[can_id].unit < module.MPPT_NOMBRE)
+    assert (module.BAT_WATCHDOG_FLAG, module.MPPT_WATCHDOG_FLAG, module.DRIVE_WATCHDOG_FLAG) == (1, 1, 1)